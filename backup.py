@@ -0,0 +1,148 @@
+import os
+import re
+import gzip
+import json
+import time
+import queue
+import hashlib
+import threading
+
+from firmware import data_dir
+
+# بعض الأجهزة تسمي القسم SEC_EFS، و"EFS" في الخيارات يعني أيهما وُجد
+EFS_PARTITIONS = ("EFS", "SEC_EFS")
+BACKUP_CHUNK_SIZE = 1024 * 1024
+BACKUP_QUEUE_CHUNKS = 8  # أقصى ما ينتظر الضغط في الذاكرة: 8 MiB لكل قسم
+BACKUP_COMPRESS_LEVEL = 6
+
+
+class BackupError(Exception):
+    pass
+
+
+class BackupWriter:
+    def __init__(self, store, name):
+        # القراءة من USB في خيط والضغط وحساب البصمة في خيط آخر، بينهما طابور محدود
+        self.store = store
+        self.name = name
+        self.queue = queue.Queue(BACKUP_QUEUE_CHUNKS)
+        self.pending = bytearray()
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.error = None
+        os.makedirs(store.objects, exist_ok=True)
+        self.temp_path = os.path.join(store.objects, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def run(self):
+        finished = False
+        try:
+            with open(self.temp_path, "wb") as raw, gzip.GzipFile("", "wb", BACKUP_COMPRESS_LEVEL, raw, mtime=0) as target:
+                while not finished:
+                    data = self.queue.get()
+                    if data is None:
+                        finished = True
+                        continue
+                    self.digest.update(data)
+                    target.write(data)
+        except OSError as e:
+            self.error = e
+            # نستمر في تفريغ الطابور حتى لا يبقى خيط القراءة معلقاً عند put
+            while not finished and self.queue.get() is not None:
+                pass
+    
+    def write(self, data):
+        self.size += len(data)
+        self.pending += data
+        if len(self.pending) >= BACKUP_CHUNK_SIZE:
+            self.queue.put(bytes(self.pending))
+            self.pending.clear()
+    
+    def close(self):
+        if self.pending:
+            self.queue.put(bytes(self.pending))
+            self.pending.clear()
+        self.queue.put(None)
+        self.thread.join()
+    
+    def finish(self):
+        self.close()
+        if self.error is not None:
+            self.remove_temp()
+            raise BackupError(f"cannot write the {self.name} backup: {self.error}")
+        digest = self.digest.hexdigest()
+        path = self.store.object_path(digest)
+        if os.path.exists(path):
+            # صورة مطابقة محفوظة من قبل (من هذا الجهاز أو غيره)، فلا نكررها
+            self.remove_temp()
+            return digest, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self.temp_path, path)
+        return digest, True
+    
+    def abort(self):
+        self.close()
+        self.remove_temp()
+    
+    def remove_temp(self):
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+
+class BackupStore:
+    def __init__(self, directory=None):
+        # objects/ يحفظ كل صورة مرة واحدة باسم بصمتها، وdevices/ يحفظ ما أُخذ من كل جهاز في كل نسخة
+        self.directory = directory or os.path.join(data_dir(), "backups")
+        self.objects = os.path.join(self.directory, "objects")
+        self.devices = os.path.join(self.directory, "devices")
+    
+    def object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], f"{digest}.img.gz")
+    
+    def writer(self, name):
+        return BackupWriter(self, name)
+    
+    def save_manifest(self, device_id, job_id, partitions):
+        # partitions: اسم القسم -> {"sha256"، "size"}
+        directory = os.path.join(self.devices, re.sub(r"[^\w.-]+", "_", device_id).strip("_") or "unknown")
+        os.makedirs(directory, exist_ok=True)
+        manifest = {
+            "device": device_id,
+            "job_id": job_id,
+            "time": round(time.time(), 3),
+            "partitions": {
+                name: dict(entry, file=os.path.relpath(self.object_path(entry["sha256"]), self.directory))
+                for name, entry in partitions.items()
+            },
+        }
+        path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{job_id}.json")
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(temp_path, path)
+        return path
+
+
+def backup_targets(entries, names):
+    # أسماء الأقسام المطلوبة -> مداخل PIT، مع EFS بمعنى أي قسم من EFS_PARTITIONS
+    targets = []
+    for name in names:
+        wanted = EFS_PARTITIONS if name.upper() == "EFS" else (name.upper(),)
+        matched = [entry for entry in entries if entry.partition_name.upper() in wanted]
+        if not matched:
+            raise BackupError(f"no {name} partition in the device PIT")
+        targets.extend(entry for entry in matched if entry not in targets)
+    return targets
+
+
+backup_store = None
+
+
+def get_backup_store():
+    global backup_store
+    if backup_store is None:
+        backup_store = BackupStore()
+    return backup_store
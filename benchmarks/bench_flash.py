@@ -0,0 +1,223 @@
+# قياس الحمل الإضافي للأداة نفسها أثناء التفليش باستخدام محاكي Odin بدلاً من جهاز حقيقي.
+#   python benchmarks/bench_flash.py --devices 1,4 --sizes 64M,256M --compare benchmarks/baseline.json
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_odin import parse_size  # noqa: E402
+
+FAKE_ODIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_odin.py")
+SMALL_SLOTS = (("BL File", "BL", 8 * 1024 ** 2), ("CP File", "CP", 32 * 1024 ** 2), ("CSC File", "CSC", 16 * 1024 ** 2))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="End-to-end flash overhead benchmark with a simulated odin")
+    parser.add_argument("--devices", default="1,4", help="comma separated device counts")
+    parser.add_argument("--sizes", default="64M,256M", help="comma separated AP sizes")
+    parser.add_argument("--rate", type=parse_size, default=parse_size("400M"), help="simulated transfer rate per device")
+    parser.add_argument("--handshake", type=float, default=0.2, help="simulated handshake seconds per odin session")
+    parser.add_argument("--fail-probability", type=float, default=0.0, help="chance that a simulated session fails")
+    parser.add_argument("--mode", choices=("session", "per-file", "both"), default="both")
+    parser.add_argument("--backend", choices=("odin", "native"), default="odin",
+                        help="odin runs fake_odin per session, native runs the download protocol against a simulated device")
+    parser.add_argument("--gui", action="store_true", help="run through the Qt farm and measure event-loop latency")
+    parser.add_argument("--compare", metavar="BASELINE", help="fail when results regress against this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression ratio when comparing")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the results as a new baseline")
+    return parser
+
+
+def create_firmware(directory, ap_size):
+    # ملفات متفرقة (sparse) بالحجم المطلوب بدون كتابة البيانات فعلياً على القرص
+    files = []
+    for label, prefix, size in SMALL_SLOTS[:1] + (("AP File", "AP", ap_size),) + SMALL_SLOTS[1:]:
+        file_path = os.path.join(directory, f"{prefix}_bench_{ap_size}.bin")
+        if not os.path.exists(file_path):
+            with open(file_path, "wb") as f:
+                f.truncate(size)
+        files.append((label, file_path))
+    return files
+
+
+def odin_command(args):
+    return [sys.executable, FAKE_ODIN, "--fake-rate", str(args.rate), "--fake-handshake", str(args.handshake),
+            "--fake-reboot", "0", "--fake-fail-probability", str(args.fail_probability)]
+
+
+def ideal_seconds(args, files, single_session):
+    # جلسة واحدة، أو جلسة لكل ملف بالإضافة إلى جلسة إعادة التشغيل
+    sessions = 1 if single_session else len(files) + 1
+    transfer = sum(os.path.getsize(file_path) for _, file_path in files) / args.rate
+    return transfer + sessions * args.handshake
+
+
+def simulated_device(args, files):
+    from protocol import SimulatedDevice
+    # كل ملف في الاختبار صورة واحدة، فنعطي الجهاز المحاكي قسماً باسمه
+    partitions = [(label.split()[0], os.path.basename(file_path), 0) for label, file_path in files]
+    return SimulatedDevice(partitions, rate=args.rate, keep_data=False, handshake=args.handshake)
+
+
+def run_headless(args, files, devices, single_session):
+    from engine import FlashEngine
+    
+    async def flash(index):
+        engine = FlashEngine()
+        engine.odin_path = odin_command(args)
+        if args.backend == "native":
+            engine.backend = "native"
+            engine.transport_factory = lambda com_port: simulated_device(args, files)
+        engine.configure(f"/dev/fake{index}", files, True, False, single_session, False)
+        return (await engine.run_async())[0]
+    
+    async def flash_all():
+        return await asyncio.gather(*(flash(index) for index in range(devices)))
+    
+    start = time.perf_counter()
+    results = asyncio.run(flash_all())
+    return time.perf_counter() - start, results, None
+
+
+def run_gui(args, files, devices, single_session):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtCore import QTimer, QElapsedTimer
+    from PyQt5.QtWidgets import QApplication
+    from engine import FlashJob
+    import gui
+    
+    app = QApplication.instance() or QApplication([sys.argv[0]])
+    farm = gui.FlashFarm(None, devices)
+    jobs = [FlashJob(f"/dev/fake{index}", f"fake{index}", files, True, False, single_session, False) for index in range(devices)]
+    
+    # التأخير في حلقة أحداث Qt: الفرق بين الموعد المتوقع للمؤقت والموعد الفعلي
+    interval = 5
+    latencies = []
+    clock = QElapsedTimer()
+    ticker = QTimer()
+    ticker.setInterval(interval)
+    
+    def on_tick():
+        latencies.append(max(clock.restart() - interval, 0))
+    
+    ticker.timeout.connect(on_tick)
+    farm.all_finished.connect(lambda _: app.quit())
+    
+    farm.odin_path = odin_command(args)
+    start = time.perf_counter()
+    clock.start()
+    ticker.start()
+    farm.submit(jobs)
+    app.exec_()
+    ticker.stop()
+    elapsed = time.perf_counter() - start
+    
+    latencies.sort()
+    latency = {
+        "event_loop_p95_ms": latencies[int(len(latencies) * 0.95)] if latencies else 0,
+        "event_loop_max_ms": latencies[-1] if latencies else 0,
+    }
+    return elapsed, [job.success for job in jobs], latency
+
+
+def enumeration_ms(runs=20):
+    try:
+        from devices import list_devices
+        list_devices()
+    except ImportError:
+        return None
+    start = time.perf_counter()
+    for _ in range(runs):
+        list_devices()
+    return (time.perf_counter() - start) * 1000 / runs
+
+
+def peak_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def run_scenarios(args, directory):
+    modes = {"session": [True], "per-file": [False], "both": [True, False]}[args.mode]
+    if args.backend == "native":
+        # البروتوكول المباشر يرسل كل الملفات في جلسة واحدة دائماً
+        modes = [True]
+    runner = run_gui if args.gui else run_headless
+    results = {}
+    for size in args.sizes.split(","):
+        files = create_firmware(directory, parse_size(size))
+        for devices in (int(count) for count in args.devices.split(",")):
+            for single_session in modes:
+                mode = "native" if args.backend == "native" else "session" if single_session else "per-file"
+                name = f"{mode}/{devices}dev/{size}"
+                elapsed, outcomes, latency = runner(args, files, devices, single_session)
+                ideal = ideal_seconds(args, files, single_session)
+                result = {
+                    "wall_s": round(elapsed, 3),
+                    "ideal_s": round(ideal, 3),
+                    "overhead_per_partition_ms": round((elapsed - ideal) * 1000 / len(files), 1),
+                    "succeeded": sum(1 for outcome in outcomes if outcome),
+                    "failed": sum(1 for outcome in outcomes if not outcome),
+                    "peak_rss_mb": round(peak_rss_mb(), 1),
+                }
+                if latency:
+                    result.update(latency)
+                results[name] = result
+                print(json.dumps({"scenario": name, **result}), flush=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for key in ("wall_s", "overhead_per_partition_ms", "event_loop_p95_ms"):
+            if key not in previous or key not in result:
+                continue
+            # هامش ثابت صغير حتى لا تفشل المقارنة بسبب تذبذب القيم القريبة من الصفر
+            allowed = previous[key] * (1 + tolerance) + (50 if key.endswith("_ms") else 0.05)
+            if result[key] > allowed:
+                regressions.append(f"{name}: {key} {result[key]} > {round(allowed, 3)} (baseline {previous[key]})")
+    return regressions
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.gui and args.backend == "native":
+        parser.error("--gui measures the odin backend only")
+    
+    with tempfile.TemporaryDirectory(prefix="odin4-bench-") as directory:
+        # ذاكرة السرعات والتحقق في مجلد مؤقت حتى لا تتأثر ذاكرة المستخدم
+        os.environ["XDG_CACHE_HOME"] = os.environ["LOCALAPPDATA"] = os.path.join(directory, "cache")
+        results = run_scenarios(args, directory)
+    
+    summary = {"scenarios": results, "enumeration_ms": enumeration_ms()}
+    if summary["enumeration_ms"] is not None:
+        print(json.dumps({"enumeration_ms": round(summary["enumeration_ms"], 3)}))
+    
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+            f.write("\n")
+    
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
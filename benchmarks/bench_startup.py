@@ -0,0 +1,74 @@
+# قياس زمن الإقلاع حتى أول رسم للنافذة. يعمل على CI مع منصة Qt offscreen:
+#   python benchmarks/bench_startup.py --runs 5 --max-ms 1500
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_once():
+    start = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    from PyQt5.QtWidgets import QApplication
+    import gui
+    imported = time.perf_counter()
+    
+    app = QApplication([sys.argv[0]])
+    window = gui.FlashToolApp()
+    constructed = time.perf_counter()
+    
+    timings = {}
+    
+    def on_first_paint():
+        timings["first_paint"] = time.perf_counter()
+        app.quit()
+    
+    window.first_painted.connect(on_first_paint)
+    window.show()
+    app.exec_()
+    window.close()
+    
+    return {
+        "import_ms": (imported - start) * 1000,
+        "construct_ms": (constructed - imported) * 1000,
+        "first_paint_ms": (timings["first_paint"] - start) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure GUI cold start time to first paint")
+    parser.add_argument("--runs", type=int, default=5, help="number of cold starts to measure")
+    parser.add_argument("--max-ms", type=float, help="fail when the median time to first paint is above this")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        print(json.dumps(measure_once()))
+        return 0
+    
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    samples = []
+    for _ in range(args.runs):
+        # كل قياس في عملية جديدة حتى يكون الإقلاع باردًا
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"],
+                                env=env, check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    
+    result = {key: round(statistics.median(sample[key] for sample in samples), 1) for key in samples[0]}
+    result["runs"] = len(samples)
+    print(json.dumps(result))
+    
+    if args.max_ms is not None and result["first_paint_ms"] > args.max_ms:
+        print(f"Time to first paint {result['first_paint_ms']} ms is above {args.max_ms} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+# محاكي Odin لاختبارات الأداء: يقبل نفس وسائط odin4 ويطبع تقدماً واقعياً بسرعة محددة.
+#   python benchmarks/fake_odin.py --fake-rate 40M -d /dev/ttyACM0 -a AP.tar --reboot
+import os
+import sys
+import stat
+import time
+import random
+import argparse
+import tarfile
+
+PROGRESS_INTERVAL = 0.05
+
+
+def parse_size(value):
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    value = value.strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Odin stand-in for benchmarks")
+    parser.add_argument("--fake-rate", type=parse_size, default=parse_size("40M"), help="transfer rate in bytes/second")
+    parser.add_argument("--fake-handshake", type=float, default=0.5, help="seconds spent on the USB handshake and PIT")
+    parser.add_argument("--fake-erase", type=float, default=1.0, help="seconds spent on NAND erase")
+    parser.add_argument("--fake-reboot", type=float, default=0.2, help="seconds spent on reboot")
+    parser.add_argument("--fake-fail-probability", type=float, default=0.0, help="chance that a session fails")
+    parser.add_argument("--fake-fail-at", type=float, default=0.5, help="fraction of the bytes after which a failure happens")
+    parser.add_argument("--fake-fail-mode", choices=("error", "stall"), default="error",
+                        help="fail with an error exit, or hang without output like a flaky USB cable")
+    parser.add_argument("--fake-seed", type=int, help="random seed for failure injection")
+    parser.add_argument("-d", dest="device")
+    for flag in ("-b", "-a", "-c", "-s", "-u"):
+        parser.add_argument(flag, dest="files", action="append", default=[])
+    parser.add_argument("-e", "--nand-erase", action="store_true")
+    parser.add_argument("--reboot", action="store_true")
+    return parser
+
+
+def members(file_path):
+    try:
+        with tarfile.open(file_path, "r:") as archive:
+            found = [(os.path.basename(member.name), member.size) for member in archive if member.isfile()]
+    except (OSError, tarfile.TarError):
+        found = []
+    return found or [(os.path.basename(file_path), os.path.getsize(file_path))]
+
+
+def is_fifo(file_path):
+    return stat.S_ISFIFO(os.stat(file_path).st_mode)
+
+
+def fail(name, fail_mode):
+    if fail_mode == "stall":
+        while True:
+            time.sleep(3600)
+    print(f"\nFAIL! write {name} failed", flush=True)
+    sys.exit(1)
+
+
+def stream_members(file_path, rate, fail_after=None, fail_mode="error"):
+    # الإدخال FIFO (حزمة zip مُمررة مباشرة): قراءة tar بالتتابع بدون seek بنفس السرعة المحددة
+    sent = 0
+    with open(file_path, "rb") as f, tarfile.open(fileobj=f, mode="r|") as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            name = os.path.basename(member.name)
+            print(f"Upload Binaries: {name}", flush=True)
+            source = archive.extractfile(member)
+            step = max(int(rate * PROGRESS_INTERVAL), 1)
+            done = 0
+            while True:
+                chunk = source.read(step)
+                if not chunk:
+                    break
+                time.sleep(len(chunk) / rate)
+                done += len(chunk)
+                sys.stdout.write(f"\r{name} {done}/{member.size}")
+                sys.stdout.flush()
+                if fail_after is not None and sent + done >= fail_after:
+                    fail(name, fail_mode)
+            sent += done
+            sys.stdout.write("\n")
+            if done != member.size:
+                print(f"\nFAIL! {name} truncated ({done}/{member.size})", flush=True)
+                sys.exit(1)
+    return sent
+
+
+def transfer(name, size, rate, fail_after, fail_mode="error"):
+    done = 0
+    step = max(int(rate * PROGRESS_INTERVAL), 1)
+    while done < size:
+        chunk = min(step, size - done)
+        time.sleep(chunk / rate)
+        done += chunk
+        sys.stdout.write(f"\r{name} {done}/{size}")
+        sys.stdout.flush()
+        if fail_after is not None and done >= fail_after:
+            fail(name, fail_mode)
+    sys.stdout.write("\n")
+
+
+def main():
+    args = build_parser().parse_args()
+    rng = random.Random(args.fake_seed)
+    
+    print(f"Setup Connection: {args.device}", flush=True)
+    time.sleep(args.fake_handshake)
+    print("Get PIT for mapping", flush=True)
+    
+    if args.nand_erase:
+        print("Erase NAND", flush=True)
+        time.sleep(args.fake_erase)
+    
+    total = sum(os.path.getsize(file_path) for file_path in args.files if not is_fifo(file_path))
+    fail_after = None
+    # مدخلات FIFO لا يُعرف حجمها مسبقاً فتُحسب صفراً، والفشل عندها يحدث من أول جزء
+    if args.files and rng.random() < args.fake_fail_probability:
+        fail_after = int(total * args.fake_fail_at)
+    
+    sent = 0
+    for file_path in args.files:
+        print(f"Check file : {os.path.basename(file_path)}", flush=True)
+        if is_fifo(file_path):
+            sent += stream_members(file_path, args.fake_rate, None if fail_after is None else max(fail_after - sent, 0), args.fake_fail_mode)
+            continue
+        for name, size in members(file_path):
+            print(f"Upload Binaries: {name}", flush=True)
+            transfer(name, size, args.fake_rate, None if fail_after is None else max(fail_after - sent, 0), args.fake_fail_mode)
+            sent += size
+    
+    if args.reboot:
+        print("Close Connection, reboot", flush=True)
+        time.sleep(args.fake_reboot)
+    print("All threads completed. (succeed 1 / failed 0)", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,311 @@
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import threading
+
+from engine import BACKENDS, DEFAULT_ODIN_PATH, STALL_RETRIES, STALL_TIMEOUT, FlashEngine
+from firmware import firmware_size, pick_bundle_files, read_bundle
+from metrics import MetricsServer, MetricsSink
+from scheduler import get_transfer_scheduler
+
+# نفس وسائط odin4 لكل خانة ملف
+SLOT_ARGUMENTS = (
+    ("-b", "--bl", "BL File"),
+    ("-a", "--ap", "AP File"),
+    ("-c", "--cp", "CP File"),
+    ("-s", "--csc", "CSC File"),
+    ("-u", "--ums", "UMS File"),
+)
+
+
+cancelled = threading.Event()
+
+
+class JsonLinesWriter:
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+    
+    def emit(self, event, **fields):
+        record = {"event": event, "time": round(time.time(), 3)}
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="odin4", description="Flash Samsung firmware without the GUI. Progress is printed as JSON lines.")
+    parser.add_argument("-d", "--device", action="append", default=[], metavar="PORT",
+                        help="serial port of a device in download mode (repeat to flash several devices)")
+    for short_flag, long_flag, label in SLOT_ARGUMENTS:
+        parser.add_argument(short_flag, long_flag, metavar="FILE", help=f"{label.split()[0]} file")
+    parser.add_argument("--bundle", metavar="ZIP", help="firmware zip; its BL_/AP_/CP_/CSC_ files fill the slots not given explicitly")
+    parser.add_argument("--clean-csc", action="store_true", help="with --bundle, use CSC_ (wipes data) instead of HOME_CSC_")
+    parser.add_argument("--bundle-stream", action="store_true",
+                        help="feed bundle files to odin through a FIFO instead of extracting them (odin must read its input once)")
+    parser.add_argument("-e", "--nand-erase", action="store_true", help="erase NAND before flashing (erases all data!)")
+    parser.add_argument("--reboot", action="store_true", help="reboot the device after flashing")
+    parser.add_argument("--per-file", action="store_true", help="run one odin session per file instead of a single session")
+    parser.add_argument("--resume", action="store_true", help="skip files already written with identical content to the same device")
+    parser.add_argument("--no-verify", action="store_true", help="skip the MD5 check of .tar.md5 files")
+    parser.add_argument("--stall-timeout", type=float, default=STALL_TIMEOUT, metavar="SECONDS",
+                        help="kill and retry odin when it prints nothing for this long (0 disables the watchdog)")
+    parser.add_argument("--stall-retries", type=int, default=STALL_RETRIES, metavar="N", help="retries after a stall, resuming at the stalled partition")
+    parser.add_argument("--backend", choices=BACKENDS, default="odin",
+                        help="odin runs the odin executable, native speaks the download protocol directly over libusb (needs pyusb)")
+    parser.add_argument("--backup", action="append", default=[], metavar="PARTITION",
+                        help="read this partition (EFS means EFS or SEC_EFS) into a compressed backup before flashing (repeatable, needs --backend native)")
+    parser.add_argument("--odin", default=DEFAULT_ODIN_PATH, metavar="PATH", help="path to the odin executable")
+    parser.add_argument("--parallel", type=int, default=4, metavar="N", help="maximum number of devices flashed at once")
+    parser.add_argument("--metrics-dir", metavar="DIR", help="directory for flash_metrics.jsonl and flash_metrics.prom")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT", help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("-l", "--list", action="store_true", help="list serial devices and exit")
+    parser.add_argument("--download-only", action="store_true", help="with --list, only list devices in download mode (USB 04E8:685D)")
+    parser.add_argument("--auto", action="store_true",
+                        help="wait for devices and flash every device attached in download mode until interrupted")
+    parser.add_argument("--serve-agent", action="store_true", help="run a flash agent that a coordinator can send jobs to")
+    parser.add_argument("--agent-host", default="127.0.0.1", metavar="HOST", help="address the agent listens on (0.0.0.0 for all interfaces)")
+    parser.add_argument("--agent-port", type=int, default=8765, metavar="PORT", help="port the agent listens on")
+    parser.add_argument("--agent-device", action="append", default=[], metavar="PORT",
+                        help="only offer this device port to the coordinator (repeatable, default all; for several agents on one host)")
+    parser.add_argument("--agent", action="append", default=[], metavar="HOST:PORT",
+                        help="flash every download-mode device attached to this agent (repeat for several hosts)")
+    return parser
+
+
+async def flash_device(args, com_port, files_to_flash, output, metrics_sink, engines, limit):
+    def on_progress(progress, operation, time_remaining):
+        output.emit("progress", port=com_port, progress=progress, operation=operation, time_remaining=time_remaining)
+    
+    engine = FlashEngine(on_progress)
+    engine.odin_path = args.odin
+    engine.bundle_stream = args.bundle_stream
+    engine.stall_timeout = args.stall_timeout
+    engine.stall_retries = args.stall_retries
+    engine.backend = args.backend
+    engine.backup_partitions = tuple(args.backup)
+    engine.metrics_sink = metrics_sink
+    engine.configure(com_port, files_to_flash, args.reboot, args.nand_erase, not args.per_file, not args.no_verify, args.resume)
+    
+    async with limit:
+        if cancelled.is_set():
+            output.emit("finished", port=com_port, success=False, message="Operation cancelled by user while queued.",
+                        interrupted_phase="queued", job_id=None)
+            return False
+        engines.append(engine)
+        output.emit("started", port=com_port, files=[file_path for _, file_path in files_to_flash])
+        success, message = await engine.run_async()
+        engines.remove(engine)
+    output.emit("finished", port=com_port, success=success, message=message,
+                interrupted_phase=engine.interrupted_phase, stalled_phase=engine.stalled_phase,
+                job_id=engine.job_metrics.job_id if engine.job_metrics else None)
+    return success
+
+
+async def auto_flash(args, files_to_flash, output, metrics_sink, engines):
+    from devices import DeviceWatcher
+    
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(max(1, args.parallel))
+    active = {}
+    results = []
+    
+    def on_done(com_port, task):
+        del active[com_port]
+        if not task.cancelled():
+            results.append(task.result())
+    
+    def start(com_port, device_info):
+        # نفس المنفذ لا يُفلش مرتين في الوقت نفسه
+        if cancelled.is_set() or com_port in active:
+            return
+        output.emit("device", port=com_port, description=device_info)
+        task = loop.create_task(flash_device(args, com_port, files_to_flash, output, metrics_sink, engines, limit))
+        active[com_port] = task
+        task.add_done_callback(lambda task: on_done(com_port, task))
+    
+    watcher = DeviceWatcher(download_only=True)
+    # الأجهزة الموصولة قبل البدء لا تُفلش، فقط ما يوصل بعدها
+    watcher.scan()
+    for com_port, device_info in watcher.devices.items():
+        output.emit("ignored", port=com_port, description=device_info)
+    watcher.on_added = lambda com_port, device_info: loop.call_soon_threadsafe(start, com_port, device_info)
+    thread = threading.Thread(target=watcher.run, name="odin4-device-watcher", daemon=True)
+    thread.start()
+    output.emit("waiting", download_only=True)
+    
+    try:
+        while not cancelled.is_set():
+            await asyncio.sleep(0.2)
+    finally:
+        watcher.stop()
+    if active:
+        await asyncio.gather(*active.values(), return_exceptions=True)
+    return results
+
+
+def serve_agent(args, output):
+    from cluster import FlashAgent
+    
+    agent = FlashAgent(args.agent_port, args.agent_host, args.odin, args.parallel, ports=args.agent_device)
+    agent.stall_timeout = args.stall_timeout
+    agent.stall_retries = args.stall_retries
+    agent.backend = args.backend
+    agent.backup_partitions = tuple(args.backup)
+    agent.start()
+    output.emit("agent", name=agent.name, url=f"http://{args.agent_host}:{agent.port}")
+    while not cancelled.wait(0.2):
+        pass
+    agent.stop()
+    return 0
+
+
+def flash_remote(args, files_to_flash, output):
+    from cluster import Coordinator, RemoteJob
+    
+    finished = threading.Event()
+    
+    def on_job_updated(job):
+        if job.state in ("done", "failed"):
+            output.emit("finished", agent=job.agent, port=job.com_port, success=job.success, message=job.message,
+                        interrupted_phase=job.interrupted_phase, stalled_phase=job.stalled_phase)
+        else:
+            output.emit("progress", agent=job.agent, port=job.com_port, progress=job.progress, operation=job.operation)
+    
+    coordinator = Coordinator(args.agent, on_job_updated, lambda jobs: finished.set())
+    coordinator.poll()
+    for agent in coordinator.agents.values():
+        if agent.online:
+            output.emit("agent", name=agent.name, url=agent.url, devices=agent.devices)
+        else:
+            output.emit("agent_error", name=agent.name, url=agent.url, message=agent.error)
+    
+    jobs = [
+        RemoteJob(url, device["port"], device["description"], files_to_flash, args.reboot, args.nand_erase,
+                  not args.per_file, not args.no_verify, args.resume)
+        for url, device in coordinator.devices()
+        if device["kind"] == "download" and not device["busy"]
+    ]
+    if not jobs:
+        output.emit("error", message="no free download-mode devices on the agents")
+        coordinator.stop()
+        return 1
+    
+    coordinator.submit(jobs)
+    coordinator.start()
+    cancelling = False
+    while not finished.wait(0.2):
+        if cancelled.is_set() and not cancelling:
+            cancelling = True
+            coordinator.cancel()
+    coordinator.stop()
+    if cancelled.is_set():
+        return 130
+    return 0 if all(job.success for job in jobs) else 1
+
+
+async def flash_devices(args, files_to_flash, output, metrics_sink, engines):
+    # حلقة أحداث واحدة تدير كل الأجهزة، وSemaphore يحدد عدد الجلسات المتزامنة
+    limit = asyncio.Semaphore(max(1, args.parallel))
+    # الأجهزة تبدأ موزعة على فروع USB بدلاً من ترتيب سطر الأوامر، والنتائج تبقى بنفس الترتيب
+    scheduler = get_transfer_scheduler()
+    await asyncio.to_thread(scheduler.refresh)
+    size = 0
+    for _, file_path in files_to_flash:
+        try:
+            size += firmware_size(file_path)
+        except OSError:
+            pass
+    order = scheduler.order([(com_port, size) for com_port in args.device])
+    tasks = {}
+    for index in order:
+        tasks[index] = asyncio.create_task(
+            flash_device(args, args.device[index], files_to_flash, output, metrics_sink, engines, limit))
+    return await asyncio.gather(*(tasks[index] for index in range(len(args.device))))
+
+
+def install_interrupt_handler(output, engines):
+    def on_interrupt(signum, frame):
+        # Ctrl+C يلغي كل الأجهزة الجارية بدلاً من ترك Odin يمسك المنافذ
+        cancelled.set()
+        output.emit("cancelling", signal=signal.Signals(signum).name)
+        for engine in list(engines):
+            engine.cancel()
+    
+    signal.signal(signal.SIGINT, on_interrupt)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, on_interrupt)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    output = JsonLinesWriter(sys.stdout)
+    
+    if args.list:
+        from devices import list_devices, usb_topology
+        for device_id, device_info in list_devices(args.download_only):
+            output.emit("device", port=device_id, description=device_info, usb_branch=list(usb_topology.branch(device_id)))
+        output.emit("usb_topology", tree=usb_topology.tree())
+        return 0
+    
+    if args.backup and args.backend != "native":
+        # odin يبدأ بمصافحته الخاصة، والمحمل لا يقبل مصافحة ثانية بعد قراءة الأقسام
+        parser.error("--backup reads partitions inside the native download session, use it with --backend native")
+    if args.serve_agent:
+        install_interrupt_handler(output, [])
+        return serve_agent(args, output)
+    
+    bundle_files = {}
+    if args.bundle:
+        try:
+            bundle_files = dict(pick_bundle_files(read_bundle(args.bundle), args.clean_csc))
+        except OSError as e:
+            parser.error(f"cannot read bundle: {e}")
+        if not bundle_files:
+            parser.error(f"no BL_/AP_/CP_/CSC_ files found in {args.bundle}")
+    
+    files_to_flash = []
+    for _, long_flag, label in SLOT_ARGUMENTS:
+        file_path = getattr(args, long_flag[2:]) or bundle_files.get(label)
+        if file_path:
+            files_to_flash.append((label, file_path))
+    
+    if args.auto and args.device:
+        parser.error("--auto flashes newly attached devices, do not combine it with -d")
+    if args.agent and (args.device or args.auto):
+        parser.error("--agent flashes the devices attached to the agents, do not combine it with -d or --auto")
+    if not args.device and not args.auto and not args.agent:
+        parser.error("no device selected, use -d PORT, --auto or --agent")
+    if not files_to_flash:
+        parser.error("no files selected for flashing")
+    
+    engines = []
+    install_interrupt_handler(output, engines)
+    if args.agent:
+        return flash_remote(args, files_to_flash, output)
+    
+    metrics_sink = MetricsSink(args.metrics_dir)
+    metrics_server = None
+    if args.metrics_port:
+        metrics_server = MetricsServer(metrics_sink, args.metrics_port)
+        metrics_server.start()
+    
+    try:
+        if args.auto:
+            results = asyncio.run(auto_flash(args, files_to_flash, output, metrics_sink, engines))
+        else:
+            results = asyncio.run(flash_devices(args, files_to_flash, output, metrics_sink, engines))
+    finally:
+        if metrics_server:
+            metrics_server.stop()
+    if args.auto:
+        return 0 if all(results) else 1
+    if cancelled.is_set():
+        return 130
+    return 0 if all(results) else 1
@@ -0,0 +1,631 @@
+import os
+import re
+import json
+import time
+import uuid
+import socket
+import asyncio
+import threading
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+
+from devices import DeviceWatcher, port_classifier
+from engine import DEFAULT_ODIN_PATH, STALL_RETRIES, STALL_TIMEOUT, FlashEngine, FlashJob
+from firmware import StreamHasher, cache_dir, firmware_size, get_firmware_verifier, open_firmware
+
+AGENT_PORT = 8765
+AGENT_JOB_HISTORY = 256
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+POLL_INTERVAL = 0.5
+REQUEST_TIMEOUT = 10
+CONTENT_HASH_RE = re.compile(r"^[0-9a-f]{32}$")
+# خيارات المهمة كما يرسلها المنسق، مع قيمها الافتراضية
+JOB_OPTIONS = (
+    ("reboot", False),
+    ("nand_erase", False),
+    ("single_session", True),
+    ("verify", True),
+    ("resume", False),
+)
+
+
+class AgentError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class AgentJob:
+    def __init__(self, job_id, com_port, files_to_flash, options):
+        self.job_id = job_id
+        self.com_port = com_port
+        self.files_to_flash = files_to_flash
+        self.options = options
+        self.state = "queued"
+        self.progress = 0
+        self.operation = "Waiting..."
+        self.message = ""
+        self.success = False
+        self.interrupted_phase = None
+        self.stalled_phase = None
+        self.engine = None
+    
+    def finish(self, success, message, interrupted_phase=None, stalled_phase=None):
+        self.success = success
+        self.message = self.operation = message
+        self.interrupted_phase = interrupted_phase
+        self.stalled_phase = stalled_phase
+        self.state = "done" if success else "failed"
+    
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "port": self.com_port,
+            "state": self.state,
+            "progress": self.progress,
+            "operation": self.operation,
+            "message": self.message,
+            "success": self.success,
+            "interrupted_phase": self.interrupted_phase,
+            "stalled_phase": self.stalled_phase,
+        }
+
+
+class FlashAgent:
+    def __init__(self, port=AGENT_PORT, host="127.0.0.1", odin_path=DEFAULT_ODIN_PATH, max_concurrent=4, firmware_dir=None, ports=None):
+        # عقدة تفليش على كل جهاز كمبيوتر: تعرض أجهزتها وتنفذ المهام التي يرسلها المنسق
+        self.odin_path = odin_path
+        # عدة عقد على نفس الجهاز تقسم المنافذ بينها؛ None يعني كل المنافذ
+        self.ports = set(ports) if ports else None
+        self.stall_timeout = STALL_TIMEOUT
+        self.stall_retries = STALL_RETRIES
+        self.backend = "odin"
+        self.backup_partitions = ()
+        self.max_concurrent = max(1, max_concurrent)
+        self.firmware_dir = firmware_dir or os.path.join(cache_dir(), "agent_firmware")
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.watcher = DeviceWatcher()
+        self.loop = asyncio.new_event_loop()
+        self.limit = asyncio.Semaphore(self.max_concurrent)
+        
+        agent = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.dispatch("GET")
+            
+            def do_HEAD(self):
+                self.dispatch("HEAD")
+            
+            def do_POST(self):
+                self.dispatch("POST")
+            
+            def do_PUT(self):
+                self.dispatch("PUT")
+            
+            def dispatch(self, method):
+                try:
+                    status, payload = agent.handle(method, self.path, self)
+                except AgentError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception as e:
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if method != "HEAD":
+                    self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.server.server_address[1]
+        self.name = f"{socket.gethostname()}:{self.port}"
+        self.threads = [
+            threading.Thread(target=self.server.serve_forever, name="odin4-agent-http", daemon=True),
+            threading.Thread(target=self.watcher.run, name="odin4-agent-devices", daemon=True),
+            threading.Thread(target=self.loop.run_forever, name="odin4-agent-loop", daemon=True),
+        ]
+    
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+    
+    def stop(self):
+        with self.lock:
+            engines = [job.engine for job in self.jobs.values() if job.engine is not None]
+        for engine in engines:
+            engine.kill()
+        self.server.shutdown()
+        self.server.server_close()
+        self.watcher.stop()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+    
+    def handle(self, method, path, request):
+        parts = [unquote(part) for part in path.split("?", 1)[0].strip("/").split("/")]
+        if method == "GET" and parts == ["status"]:
+            return 200, self.status()
+        if parts[0] == "firmware" and len(parts) == 3:
+            if method in ("GET", "HEAD"):
+                if not os.path.exists(self.firmware_path(parts[1], parts[2])):
+                    raise AgentError(404, f"firmware {parts[2]} not found")
+                return 200, {"hash": parts[1]}
+            if method == "PUT":
+                length = int(request.headers.get("Content-Length") or 0)
+                return 201, self.receive_firmware(parts[1], parts[2], request.rfile, length)
+        if method == "POST" and parts == ["jobs"]:
+            length = int(request.headers.get("Content-Length") or 0)
+            try:
+                payload = json.loads(request.rfile.read(length))
+            except ValueError as e:
+                raise AgentError(400, f"malformed job: {e}")
+            return 202, self.submit(payload)
+        if method == "POST" and len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            return 200, self.cancel(parts[1])
+        raise AgentError(404, f"no route for {method} {path}")
+    
+    def status(self):
+        devices = dict(self.watcher.devices)
+        with self.lock:
+            busy = {job.com_port for job in self.jobs.values() if job.state in ("queued", "running")}
+            jobs = [job.to_dict() for job in self.jobs.values()]
+        return {
+            "name": self.name,
+            "capacity": self.max_concurrent,
+            "devices": [
+                {"port": com_port, "description": device_info, "kind": port_classifier.kind(com_port), "busy": com_port in busy}
+                for com_port, device_info in devices.items()
+                if self.serves(com_port)
+            ],
+            "jobs": jobs,
+        }
+    
+    def serves(self, com_port):
+        return self.ports is None or com_port in self.ports
+    
+    def firmware_path(self, content_hash, name):
+        # الملفات تُحفظ حسب بصمة محتواها، فلا يُرفع نفس الملف مرتين
+        name = os.path.basename(name)
+        if not CONTENT_HASH_RE.match(content_hash) or name in ("", ".", ".."):
+            raise AgentError(400, f"invalid firmware reference {content_hash}/{name}")
+        return os.path.join(self.firmware_dir, content_hash, name)
+    
+    def receive_firmware(self, content_hash, name, rfile, length):
+        path = self.firmware_path(content_hash, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.part"
+        remaining = length
+        # البصمة تُحسب أثناء الاستقبال؛ لملفات .tar.md5 لا يكفي سطر md5 في آخرها، فمحتواها يُقارن به أيضاً
+        hasher = StreamHasher()
+        try:
+            with open(temp_path, "wb") as f:
+                while remaining:
+                    chunk = rfile.read(min(remaining, UPLOAD_CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    remaining -= len(chunk)
+            if remaining:
+                raise AgentError(400, f"upload of {name} truncated ({remaining} bytes missing)")
+            actual, result = hasher.result()
+            if actual != content_hash:
+                raise AgentError(400, f"content hash mismatch for {name} (expected {content_hash}, got {actual})")
+            if name.lower().endswith(".md5") and not result["ok"]:
+                raise AgentError(400, f"upload of {name} is corrupt: {result['message']}")
+            os.replace(temp_path, path)
+            get_firmware_verifier().record(path, actual, result)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return {"hash": content_hash, "size": length}
+    
+    def submit(self, payload):
+        try:
+            com_port = payload["port"]
+            files_to_flash = []
+            for entry in payload["files"]:
+                path = self.firmware_path(entry["hash"], entry["name"])
+                if not os.path.exists(path):
+                    raise AgentError(409, f"firmware {entry['name']} has not been uploaded")
+                files_to_flash.append((entry["label"], path))
+            options = {key: bool(payload.get(key, default)) for key, default in JOB_OPTIONS}
+            job_id = str(payload.get("job_id") or uuid.uuid4().hex[:12])
+        except (KeyError, TypeError) as e:
+            raise AgentError(400, f"malformed job: missing {e}")
+        if not files_to_flash:
+            raise AgentError(400, "no files to flash")
+        if not self.serves(com_port):
+            raise AgentError(403, f"{com_port} is not served by this agent")
+        
+        with self.lock:
+            if job_id in self.jobs:
+                raise AgentError(409, f"job {job_id} already exists")
+            if any(job.com_port == com_port and job.state in ("queued", "running") for job in self.jobs.values()):
+                raise AgentError(409, f"{com_port} is busy")
+            job = AgentJob(job_id, com_port, files_to_flash, options)
+            self.jobs[job_id] = job
+            self.prune_jobs()
+        asyncio.run_coroutine_threadsafe(self.run_job(job), self.loop)
+        return job.to_dict()
+    
+    def prune_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.state in ("done", "failed")]
+        for job_id in finished[:max(len(self.jobs) - AGENT_JOB_HISTORY, 0)]:
+            del self.jobs[job_id]
+    
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                raise AgentError(404, f"job {job_id} not found")
+            if job.state == "queued":
+                job.finish(False, "Operation cancelled by user while queued.", "queued")
+            elif job.engine is not None:
+                job.engine.cancel()
+            return job.to_dict()
+    
+    def on_progress(self, job, progress, operation):
+        job.progress = progress
+        job.operation = operation
+    
+    async def run_job(self, job):
+        async with self.limit:
+            engine = FlashEngine(lambda progress, operation, _: self.on_progress(job, progress, operation))
+            engine.odin_path = self.odin_path
+            engine.stall_timeout = self.stall_timeout
+            engine.stall_retries = self.stall_retries
+            engine.backend = self.backend
+            engine.backup_partitions = self.backup_partitions
+            engine.configure(job.com_port, job.files_to_flash, **job.options)
+            with self.lock:
+                if job.state != "queued":
+                    return
+                job.engine = engine
+                job.state = "running"
+            success, message = await engine.run_async()
+        with self.lock:
+            job.finish(success, message, engine.interrupted_phase, engine.stalled_phase)
+            job.engine = None
+
+
+def agent_url(address):
+    if "://" not in address:
+        address = f"http://{address}"
+    parts = urlsplit(address)
+    if parts.port is None:
+        address = f"{parts.scheme}://{parts.hostname}:{AGENT_PORT}"
+    return address.rstrip("/")
+
+
+def agent_host(hostname):
+    # عدة عقد على نفس الجهاز ترى نفس المنافذ، فالمنفذ المشغول يُعرف بالجهاز لا بعنوان العقدة
+    try:
+        address = socket.gethostbyname(hostname)
+    except OSError:
+        address = hostname.lower()
+    if address in ("localhost", "::1") or address.startswith("127."):
+        return "localhost"
+    return address
+
+
+class RemoteAgent:
+    def __init__(self, address):
+        self.url = agent_url(address)
+        self.name = urlsplit(self.url).netloc
+        self.host = None
+        self.online = False
+        self.error = None
+        self.capacity = 0
+        self.devices = []
+        self.jobs = {}
+        self.refreshed = 0
+        self.uploads = {}
+        self.lock = threading.Lock()
+    
+    def request(self, method, path, payload=None, data=None, length=None):
+        headers = {}
+        if payload is not None:
+            data = json.dumps(payload).encode()
+            headers["Content-Type"] = "application/json"
+        if length is not None:
+            headers["Content-Length"] = str(length)
+        request = urllib.request.Request(self.url + path, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                body = response.read()
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read())["error"]
+            except (ValueError, KeyError, TypeError):
+                message = e.reason
+            raise AgentError(e.code, f"{self.name}: {message}")
+        return json.loads(body) if body else {}
+    
+    def refresh(self):
+        started = time.monotonic()
+        try:
+            status = self.request("GET", "/status")
+        except (OSError, ValueError, AgentError) as e:
+            self.online = False
+            self.error = str(e)
+            return False
+        if self.host is None:
+            self.host = agent_host(urlsplit(self.url).hostname)
+        self.capacity = status["capacity"]
+        self.devices = status["devices"]
+        self.jobs = {job["job_id"]: job for job in status["jobs"]}
+        self.refreshed = started
+        self.online = True
+        self.error = None
+        return True
+    
+    def ensure_firmware(self, file_path, content_hash):
+        # كل ملف يُرفع مرة واحدة لكل عقدة حتى لو طلبته عدة أجهزة في نفس الوقت
+        name = os.path.basename(file_path)
+        key = (content_hash, name)
+        with self.lock:
+            future = self.uploads.get(key)
+            owner = future is None
+            if owner:
+                future = self.uploads[key] = Future()
+        if not owner:
+            return future.result()
+        
+        try:
+            self.upload(file_path, name, content_hash)
+        except BaseException as e:
+            with self.lock:
+                del self.uploads[key]
+            future.set_exception(e)
+            raise
+        future.set_result(True)
+        return True
+    
+    def upload(self, file_path, name, content_hash):
+        path = f"/firmware/{content_hash}/{quote(name)}"
+        try:
+            self.request("HEAD", path)
+            return
+        except AgentError as e:
+            if e.status != 404:
+                raise
+        with open_firmware(file_path) as f:
+            self.request("PUT", path, data=f, length=firmware_size(file_path))
+
+
+class RemoteJob(FlashJob):
+    def __init__(self, agent, com_port, device_info, files_to_flash, reboot, nand_erase, single_session=True, verify=True, resume=False):
+        super().__init__(com_port, device_info, files_to_flash, reboot, nand_erase, single_session, verify, resume)
+        # بدون عقدة ومنفذ محددين تذهب المهمة لأول جهاز Download متاح في أقل العقد انشغالاً
+        self.agent = agent_url(agent) if agent else None
+        self.remote_id = None
+        self.sent_at = None
+        self.cancel_requested = False
+    
+    def title(self):
+        if self.agent is None:
+            return self.com_port or "any device"
+        return f"{urlsplit(self.agent).netloc} {self.com_port or ''}".strip()
+
+
+class Coordinator:
+    def __init__(self, addresses, on_job_updated=None, on_all_finished=None, on_devices_changed=None, poll_interval=POLL_INTERVAL):
+        self.agents = {}
+        for address in addresses:
+            agent = RemoteAgent(address)
+            self.agents[agent.url] = agent
+        self.on_job_updated = on_job_updated
+        self.on_all_finished = on_all_finished
+        self.on_devices_changed = on_devices_changed
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.jobs = []
+        self.queue = deque()
+        self.sending = set()
+        self.running = {}
+        self.known_devices = None
+        self.wake = threading.Event()
+        self.active = False
+        self.thread = None
+        workers = max(4, len(self.agents))
+        self.poll_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="odin4-coordinator-poll")
+        self.send_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="odin4-coordinator-send")
+    
+    def start(self):
+        self.active = True
+        self.thread = threading.Thread(target=self.run, name="odin4-coordinator", daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        self.active = False
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(REQUEST_TIMEOUT)
+        self.poll_executor.shutdown(wait=False)
+        self.send_executor.shutdown(wait=False)
+    
+    def is_running(self):
+        with self.lock:
+            return bool(self.queue or self.sending or self.running)
+    
+    def devices(self):
+        return [(agent.url, device) for agent in list(self.agents.values()) for device in agent.devices]
+    
+    def submit(self, jobs):
+        with self.lock:
+            for job in jobs:
+                if job.agent is not None and job.agent not in self.agents:
+                    self.agents[job.agent] = RemoteAgent(job.agent)
+                self.jobs.append(job)
+                self.queue.append(job)
+        self.wake.set()
+    
+    def cancel(self):
+        with self.lock:
+            queued = list(self.queue)
+            self.queue.clear()
+            for job in self.sending:
+                job.cancel_requested = True
+            running = list(self.running.items())
+        for job in queued:
+            job.state = "failed"
+            job.interrupted_phase = "queued"
+            job.message = job.operation = "Operation cancelled by user while queued."
+            self.notify(job)
+        for job, agent in running:
+            self.send_executor.submit(self.cancel_remote, job, agent)
+        self.check_finished()
+    
+    def cancel_remote(self, job, agent):
+        try:
+            agent.request("POST", f"/jobs/{quote(job.remote_id)}/cancel")
+        except (OSError, ValueError, AgentError) as e:
+            job.operation = f"Cancel failed: {e}"
+            self.notify(job)
+    
+    def notify(self, job):
+        if self.on_job_updated:
+            self.on_job_updated(job)
+    
+    def run(self):
+        while self.active:
+            self.poll()
+            self.dispatch()
+            self.wake.wait(self.poll_interval)
+            self.wake.clear()
+    
+    def poll(self):
+        # كل العقد تُسأل بالتوازي حتى لا تؤخر عقدة بطيئة الباقين
+        list(self.poll_executor.map(RemoteAgent.refresh, list(self.agents.values())))
+        
+        devices = self.devices()
+        if devices != self.known_devices:
+            self.known_devices = devices
+            if self.on_devices_changed:
+                self.on_devices_changed(devices)
+        
+        with self.lock:
+            running = list(self.running.items())
+        for job, agent in running:
+            if not agent.online:
+                operation = f"Agent {agent.name} unreachable, waiting..."
+                if job.operation != operation:
+                    job.operation = operation
+                    self.notify(job)
+                continue
+            remote = agent.jobs.get(job.remote_id)
+            if remote is None:
+                # الحالة أقدم من إرسال المهمة، أو أن العقدة أُعيد تشغيلها
+                if agent.refreshed > job.sent_at:
+                    self.finish(job, False, f"Job lost by agent {agent.name}")
+                continue
+            if remote["state"] in ("done", "failed"):
+                job.progress = remote["progress"]
+                self.finish(job, remote["success"], remote["message"], remote["interrupted_phase"], remote.get("stalled_phase"))
+            elif (job.progress, job.operation) != (remote["progress"], remote["operation"]):
+                job.progress = remote["progress"]
+                job.operation = remote["operation"]
+                self.notify(job)
+    
+    def place(self, job, load, busy):
+        if job.agent is not None:
+            candidates = [self.agents[job.agent]]
+        else:
+            candidates = sorted(self.agents.values(), key=lambda agent: load[agent.url] / max(agent.capacity, 1))
+        for agent in candidates:
+            if not agent.online or load[agent.url] >= agent.capacity:
+                continue
+            for device in agent.devices:
+                com_port = device["port"]
+                if device["busy"] or (agent.host, com_port) in busy:
+                    continue
+                if job.com_port is not None:
+                    if com_port == job.com_port:
+                        return agent, com_port
+                elif device["kind"] == "download":
+                    return agent, com_port
+        return None, None
+    
+    def dispatch(self):
+        to_send = []
+        with self.lock:
+            load = {url: 0 for url in self.agents}
+            busy = set()
+            for job in list(self.sending) + list(self.running):
+                load[job.agent] += 1
+                busy.add((self.agents[job.agent].host, job.com_port))
+            for job in list(self.queue):
+                agent, com_port = self.place(job, load, busy)
+                if agent is None:
+                    continue
+                self.queue.remove(job)
+                self.sending.add(job)
+                job.agent = agent.url
+                job.com_port = com_port
+                job.state = "running"
+                job.operation = f"Sending to {agent.name}..."
+                load[agent.url] += 1
+                busy.add((agent.host, com_port))
+                to_send.append((job, agent))
+        for job, agent in to_send:
+            self.notify(job)
+            self.send_executor.submit(self.send, job, agent)
+    
+    def send(self, job, agent):
+        verifier = get_firmware_verifier()
+        try:
+            files = []
+            for label, file_path in job.files_to_flash:
+                content_hash = verifier.content_hash_future(file_path).result()
+                job.operation = f"Uploading {os.path.basename(file_path)} to {agent.name}..."
+                self.notify(job)
+                agent.ensure_firmware(file_path, content_hash)
+                files.append({"label": label, "name": os.path.basename(file_path), "hash": content_hash})
+            payload = {"port": job.com_port, "files": files}
+            for key, _ in JOB_OPTIONS:
+                payload[key] = getattr(job, key)
+            remote = agent.request("POST", "/jobs", payload)
+        except (OSError, ValueError, AgentError) as e:
+            with self.lock:
+                self.sending.discard(job)
+            self.finish(job, False, f"Could not start on {agent.name}: {e}")
+            return
+        
+        with self.lock:
+            self.sending.discard(job)
+            job.remote_id = remote["job_id"]
+            job.sent_at = time.monotonic()
+            self.running[job] = agent
+        job.operation = f"Queued on {agent.name}"
+        self.notify(job)
+        if job.cancel_requested:
+            self.cancel_remote(job, agent)
+        self.wake.set()
+    
+    def finish(self, job, success, message, interrupted_phase=None, stalled_phase=None):
+        with self.lock:
+            self.running.pop(job, None)
+        job.success = success
+        job.message = job.operation = message
+        job.interrupted_phase = interrupted_phase or job.interrupted_phase
+        job.stalled_phase = stalled_phase
+        job.state = "done" if success else "failed"
+        self.notify(job)
+        self.check_finished()
+    
+    def check_finished(self):
+        with self.lock:
+            if self.queue or self.sending or self.running or not self.jobs:
+                return
+            jobs, self.jobs = self.jobs, []
+        if self.on_all_finished:
+            self.on_all_finished(jobs)
@@ -0,0 +1,238 @@
+import re
+import sys
+import select
+import socket
+import threading
+
+NETLINK_KOBJECT_UEVENT = 15
+
+SAMSUNG_VID = 0x04E8
+# معرفات USB لأجهزة Samsung في وضع Download (بروتوكول Odin/Loke)
+DOWNLOAD_MODE_USB_IDS = {
+    (0x04E8, 0x685D),
+}
+
+# موقع المنفذ كما يعطيه pyserial: "1-1.4.2:1.0" على Linux، و"Port_#0002.Hub_#0004" في نسخ Windows القديمة
+USB_LOCATION_RE = re.compile(r"^(\d+)-([\d.]+)")
+WINDOWS_USB_LOCATION_RE = re.compile(r"Port_#(\d+)\.Hub_#(\d+)")
+USB_CONTROLLER_PREFIX = "usb"
+
+
+def usb_branch(location):
+    # الفرع من المتحكم إلى الـ hub الذي يتصل به الجهاز: "1-1.4.2" -> ("usb1", "1-1", "1-1.4")
+    if not location:
+        return ()
+    match = USB_LOCATION_RE.match(location)
+    if match:
+        bus, path = match.groups()
+        ports = path.split(".")
+        return (f"{USB_CONTROLLER_PREFIX}{bus}",) + tuple(f"{bus}-{'.'.join(ports[:depth])}" for depth in range(1, len(ports)))
+    match = WINDOWS_USB_LOCATION_RE.search(location)
+    if match:
+        return (f"hub#{int(match.group(2))}",)
+    return ()
+
+
+class PortClassifier:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cache = {}
+        self.kinds = {}
+    
+    def classify(self, port):
+        # التصنيف محفوظ لكل منفذ حتى يتغير معرف USB الخاص به
+        key = (port.device, port.vid, port.pid, port.serial_number)
+        with self.lock:
+            kind = self.cache.get(key)
+            if kind is None:
+                if (port.vid, port.pid) in DOWNLOAD_MODE_USB_IDS:
+                    kind = "download"
+                elif port.vid == SAMSUNG_VID:
+                    kind = "samsung"
+                elif port.vid is not None:
+                    kind = "usb"
+                else:
+                    kind = "serial"
+                self.cache[key] = kind
+            self.kinds[port.device] = kind
+        return kind
+    
+    def kind(self, device_id):
+        with self.lock:
+            return self.kinds.get(device_id)
+
+
+port_classifier = PortClassifier()
+
+
+class UsbTopology:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.branches = {}
+    
+    def update(self, port):
+        with self.lock:
+            self.branches[port.device] = usb_branch(port.location)
+    
+    def branch(self, device_id):
+        with self.lock:
+            return self.branches.get(device_id, ())
+    
+    def tree(self):
+        # المتحكم ← hub ← المنافذ
+        with self.lock:
+            branches = list(self.branches.items())
+        tree = {}
+        for device_id, branch in branches:
+            node = tree
+            for name in branch:
+                node = node.setdefault(name, {})
+            node[device_id] = None
+        return tree
+
+
+usb_topology = UsbTopology()
+
+
+def list_devices(download_only=False):
+    # pyserial يُستورد عند الحاجة فقط حتى يبقى الوضع النصي سريع الإقلاع
+    import serial.tools.list_ports
+    devices = []
+    for port in serial.tools.list_ports.comports():
+        kind = port_classifier.classify(port)
+        usb_topology.update(port)
+        if download_only and kind != "download":
+            continue
+        device_info = f"{port.device} - {port.description}"
+        if kind == "download":
+            device_info += " [Download Mode]"
+        devices.append((port.device, device_info))
+    return devices
+
+
+def device_identity(com_port):
+    # الرقم التسلسلي عبر USB يبقى ثابتاً حتى لو تغير اسم المنفذ بعد إعادة التوصيل
+    try:
+        import serial.tools.list_ports
+        ports = serial.tools.list_ports.comports()
+    except Exception:
+        return f"port:{com_port}"
+    for port in ports:
+        if port.device != com_port:
+            continue
+        usb_id = f"{port.vid or 0:04X}:{port.pid or 0:04X}"
+        if port.serial_number:
+            return f"usb:{usb_id}:{port.serial_number}"
+        if port.location:
+            return f"usb:{usb_id}@{port.location}"
+        break
+    return f"port:{com_port}"
+
+
+def has_serial_identity(device_id):
+    # بدون رقم تسلسلي تميز الهوية منفذ USB وليس الهاتف، وكثير من محملات الإقلاع لا تعطي رقماً
+    return re.match(r"^usb:[0-9A-F]{4}:[0-9A-F]{4}:", device_id) is not None
+
+
+def usb_port_path(com_port):
+    # رقم الـ bus وسلسلة المنافذ لجهاز المنفذ التسلسلي، لفتح نفس الجهاز مباشرة عبر libusb
+    try:
+        import serial.tools.list_ports
+        ports = serial.tools.list_ports.comports()
+    except Exception:
+        return None
+    for port in ports:
+        if port.device != com_port or not port.location:
+            continue
+        match = USB_LOCATION_RE.match(port.location)
+        if match:
+            bus, path = match.groups()
+            return int(bus), tuple(int(number) for number in path.split("."))
+        break
+    return None
+
+
+class DeviceWatcher:
+    def __init__(self, on_added=None, on_removed=None, poll_interval=2, download_only=False):
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self.poll_interval = poll_interval
+        self.download_only = download_only
+        self.devices = {}
+        self.running = True
+        self.wake_reader, self.wake_writer = socket.socketpair()
+        self.wake_reader.setblocking(False)
+    
+    def open_uevent_socket(self):
+        # أحداث التوصيل من النواة مباشرة (Linux فقط)، وإلا نرجع للاستطلاع الدوري
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+            sock.bind((0, 1))
+            sock.setblocking(False)
+        except (AttributeError, OSError) as e:
+            print(f"Hot-plug events unavailable, falling back to polling: {e}", file=sys.stderr)
+            return None
+        return sock
+    
+    def scan(self):
+        try:
+            current = dict(list_devices(self.download_only))
+        except Exception as e:
+            print(f"Error detecting devices: {e}", file=sys.stderr)
+            return
+        
+        for device_id in list(self.devices):
+            if device_id not in current:
+                del self.devices[device_id]
+                if self.on_removed:
+                    self.on_removed(device_id)
+        for device_id, device_info in current.items():
+            if self.devices.get(device_id) != device_info:
+                self.devices[device_id] = device_info
+                if self.on_added:
+                    self.on_added(device_id, device_info)
+    
+    def rescan(self):
+        self.wake_writer.send(b"\0")
+    
+    def stop(self):
+        self.running = False
+        self.rescan()
+    
+    def drain(self, sock):
+        messages = []
+        while True:
+            try:
+                messages.append(sock.recv(16384))
+            except (BlockingIOError, InterruptedError):
+                return messages
+    
+    def run(self):
+        self.scan()
+        uevent_socket = self.open_uevent_socket()
+        watched = [self.wake_reader]
+        if uevent_socket:
+            watched.append(uevent_socket)
+        timeout = None if uevent_socket else self.poll_interval
+        
+        try:
+            while self.running:
+                readable, _, _ = select.select(watched, [], [], timeout)
+                if not self.running:
+                    break
+                
+                changed = not readable
+                if self.wake_reader in readable:
+                    self.drain(self.wake_reader)
+                    changed = True
+                if uevent_socket in readable:
+                    for message in self.drain(uevent_socket):
+                        if b"\0SUBSYSTEM=tty\0" in message:
+                            changed = True
+                if changed:
+                    self.scan()
+        finally:
+            if uevent_socket:
+                uevent_socket.close()
@@ -0,0 +1,1406 @@
+import os
+import re
+import sys
+import json
+import errno
+import time
+import stat
+import signal
+import atexit
+import asyncio
+import shutil
+import tempfile
+import threading
+import subprocess
+from collections import deque
+from contextlib import asynccontextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_futures
+
+from backup import BackupError, backup_targets, get_backup_store
+from devices import device_identity, has_serial_identity, usb_port_path
+from firmware import (
+    VerificationError, archive_index, cache_dir, firmware_region, firmware_size, format_size, get_firmware_verifier,
+    get_writer_executor, open_firmware, split_bundle_path
+)
+from ledger import get_flash_ledger
+from metrics import JobMetrics, get_metrics_sink
+from oplog import get_operation_log
+from protocol import (
+    DownloadSession, ProtocolError, SessionCancelled, TransferTimeout, UsbTransport, find_pit_entry, mapped_region, parse_pit
+)
+from scheduler import get_transfer_scheduler
+
+DEFAULT_ODIN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Odin", "odin.exe")  # تعديل المسار حسب موقع Odin على جهازك
+
+ODIN_BYTES_RE = re.compile(r"(\d+)\s*/\s*(\d+)")
+ODIN_PERCENT_RE = re.compile(r"(\d{1,3}(?:\.\d+)?)\s*%")
+ODIN_READ_SIZE = 64 * 1024
+ODIN_TAIL_LINES = 50
+CANCEL_SIGNAL_TIMEOUT = 0.1  # مهلة كل إشارة قبل التصعيد SIGINT ثم SIGTERM ثم SIGKILL
+CANCEL_POLL_INTERVAL = 0.01
+SESSION_PART_DONE = 0.99  # نسبة تقدم تكفي لاعتبار الملف مكتوباً قبل انتقال الجلسة للتالي
+STALL_TIMEOUT = 120  # ثوانٍ بدون أي مخرجات من Odin قبل اعتبار العملية عالقة
+ERASE_STALL_TIMEOUT = 600  # مسح NAND قد يستمر دقائق بلا مخرجات
+STALL_RETRIES = 2
+STALL_BACKOFF = 5.0  # تتضاعف مع كل محاولة
+STALL_REAP_TIMEOUT = 5.0
+BACKUP_REPORT_BYTES = 1024 * 1024
+
+# odin: تشغيل odin.exe وقراءة مخرجاته، native: بروتوكول Odin/Loke مباشرة عبر libusb بدون عمليات فرعية
+BACKENDS = ("odin", "native")
+# ملفات داخل أرشيف AP لا تقابل أقساماً في PIT
+NATIVE_SKIPPED_PREFIXES = ("meta-data/",)
+
+# تشغيل Odin في مجموعة عمليات مستقلة حتى يصل الإلغاء إلى كل أبنائه
+if os.name == "nt":
+    ODIN_PROCESS_OPTIONS = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+else:
+    ODIN_PROCESS_OPTIONS = {"start_new_session": True}
+
+# وسائط Odin لكل خانة ملف
+ODIN_SLOT_FLAGS = {
+    "BL File": "-b",
+    "AP File": "-a",
+    "CP File": "-c",
+    "CSC File": "-s",
+    "UMS File": "-u",
+}
+
+
+def member_pattern(name):
+    # الاسم كاملاً فقط: param.bin لا يطابق داخل up_param.bin
+    return re.compile(rf"(?<![\w.-]){re.escape(name)}(?![\w-]|\.\w)", re.IGNORECASE)
+
+
+def parse_odin_progress(line):
+    # يعيد نسبة التقدم (0..1) من سطر مخرجات Odin إن وجدت
+    matches = ODIN_BYTES_RE.findall(line)
+    if matches:
+        done, total = (int(value) for value in matches[-1])
+        if total > 0 and done <= total:
+            return done / total
+    matches = ODIN_PERCENT_RE.findall(line)
+    if matches:
+        percent = float(matches[-1])
+        if 0 <= percent <= 100:
+            return percent / 100
+    return None
+
+
+class FlashCancelled(Exception):
+    def __init__(self, returncode=None):
+        super().__init__("Operation cancelled by user")
+        self.returncode = returncode
+
+
+class FlashStalled(Exception):
+    def __init__(self, phase, window, returncode=None, output=None, reaped=True, source="Odin"):
+        message = f"no output from {source} for {window:g}s during {phase}"
+        if not reaped:
+            message += ", Odin could not be stopped (reconnect the device)"
+        super().__init__(message)
+        self.phase = phase
+        self.returncode = returncode
+        self.output = output
+        self.reaped = reaped
+
+
+def signal_process_tree(process, name):
+    try:
+        if os.name != "nt":
+            os.killpg(process.pid, getattr(signal, name))
+        elif name == "SIGINT":
+            process.send_signal(signal.CTRL_BREAK_EVENT)
+        elif name == "SIGTERM":
+            process.terminate()
+        else:
+            subprocess.run(["taskkill", "/T", "/F", "/PID", str(process.pid)], capture_output=True)
+    except OSError:
+        pass
+
+
+def process_tree_alive(process):
+    if process.returncode is None:
+        return True
+    if os.name == "nt":
+        return False
+    # قد تبقى عمليات أبناء تمسك المنفذ بعد خروج Odin نفسه
+    try:
+        os.killpg(process.pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+async def stop_process_tree(process):
+    for name in ("SIGINT", "SIGTERM", "SIGKILL"):
+        if not process_tree_alive(process):
+            return True
+        signal_process_tree(process, name)
+        deadline = time.monotonic() + CANCEL_SIGNAL_TIMEOUT
+        while process_tree_alive(process) and time.monotonic() < deadline:
+            await asyncio.sleep(CANCEL_POLL_INTERVAL)
+    return not process_tree_alive(process)
+
+
+async def wait_for_future(future):
+    # انتظار نتيجة من خيوط التحقق دون حجز حلقة الأحداث
+    # الأخطاء تُقرأ لاحقاً من المستقبل الأصلي
+    if future is not None and not future.done():
+        try:
+            await asyncio.wrap_future(future)
+        except Exception:
+            pass
+
+
+BUNDLE_COPY_SIZE = 4 * 1024 * 1024
+BUNDLE_STAGE_ROOTS = ("/dev/shm",)  # tmpfs: أعضاء الحزمة تُستخرج إلى الذاكرة وليس القرص
+BUNDLE_STAGE_SHARE = 0.5  # أقصى ما تأخذه الأعضاء المستخرجة من حجم tmpfs، والباقي يُستخرج إلى القرص
+FIFO_OPEN_INTERVAL = 0.05
+
+NETWORK_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs", "9p", "afs", "ceph", "davfs"}
+
+
+def is_network_path(file_path):
+    # الملفات على تخزين شبكي تُنسخ إلى القرص المحلي قبل التفليش
+    if sys.platform == "win32":
+        return os.path.abspath(file_path).startswith("\\\\")
+    try:
+        with open("/proc/mounts", "r", encoding="utf-8") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return False
+    
+    real_path = os.path.realpath(file_path)
+    best_mount, best_type = "", ""
+    for mount_point, fs_type in mounts:
+        mount_point = mount_point.replace("\\040", " ")
+        if (real_path == mount_point or real_path.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) > len(best_mount):
+            best_mount, best_type = mount_point, fs_type
+    return best_type in NETWORK_FILESYSTEMS
+
+
+STAGING_WORKERS = max(4, 2 * (os.cpu_count() or 2))
+staging_executor = None
+
+
+def get_staging_executor():
+    # مجموعة خيوط واحدة مشتركة بين كل الأجهزة بدلاً من مجموعة لكل عملية تفليش
+    global staging_executor
+    if staging_executor is None:
+        staging_executor = ThreadPoolExecutor(max_workers=STAGING_WORKERS, thread_name_prefix="odin4-stage")
+    return staging_executor
+
+
+class StagedMember:
+    def __init__(self, size, root):
+        self.size = size
+        self.root = root
+        self.refs = 1
+        self.future = Future()
+
+
+class BundleStage:
+    def __init__(self, roots=BUNDLE_STAGE_ROOTS, share=BUNDLE_STAGE_SHARE):
+        # كل عضو حزمة يُستخرج مرة واحدة لكل (الحزمة، العضو، وقت التعديل) وتتشاركه كل المهام،
+        # ويُحذف عندما تحرره آخر مهمة
+        self.roots = roots
+        self.share = share
+        self.lock = threading.Lock()
+        self.members = {}
+        self.used = {}
+        self.pending = {}
+        self.directories = {}
+        self.count = 0
+    
+    def acquire(self, file_path):
+        # النتيجة (المفتاح، العضو) لـ release، ومسار النسخة المستخرجة
+        bundle_path, member = split_bundle_path(file_path)
+        stat_result = os.stat(bundle_path)
+        key = (os.path.abspath(bundle_path), member, stat_result.st_size, stat_result.st_mtime_ns)
+        with self.lock:
+            staged = self.members.get(key)
+            owner = staged is None
+            if owner:
+                size = firmware_size(file_path)
+                staged = self.members[key] = StagedMember(size, self.pick_root_locked(size))
+                self.used[staged.root] = self.used.get(staged.root, 0) + size
+                self.pending[staged.root] = self.pending.get(staged.root, 0) + size
+                self.count += 1
+                name = f"{self.count}-{os.path.basename(member)}"
+            else:
+                staged.refs += 1
+        token = (key, staged)
+        if owner:
+            try:
+                staged.future.set_result(self.extract(file_path, staged, name))
+            except BaseException as e:
+                staged.future.set_exception(e)
+                with self.lock:
+                    # المهام التالية تحاول الاستخراج من جديد بدل أن ترث الخطأ
+                    if self.members.get(key) is staged:
+                        del self.members[key]
+            finally:
+                with self.lock:
+                    self.pending[staged.root] -= staged.size
+        try:
+            return token, staged.future.result()
+        except BaseException:
+            self.release(token)
+            raise
+    
+    def pick_root_locked(self, size):
+        # tmpfs فقط إن بقي فيه مكان بعد ما يُستخرج الآن، وبدون تجاوز حصة الحزم منه؛ None يعني مجلد tmp على القرص
+        for root in self.roots:
+            if not os.path.isdir(root):
+                continue
+            usage = shutil.disk_usage(root)
+            if self.used.get(root, 0) + size <= usage.total * self.share and usage.free - self.pending.get(root, 0) > size:
+                return root
+        return None
+    
+    def extract(self, file_path, staged, name):
+        with self.lock:
+            directory = self.directories.get(staged.root)
+            if directory is None:
+                directory = self.directories[staged.root] = tempfile.mkdtemp(prefix="odin4-bundle-", dir=staged.root)
+        path = os.path.join(directory, name)
+        try:
+            with open_firmware(file_path) as source, open(path, "wb") as target:
+                shutil.copyfileobj(source, target, BUNDLE_COPY_SIZE)
+        except BaseException:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        return path
+    
+    def release(self, token):
+        key, staged = token
+        with self.lock:
+            staged.refs -= 1
+            if staged.refs:
+                return
+            if self.members.get(key) is staged:
+                del self.members[key]
+            self.used[staged.root] -= staged.size
+        if staged.future.done() and staged.future.exception() is None:
+            try:
+                os.remove(staged.future.result())
+            except OSError:
+                pass
+    
+    def close(self):
+        with self.lock:
+            directories, self.directories = self.directories, {}
+        for directory in directories.values():
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+bundle_stage = None
+
+
+def get_bundle_stage():
+    global bundle_stage
+    if bundle_stage is None:
+        bundle_stage = BundleStage()
+        atexit.register(bundle_stage.close)
+    return bundle_stage
+
+
+class StagingPipeline:
+    def __init__(self, items, prepare, lookahead=2):
+        # تجهيز الملفات التالية في الخلفية أثناء تفليش الملف الحالي
+        self.items = items
+        self.prepare = prepare
+        self.lookahead = max(lookahead, 1)
+        self.executor = get_staging_executor()
+        self.futures = {}
+        self.next_index = 0
+    
+    def fill(self, current):
+        while self.next_index < len(self.items) and self.next_index <= current + self.lookahead:
+            self.futures[self.next_index] = self.executor.submit(self.prepare, self.next_index, self.items[self.next_index])
+            self.next_index += 1
+    
+    def start(self):
+        self.fill(-1)
+    
+    def get(self, index):
+        self.fill(index)
+        return self.futures.pop(index).result()
+    
+    def taken(self, index):
+        return index < self.next_index and index not in self.futures
+    
+    def close(self):
+        for future in self.futures.values():
+            future.cancel()
+        wait_futures(list(self.futures.values()))
+        self.futures.clear()
+
+
+RATE_SAMPLE_INTERVAL = 0.25
+RATE_SMOOTHING = 0.3  # وزن العينة الأحدث في المتوسط المتحرك الأسي
+RATE_HISTORY_WEIGHT = 0.5  # وزن الجهاز الأخير في السرعات المحفوظة لكل قسم
+REPORT_INTERVAL = 0.5
+
+rate_history_lock = threading.Lock()
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+class RateEstimator:
+    def __init__(self, plan, history_path=None):
+        # plan: لكل ملف بترتيب التفليش (الحجم، [(اسم القسم، موضعه داخل الملف، حجمه)])؛
+        # السرعة تُحفظ لكل قسم لأن system.img وboot.img مثلاً لا يُكتبان بنفس السرعة
+        self.parts = []
+        file_start = 0
+        for size, members in plan:
+            for key, offset, member_size in members:
+                self.parts.append((key, file_start + offset, file_start + offset + member_size))
+            file_start += size
+        self.total = file_start
+        self.history_path = history_path or os.path.join(cache_dir(), "transfer_rates.json")
+        self.history = self.load_history()
+        self.start_time = time.monotonic()
+        self.part = None
+        self.rate = None
+        self.sample_time = self.start_time
+        self.sample_bytes = 0
+        self.part_start = None
+        self.measured = {}
+    
+    def load_history(self):
+        try:
+            with open(self.history_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def locate(self, done_bytes, first=0):
+        # القسم الذي يقع فيه الموضع، أو الذي يليه إن كان الموضع في ترويسة tar بين قسمين
+        return next((index for index in range(first, len(self.parts)) if done_bytes < self.parts[index][2]), None)
+    
+    def enter(self, part, done_bytes):
+        self.finish_partition(done_bytes)
+        if part is None:
+            return
+        now = time.monotonic()
+        self.part = part
+        self.part_start = (now, done_bytes)
+        self.sample_time, self.sample_bytes = now, done_bytes
+        # السرعة المحفوظة من الأجهزة السابقة تعطي تقديراً صحيحاً من أول ثانية؛
+        # بعد أول عينة حية تُدمج فيها كعينة عادية، فقياس هذا الجهاز لا يضيع عند كل قسم
+        saved = self.history.get(self.parts[part][0])
+        if saved:
+            self.rate = saved if self.rate is None else RATE_SMOOTHING * saved + (1 - RATE_SMOOTHING) * self.rate
+    
+    def start_partition(self, done_bytes):
+        self.enter(self.locate(done_bytes), done_bytes)
+    
+    def finish_partition(self, done_bytes):
+        if self.part is None:
+            return
+        start_time, start_bytes = self.part_start
+        elapsed = time.monotonic() - start_time
+        if elapsed > 0 and done_bytes > start_bytes:
+            self.measured[self.parts[self.part][0]] = (done_bytes - start_bytes) / elapsed
+        self.part = None
+    
+    def update(self, done_bytes):
+        if self.part is not None and done_bytes >= self.parts[self.part][2]:
+            self.enter(self.locate(done_bytes, self.part), done_bytes)
+        now = time.monotonic()
+        elapsed = now - self.sample_time
+        if elapsed < RATE_SAMPLE_INTERVAL or done_bytes <= self.sample_bytes:
+            return
+        sample = (done_bytes - self.sample_bytes) / elapsed
+        self.rate = sample if self.rate is None else RATE_SMOOTHING * sample + (1 - RATE_SMOOTHING) * self.rate
+        self.sample_time, self.sample_bytes = now, done_bytes
+    
+    def time_remaining(self, done_bytes):
+        if self.part is None or not self.rate:
+            return None
+        current_left = max(self.parts[self.part][2] - done_bytes, 0)
+        seconds = current_left / self.rate
+        members_left = current_left
+        for key, start, end in self.parts[self.part + 1:]:
+            seconds += (end - start) / (self.history.get(key) or self.rate)
+            members_left += end - start
+        # ترويسات tar وما بين الأقسام بالسرعة الحالية
+        return seconds + max(self.total - done_bytes - members_left, 0) / self.rate
+    
+    def describe(self, done_bytes):
+        self.update(done_bytes)
+        elapsed = format_duration(time.monotonic() - self.start_time)
+        remaining = self.time_remaining(done_bytes)
+        if remaining is None:
+            return f"Calculating... (elapsed {elapsed})"
+        return f"{format_duration(remaining)} ({self.rate / (1024 * 1024):.1f} MB/s, elapsed {elapsed})"
+    
+    def save(self, done_bytes):
+        self.finish_partition(done_bytes)
+        if not self.measured:
+            return
+        with rate_history_lock:
+            history = self.load_history()
+            for key, rate in self.measured.items():
+                previous = history.get(key)
+                history[key] = rate if previous is None else RATE_HISTORY_WEIGHT * rate + (1 - RATE_HISTORY_WEIGHT) * previous
+            temp_path = f"{self.history_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(history, f)
+            os.replace(temp_path, self.history_path)
+
+
+class FlashEngine:
+    def __init__(self, on_progress=None):
+        self.on_progress = on_progress
+        self.files_to_flash = []
+        self.com_port = ""
+        self.reboot = False
+        self.nand_erase = False
+        self.single_session = True
+        self.verify = True
+        self.resume = False
+        self.stage_lookahead = 2
+        self.stage_dirs = {}
+        self.stage_lock = threading.Lock()
+        self.bundle_stage = None
+        self.shared_stages = {}
+        self.bundle_stream = False
+        self.streams = {}
+        self.stall_timeout = STALL_TIMEOUT
+        self.stall_retries = STALL_RETRIES
+        self.stall_backoff = STALL_BACKOFF
+        self.backend = "odin"
+        self.transport_factory = None
+        self.backup_partitions = ()
+        self.backup_store = None
+        self.native_open = None
+        self.metrics_sink = None
+        self.operation_log = None
+        self.last_logged = None
+        self.flash_ledger = None
+        self.scheduler = None
+        self.odin_path = DEFAULT_ODIN_PATH
+        self.cancel_event = threading.Event()
+        self.process = None
+        self.loop = None
+        self.task = None
+        self.interrupted_phase = None
+        self.stalled_phase = None
+        self.job_metrics = None
+        
+    def configure(self, com_port, files_to_flash, reboot, nand_erase, single_session=True, verify=True, resume=False):
+        self.com_port = com_port
+        self.files_to_flash = files_to_flash
+        self.reboot = reboot
+        self.nand_erase = nand_erase
+        self.single_session = single_session
+        self.verify = verify
+        self.resume = resume
+        self.cancel_event.clear()
+    
+    def cancel(self):
+        # آمنة من أي خيط: إلغاء مهمة asyncio يوقف Odin وأبناءه ثم يكمل run_async() التنظيف
+        self.cancel_event.set()
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self.cancel_task)
+    
+    def cancel_task(self):
+        if self.task is not None:
+            self.task.cancel()
+    
+    def kill(self):
+        # إيقاف فوري بدون انتظار الحلقة، عند إغلاق البرنامج مثلاً
+        self.cancel()
+        process = self.process
+        if process is not None:
+            signal_process_tree(process, "SIGKILL")
+    
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise FlashCancelled()
+    
+    def current_phase(self):
+        if self.span is None:
+            return "startup"
+        if self.span.partition:
+            return f"{self.span.phase} ({self.span.partition})"
+        return self.span.phase
+    
+    def log(self, text):
+        (self.operation_log or get_operation_log()).write(self.com_port, text)
+    
+    def report(self, progress, operation, time_remaining):
+        # كل مرحلة تُسجل مرة واحدة، وتحديثات النسبة داخلها لا تملأ السجل
+        if operation != self.last_logged:
+            self.last_logged = operation
+            self.log(operation)
+        if self.on_progress:
+            self.on_progress(progress, operation, time_remaining)
+    
+    def stall_window(self):
+        if not self.stall_timeout:
+            return None
+        if self.span is not None and self.span.phase == "erase":
+            return max(self.stall_timeout, ERASE_STALL_TIMEOUT)
+        return self.stall_timeout
+    
+    async def run_odin(self, command, on_line=None):
+        # تشغيل Odin وقراءة المخرجات تدريجياً بدلاً من انتظار انتهاء العملية
+        tail = deque(maxlen=ODIN_TAIL_LINES)
+        self.check_cancelled()
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            **ODIN_PROCESS_OPTIONS
+        )
+        self.process = process
+        self.log(f"Running {subprocess.list2cmdline(command)} (pid {process.pid})")
+        pending = b""
+        stalled = None
+        stopped = False
+        try:
+            while True:
+                window = self.stall_window()
+                try:
+                    chunk = await asyncio.wait_for(process.stdout.read(ODIN_READ_SIZE), window)
+                except asyncio.TimeoutError:
+                    # لا مخرجات خلال المهلة (كابل متقطع أو جهاز معلق): نوقف Odin بدلاً من حجز المنفذ للأبد
+                    stalled = window
+                    break
+                if not chunk:
+                    break
+                pending += chunk
+                # Odin يحدّث سطر التقدم باستخدام \r لذلك نقسم على \r و \n معاً
+                parts = re.split(rb"[\r\n]", pending)
+                pending = parts.pop()
+                if len(pending) > ODIN_READ_SIZE:
+                    parts.append(pending)
+                    pending = b""
+                for part in parts:
+                    line = part.decode(errors="replace").strip()
+                    if not line:
+                        continue
+                    tail.append(line)
+                    self.log(line)
+                    if on_line:
+                        on_line(line)
+            if stalled is not None:
+                stopped = await stop_process_tree(process)
+            elif pending.strip():
+                line = pending.decode(errors="replace").strip()
+                tail.append(line)
+                self.log(line)
+                if on_line:
+                    on_line(line)
+        except asyncio.CancelledError:
+            self.cancel_event.set()
+            await stop_process_tree(process)
+        except BaseException:
+            await stop_process_tree(process)
+            raise
+        finally:
+            if stalled is None:
+                returncode = await process.wait()
+            else:
+                # عملية عالقة في التعريف قد لا تخرج حتى بعد SIGKILL، فلا ننتظرها بلا حد
+                try:
+                    returncode = await asyncio.wait_for(process.wait(), STALL_REAP_TIMEOUT)
+                except asyncio.TimeoutError:
+                    returncode = None
+            self.process = None
+        if stalled is not None:
+            self.log(f"No output for {stalled:g}s, odin killed (exit code {returncode})")
+        else:
+            self.log(f"Odin exited with code {returncode}")
+        
+        self.last_output = "\n".join(tail)
+        if self.cancel_event.is_set():
+            raise FlashCancelled(returncode)
+        if stalled is not None:
+            raise FlashStalled(self.current_phase(), stalled, returncode, self.last_output, stopped and returncode is not None)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, command, stderr=self.last_output)
+        return self.last_output
+    
+    def archive_members(self):
+        return [
+            [(os.path.basename(entry.name), entry.offset, entry.size) for entry in archive_index.entries(file_path) or []]
+            for _, file_path in self.files_to_flash
+        ]
+    
+    def file_size(self, file_path):
+        try:
+            return max(firmware_size(file_path), 1)
+        except OSError:
+            return 1
+        
+    def odin_command(self, *args):
+        # odin_path قد يكون مساراً واحداً أو أمراً كاملاً (مثل محاكي Odin في اختبارات الأداء)
+        if isinstance(self.odin_path, (list, tuple)):
+            return list(self.odin_path) + list(args)
+        return [self.odin_path] + list(args)
+    
+    def slot_flag(self, label):
+        return ODIN_SLOT_FLAGS.get(label, "-a")
+    
+    def session_command(self):
+        command = self.odin_command("-d", self.com_port)
+        for index, ((label, _), file_path) in enumerate(zip(self.files_to_flash, self.flash_paths)):
+            if index not in self.written:
+                command += [self.slot_flag(label), file_path]
+        if self.nand_erase and not self.erased:
+            command.append("--nand-erase")
+        if self.reboot:
+            command.append("--reboot")
+        return command
+        
+    def run(self):
+        # نسخة متزامنة لمن يشغّل جهازاً واحداً خارج حلقة أحداث
+        return asyncio.run(self.run_async())
+    
+    async def run_async(self):
+        self.job_metrics = None
+        if not self.com_port or self.com_port == "No device detected":
+            return False, "No device selected!"
+            
+        if not self.files_to_flash:
+            return False, "No files selected for flashing!"
+        
+        self.interrupted_phase = None
+        self.stalled_phase = None
+        self.streams = {}
+        self.written = set()
+        self.erased = False
+        self.content_hashes = [self.content_hash_future(file_path) for _, file_path in self.files_to_flash]
+        self.recorded = set()
+        self.loop = asyncio.get_running_loop()
+        self.task = asyncio.current_task()
+        # تعداد المنافذ قد يستغرق وقتاً، ومئات الجلسات تتشارك نفس الحلقة
+        try:
+            self.device_id = await asyncio.to_thread(device_identity, self.com_port)
+        except asyncio.CancelledError:
+            self.task = None
+            self.interrupted_phase = "startup"
+            return False, f"Operation cancelled by user during {self.interrupted_phase}."
+        if self.resume and not self.nand_erase and not has_serial_identity(self.device_id):
+            # قد يكون هاتفاً آخر على نفس المنفذ، فلا نتخطى شيئاً بناءً على سجل المنفذ
+            self.report(0, "Resume disabled: the device reports no USB serial number, flashing all files", "Calculating...")
+        elif self.resume and not self.nand_erase:
+            try:
+                self.files_to_flash, skipped = await self.skip_written_files()
+            except (FlashCancelled, asyncio.CancelledError):
+                self.task = None
+                self.interrupted_phase = "resume check"
+                return False, f"Operation cancelled by user during {self.interrupted_phase}."
+            if not self.files_to_flash:
+                self.task = None
+                return True, "All partitions are already written on this device, nothing to flash."
+            if skipped:
+                self.report(0, f"Resuming: skipping {', '.join(skipped)} (already written)", "Calculating...")
+        
+        # توزيع نسبة التفليش حسب حجم كل ملف بدلاً من عدد الملفات
+        self.sizes = [self.file_size(file_path) for _, file_path in self.files_to_flash]
+        self.total_bytes = sum(self.sizes)
+        self.flash_start = 10
+        # النسخ الاحتياطي يأخذ النصف الأول من نطاق الإعداد، والتجهيز ما بعده
+        self.backup_share = self.flash_start // 2 if self.backup_partitions else 0
+        self.flash_span = 85 if self.reboot else 90
+        self.flash_paths = [file_path for _, file_path in self.files_to_flash]
+        # أقسام كل أرشيف تُقرأ مرة واحدة خارج الحلقة، لتقدير السرعة ولمتابعة مخرجات الجلسة
+        try:
+            self.members = await asyncio.to_thread(self.archive_members)
+        except asyncio.CancelledError:
+            self.task = None
+            self.interrupted_phase = "startup"
+            return False, f"Operation cancelled by user during {self.interrupted_phase}."
+        self.rates = RateEstimator([
+            (size, members or [(os.path.basename(file_path), 0, size)])
+            for (_, file_path), size, members in zip(self.files_to_flash, self.sizes, self.members)
+        ])
+        self.done_bytes = 0
+        self.last_report = (None, 0.0)
+        self.last_output = None
+        self.job_metrics = JobMetrics(self.com_port)
+        self.span = None
+        self.last_logged = None
+        self.log(f"Job {self.job_metrics.job_id}: {', '.join(f'{label}={file_path}' for label, file_path in self.files_to_flash)} (backend {self.backend})")
+        exit_code = stderr_tail = None
+        
+        # في الجلسة الواحدة نحتاج كل الملفات قبل البدء، فنجهزها كلها بالتوازي
+        lookahead = len(self.files_to_flash) if self.single_session else self.stage_lookahead
+        self.pipeline = StagingPipeline(self.files_to_flash, self.prepare_file, lookahead)
+        
+        try:
+            self.pipeline.start()
+            if self.backup_partitions:
+                # النسخ الاحتياطي يقرأ من USB بينما التحقق والتجهيز يعملان على القرص في خيوطهما
+                await self.backup_device()
+            await self.flash_with_retries()
+            
+            self.report(100, "Operation completed successfully", "00:00")
+            success, message = True, "Flashing completed successfully!"
+            exit_code, stderr_tail = 0, self.last_output
+            
+        except (FlashCancelled, asyncio.CancelledError) as e:
+            self.interrupted_phase = self.current_phase()
+            success, message = False, f"Operation cancelled by user during {self.interrupted_phase}."
+            exit_code, stderr_tail = getattr(e, "returncode", None), self.last_output
+        except FlashStalled as e:
+            # تعليق الجهاز فشل وليس إلغاءً من المستخدم، فلا يُحفظ في interrupted_phase
+            self.stalled_phase = e.phase
+            success, message = False, f"Flashing stalled: {str(e)}"
+            exit_code, stderr_tail = e.returncode, e.output
+        except VerificationError as e:
+            success, message = False, f"Verification failed: {str(e)}"
+        except BackupError as e:
+            success, message = False, f"Backup failed: {str(e)}. Nothing was flashed."
+        except subprocess.CalledProcessError as e:
+            success, message = False, f"Flashing failed: {e.stderr}"
+            exit_code, stderr_tail = e.returncode, e.stderr
+        except Exception as e:
+            success, message = False, f"Flashing failed: {str(e)}"
+        finally:
+            # بعد هذه النقطة لا يُلغى التنظيف حتى لو وصل طلب إلغاء متأخر
+            self.task = None
+            if self.native_open is not None:
+                # جلسة النسخ الاحتياطي لم يستلمها التفليش (فشل التحقق مثلاً)
+                self.native_open[0].close()
+                self.native_open = None
+            try:
+                self.rates.save(self.done_bytes)
+            except OSError as e:
+                print(f"Error saving transfer rates: {e}", file=sys.stderr)
+            if self.cancel_event.is_set():
+                # لا ننتظر تحققاً أو نسخاً جارياً حتى يصل الإلغاء فوراً
+                threading.Thread(target=self.close_pipeline, args=(self.pipeline,), daemon=True).start()
+            else:
+                await asyncio.to_thread(self.close_pipeline, self.pipeline)
+        
+        await asyncio.wrap_future(get_writer_executor().submit(self.record_metrics, success, message, exit_code, stderr_tail))
+        self.log(f"Job {self.job_metrics.job_id}: {message}")
+        (self.operation_log or get_operation_log()).flush()
+        return success, message
+    
+    async def flash_with_retries(self):
+        # بعد التعليق نعيد المحاولة بانتظار متزايد، بدءاً من أول قسم لم يكتمل
+        attempt = 0
+        while True:
+            try:
+                if self.backend == "native":
+                    await self.flash_native()
+                elif self.single_session:
+                    await self.flash_session()
+                else:
+                    await self.flash_files()
+                return
+            except FlashStalled as e:
+                if self.span is not None:
+                    self.span.stalled = True
+                    self.end_span(e.returncode, e.output)
+                if not e.reaped or attempt >= self.stall_retries:
+                    raise
+                attempt += 1
+                delay = self.stall_backoff * 2 ** (attempt - 1)
+                self.start_span("backoff")
+                self.report(
+                    self.flash_progress(self.done_bytes),
+                    f"Odin stalled during {e.phase}, retrying in {delay:g}s (retry {attempt} of {self.stall_retries})",
+                    "Retrying..."
+                )
+                await self.restage_streams()
+                await asyncio.sleep(delay)
+    
+    async def restage_streams(self):
+        # الـ FIFO يُقرأ مرة واحدة، فالملفات التي لم تُكتب تحتاج FIFO جديداً للمحاولة التالية
+        for index, ((label, file_path), flash_path) in enumerate(zip(self.files_to_flash, self.flash_paths)):
+            if index in self.written or index not in self.streams or not self.pipeline.taken(index):
+                continue
+            self.streams.pop(index).set()
+            if os.path.exists(flash_path) and stat.S_ISFIFO(os.stat(flash_path).st_mode):
+                os.remove(flash_path)
+            self.flash_paths[index] = await asyncio.to_thread(self.prepare_file, index, (label, file_path))
+    
+    def close_pipeline(self, pipeline):
+        pipeline.close()
+        for stop in list(self.streams.values()):
+            stop.set()
+        with self.stage_lock:
+            stage_dirs, self.stage_dirs = self.stage_dirs, {}
+            shared_stages, self.shared_stages = self.shared_stages, {}
+        for stage_dir in stage_dirs.values():
+            shutil.rmtree(stage_dir, ignore_errors=True)
+        for token in shared_stages.values():
+            (self.bundle_stage or get_bundle_stage()).release(token)
+    
+    def start_span(self, phase, partition=None):
+        self.end_span()
+        self.span = self.job_metrics.start(phase, partition, self.done_bytes)
+    
+    def end_span(self, exit_code=None, stderr_tail=None):
+        if self.span is not None:
+            self.span.finish(self.done_bytes, exit_code, stderr_tail)
+            self.span = None
+    
+    def record_metrics(self, success, message, exit_code, stderr_tail):
+        self.job_metrics.finish(success, message, self.done_bytes, exit_code, stderr_tail)
+        try:
+            (self.metrics_sink or get_metrics_sink()).record(self.job_metrics)
+        except OSError as e:
+            self.log(f"Error writing flash metrics: {e}")
+    
+    def content_hash_future(self, file_path):
+        try:
+            return get_firmware_verifier().content_hash_future(file_path)
+        except OSError:
+            return None
+    
+    def content_hash(self, index):
+        future = self.content_hashes[index]
+        if future is None or not future.done() or future.cancelled() or future.exception() is not None:
+            return None
+        return future.result()
+    
+    async def skip_written_files(self):
+        # وضع الاستكمال: لا نرسل إلا الأقسام التي لم تُكتب بنفس المحتوى على هذا الجهاز
+        ledger = self.flash_ledger or get_flash_ledger()
+        slots = await asyncio.wrap_future(get_writer_executor().submit(ledger.slots, self.device_id))
+        remaining, hashes, skipped = [], [], []
+        for index, (label, file_path) in enumerate(self.files_to_flash):
+            future = self.content_hashes[index]
+            await wait_for_future(future)
+            entry = slots.get(label)
+            if entry is not None and entry["hash"] == self.content_hash(index):
+                skipped.append(label)
+            else:
+                remaining.append((label, file_path))
+                hashes.append(future)
+        self.content_hashes = hashes
+        return remaining, skipped
+    
+    def update_ledger(self, action, *args):
+        if not has_serial_identity(self.device_id):
+            return
+        ledger = self.flash_ledger or get_flash_ledger()
+        get_writer_executor().submit(self.write_ledger, ledger, action, self.device_id, args)
+    
+    def write_ledger(self, ledger, action, device_id, args):
+        # الملف يُقرأ ويُعاد كتابته كاملاً في كل تعديل، لذلك في خيط السجل وليس في الحلقة
+        try:
+            getattr(ledger, action)(device_id, *args)
+        except OSError as e:
+            self.log(f"Error updating flash ledger: {e}")
+    
+    def record_written(self, index):
+        self.written.add(index)
+        if index in self.recorded:
+            return
+        content_hash = self.content_hash(index)
+        if content_hash is not None:
+            label, file_path = self.files_to_flash[index]
+            self.update_ledger("record", label, content_hash, file_path)
+            self.recorded.add(index)
+    
+    def verify_file(self, label, file_path, source_path=None):
+        if self.verify:
+            result = get_firmware_verifier().verify(file_path, source_path)
+            if result is not None and not result["ok"]:
+                raise VerificationError(f"{label} ({os.path.basename(file_path)}): {result['message']}")
+    
+    def prepare_file(self, index, item):
+        label, file_path = item
+        bundle_path, member = split_bundle_path(file_path)
+        if member is None:
+            self.verify_file(label, file_path)
+            if not is_network_path(file_path):
+                return file_path
+            staged_path = os.path.join(self.stage_dir(), f"{index}-{os.path.basename(file_path)}")
+            shutil.copyfile(file_path, staged_path)
+            return staged_path
+        
+        # البروتوكول المباشر يقرأ العضو غير المضغوط من داخل الـ zip عبر mmap
+        if self.backend == "native" and firmware_region(file_path) is not None:
+            self.verify_file(label, file_path)
+            return file_path
+        
+        # عضو داخل حزمة zip: إما FIFO يُغذى مباشرة من الأرشيف، أو نسخة مستخرجة مشتركة بين المهام
+        if self.bundle_stream and self.backend == "odin" and hasattr(os, "mkfifo"):
+            self.verify_file(label, file_path)
+            fifo_path = os.path.join(self.stage_dir(), f"{index}-{os.path.basename(member)}")
+            os.mkfifo(fifo_path, 0o600)
+            stop = self.streams[index] = threading.Event()
+            threading.Thread(target=self.stream_member, args=(file_path, fifo_path, stop),
+                             name="odin4-bundle-stream", daemon=True).start()
+            return fifo_path
+        
+        token, staged_path = (self.bundle_stage or get_bundle_stage()).acquire(file_path)
+        with self.stage_lock:
+            self.shared_stages[index] = token
+        # التحقق يقرأ النسخة المستخرجة بدل فك ضغط العضو مرة ثانية
+        self.verify_file(label, file_path, staged_path)
+        return staged_path
+    
+    def stage_dir(self):
+        with self.stage_lock:
+            stage_dir = self.stage_dirs.get(None)
+            if stage_dir is None:
+                stage_dir = self.stage_dirs[None] = tempfile.mkdtemp(prefix="odin4-stage-")
+        return stage_dir
+    
+    def stream_member(self, file_path, fifo_path, stop):
+        # الكتابة تبدأ عندما يفتح Odin الـ FIFO للقراءة، وتتوقف إن انتهت العملية قبل ذلك
+        while True:
+            try:
+                fd = os.open(fifo_path, os.O_WRONLY | os.O_NONBLOCK)
+                break
+            except OSError as e:
+                if e.errno != errno.ENXIO or stop.wait(FIFO_OPEN_INTERVAL):
+                    return
+        os.set_blocking(fd, True)
+        try:
+            with open(fd, "wb") as target, open_firmware(file_path) as source:
+                shutil.copyfileobj(source, target, BUNDLE_COPY_SIZE)
+        except BrokenPipeError:
+            pass
+        except Exception as e:
+            self.log(f"Error streaming {file_path}: {e}")
+    
+    async def wait_for_file(self, index):
+        label, file_path = self.files_to_flash[index]
+        if self.pipeline.taken(index):
+            return self.flash_paths[index]
+        self.pipeline.fill(index)
+        future = self.pipeline.futures[index]
+        if not future.done():
+            self.start_span("prepare", label)
+            self.report(
+                self.preparing_progress(index),
+                f"Preparing: {label} ({os.path.basename(file_path)})",
+                "Calculating..."
+            )
+            await wait_for_future(future)
+        self.flash_paths[index] = self.pipeline.get(index)
+        return self.flash_paths[index]
+    
+    def preparing_progress(self, index):
+        # قبل إرسال أي بايت يبقى التقدم في نطاق التجهيز، ونسبة النقل للبايتات المرسلة فعلاً
+        if self.done_bytes:
+            return self.flash_progress(self.done_bytes)
+        return self.backup_share + (self.flash_start - self.backup_share) * sum(self.sizes[:index]) // self.total_bytes
+    
+    @asynccontextmanager
+    async def transfer_slot(self, size, progress=None):
+        # النقل ينتظر مكاناً على فرع USB الخاص بالجهاز (المتحكم والـ hub) حتى لا تتقاسم أجهزة كثيرة نفس السرعة
+        scheduler = self.scheduler or get_transfer_scheduler()
+        if not scheduler.has_room(self.com_port):
+            self.start_span("usb wait")
+            self.report(self.flash_progress(self.done_bytes) if progress is None else progress, "Waiting for USB bandwidth...", "Queued")
+        slot = await scheduler.acquire(self.com_port, size)
+        start_bytes = self.done_bytes
+        try:
+            yield
+        finally:
+            scheduler.release(slot, self.done_bytes - start_bytes)
+    
+    def release_file(self, index):
+        with self.stage_lock:
+            token = self.shared_stages.pop(index, None)
+        if token is not None:
+            (self.bundle_stage or get_bundle_stage()).release(token)
+            return
+        staged_path = self.flash_paths[index]
+        if staged_path != self.files_to_flash[index][1]:
+            os.remove(staged_path)
+    
+    def flash_progress(self, done_bytes):
+        return self.flash_start + int(self.flash_span * done_bytes / self.total_bytes)
+    
+    def report_transfer(self, done_bytes, operation, force=False):
+        # بعد إعادة المحاولة يُرسل الملف من أوله، لكن التقدم لا يرجع إلى الخلف قبل أن يتجاوز ما وصل إليه
+        done_bytes = max(done_bytes, self.done_bytes)
+        self.done_bytes = done_bytes
+        progress = self.flash_progress(done_bytes)
+        now = time.monotonic()
+        last_progress, last_time = self.last_report
+        if force or progress != last_progress or now - last_time >= REPORT_INTERVAL:
+            self.last_report = (progress, now)
+            self.report(progress, operation, self.rates.describe(done_bytes))
+    
+    async def flash_session(self):
+        # جلسة Odin واحدة لكل الملفات بدلاً من عملية لكل ملف،
+        # وأسماء الملفات داخل كل أرشيف تساعد على معرفة القسم الجاري تفليشه
+        slots = []
+        for (_, file_path), size, members in zip(self.files_to_flash, self.sizes, self.members):
+            slots.append([(os.path.basename(file_path), 0, size)] + members)
+        patterns = {name: member_pattern(name) for parts in slots for name, _, _ in parts}
+        # بعد إعادة المحاولة تبدأ الجلسة من أول ملف لم يُكتب
+        first = min(set(range(len(slots))) - self.written, default=len(slots))
+        active = -1
+        part = None
+        last_fraction = 0.0
+        
+        def activate(index):
+            nonlocal active, part, last_fraction
+            if active >= 0 and last_fraction >= SESSION_PART_DONE:
+                # البصمة تُسجل هنا فقط إن كانت جاهزة، والباقي بعد نهاية الجلسة
+                self.record_written(active)
+            active = index
+            part = slots[index][0]
+            last_fraction = 0.0
+            self.erased = True
+            self.done_bytes = max(self.done_bytes, sum(self.sizes[:index]))
+            self.start_span("transfer", self.files_to_flash[index][0])
+            self.rates.start_partition(self.done_bytes)
+            self.report_transfer(
+                sum(self.sizes[:index]),
+                f"Flashing: {self.files_to_flash[index][0]} ({os.path.basename(self.files_to_flash[index][1])})",
+                force=True
+            )
+        
+        def on_line(line):
+            nonlocal part, last_fraction
+            lower = line.lower()
+            for index in range(max(active, first), len(slots)):
+                matched = next((candidate for candidate in slots[index] if patterns[candidate[0]].search(line)), None)
+                if matched:
+                    if index != active:
+                        activate(index)
+                    if matched is not part:
+                        part = matched
+                        last_fraction = 0.0
+                    break
+            
+            if self.reboot and active == len(slots) - 1 and "reboot" in lower:
+                if self.span.phase != "reboot":
+                    self.done_bytes = self.total_bytes
+                    self.rates.finish_partition(self.total_bytes)
+                    self.start_span("reboot")
+                    self.report(95, "Rebooting device", "In progress...")
+                return
+            
+            fraction = parse_odin_progress(line)
+            if fraction is None:
+                return
+            if active < 0:
+                if first == len(slots):
+                    return
+                activate(first)
+            elif fraction + 0.5 < last_fraction and part is slots[active][0] and active + 1 < len(slots):
+                # عودة النسبة للصفر تعني انتقال Odin إلى الملف التالي
+                activate(active + 1)
+            last_fraction = fraction
+            
+            name, offset, size = part
+            self.report_transfer(
+                sum(self.sizes[:active]) + offset + size * fraction,
+                f"Flashing: {self.files_to_flash[active][0]} ({name})"
+            )
+        
+        for index in range(first, len(self.files_to_flash)):
+            await self.wait_for_file(index)
+        
+        async with self.transfer_slot(sum(self.sizes[first:])):
+            self.update_ledger("forget", [label for label, _ in self.files_to_flash[first:]])
+            if self.nand_erase and not self.erased:
+                self.update_ledger("clear")
+                self.start_span("erase")
+                self.report(5, "Performing NAND Erase", "In progress...")
+            elif first == len(self.files_to_flash):
+                self.start_span("reboot")
+                self.report(95, "Rebooting device", "In progress...")
+            else:
+                self.start_span("setup")
+                self.report(self.flash_progress(self.done_bytes), "Starting flash session", "In progress...")
+            
+            output = await self.run_odin(self.session_command(), on_line)
+        for index in range(len(self.files_to_flash)):
+            await wait_for_future(self.content_hashes[index])
+            self.record_written(index)
+        if self.span.phase == "transfer":
+            self.done_bytes = self.total_bytes
+        self.end_span(0, output)
+    
+    async def flash_files(self):
+        # مسح NAND إذا تم تحديده
+        if self.nand_erase and not self.erased:
+            self.report(0, "Preparing NAND Erase", "Calculating...")
+            command = self.odin_command("-d", self.com_port, "--nand-erase")
+            self.report(5, "Performing NAND Erase", "In progress...")
+            self.update_ledger("clear")
+            self.start_span("erase")
+            self.end_span(0, await self.run_odin(command))
+            self.erased = True
+            self.report(10, "NAND Erase Completed", "00:00")
+            
+        # تفليش كل ملف
+        done_bytes = 0
+        for index, ((label, file_path), size) in enumerate(zip(self.files_to_flash, self.sizes)):
+            if index in self.written:
+                done_bytes += size
+                continue
+            flash_path = await self.wait_for_file(index)
+            async with self.transfer_slot(size):
+                file_name = os.path.basename(file_path)
+                operation = f"Flashing: {label} ({file_name})"
+                self.start_span("transfer", label)
+                self.rates.start_partition(max(done_bytes, self.done_bytes))
+                self.report_transfer(done_bytes, operation, force=True)
+                
+                # Odin يعطي نسبة كل قسم داخل الأرشيف، لا نسبة الملف كله
+                parts = [(member_pattern(name), offset, part_size) for name, offset, part_size in [(file_name, 0, size)] + self.members[index]]
+                part = parts[0]
+                
+                def on_line(line):
+                    nonlocal part
+                    part = next((candidate for candidate in parts if candidate[0].search(line)), part)
+                    fraction = parse_odin_progress(line)
+                    if fraction is None:
+                        return
+                    _, offset, part_size = part
+                    self.report_transfer(done_bytes + offset + part_size * fraction, operation)
+                
+                # افتراض وسائط Odin (قد تحتاج تعديلها حسب النسخة)
+                command = self.odin_command(self.slot_flag(label), flash_path, "-d", self.com_port)
+                self.update_ledger("forget", [label])
+                output = await self.run_odin(command, on_line)
+            await wait_for_future(self.content_hashes[index])
+            self.record_written(index)
+            self.release_file(index)
+            
+            done_bytes += size
+            self.rates.finish_partition(done_bytes)
+            self.report_transfer(done_bytes, f"Flashed: {label} ({file_name})", force=True)
+            self.end_span(0, output)
+        
+        # إعادة تشغيل الجهاز إذا تم تحديده
+        if self.reboot:
+            self.report(95, "Rebooting device", "In progress...")
+            reboot_command = self.odin_command("-d", self.com_port, "--reboot")
+            self.start_span("reboot")
+            self.end_span(0, await self.run_odin(reboot_command))
+
+    def native_parts(self, index):
+        # (اسم الملف داخل الأرشيف، الملف على القرص، موضع البداية، الحجم، موضع الملف في تقدم الجلسة)
+        label, file_path = self.files_to_flash[index]
+        flash_path = self.flash_paths[index]
+        path, base = firmware_region(flash_path)
+        entries = archive_index.entries(flash_path)
+        if not entries:
+            # ملف صورة واحد وليس أرشيف tar
+            return [(os.path.basename(file_path), path, base, firmware_size(flash_path), 0)]
+        parts = []
+        for entry in entries:
+            if entry.size == 0 or entry.name.startswith(NATIVE_SKIPPED_PREFIXES):
+                continue
+            if entry.compression == "lz4":
+                raise ProtocolError(f"{label}: {entry.name} is LZ4-compressed, flash it with the odin backend")
+            parts.append((entry.name, path, base + entry.offset, entry.size, entry.offset))
+        return parts
+    
+    def open_transport(self):
+        if self.transport_factory is not None:
+            return self.transport_factory(self.com_port)
+        return UsbTransport(usb_port_path(self.com_port), self.stall_window())
+    
+    async def flash_native(self):
+        if self.nand_erase:
+            raise ProtocolError("NAND erase is only supported by the odin backend")
+        first = min(set(range(len(self.files_to_flash))) - self.written, default=len(self.files_to_flash))
+        for index in range(first, len(self.files_to_flash)):
+            await self.wait_for_file(index)
+        plan = [(index, self.native_parts(index)) for index in range(first, len(self.files_to_flash))]
+        
+        async with self.transfer_slot(sum(self.sizes[first:])):
+            self.update_ledger("forget", [label for label, _ in self.files_to_flash[first:]])
+            self.start_span("setup")
+            self.report(self.flash_progress(self.done_bytes), "Starting flash session", "In progress...")
+            try:
+                await self.run_native(self.native_session, plan)
+            except TransferTimeout as e:
+                raise FlashStalled(self.current_phase(), e.timeout, source="the device")
+        
+        for index in range(len(self.files_to_flash)):
+            await wait_for_future(self.content_hashes[index])
+            self.record_written(index)
+        self.done_bytes = self.total_bytes
+        self.end_span(0)
+    
+    async def run_native(self, session, *args):
+        # الجلسة تعمل في خيط لأن نقل USB متزامن، والتقدم يعود إلى الحلقة بعد كل جزء
+        future = self.loop.run_in_executor(None, session, *args)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # الخيط يتوقف عند الجزء التالي، وننتظره حتى تُحرر واجهة USB
+            self.cancel_event.set()
+            try:
+                await future
+            except Exception:
+                pass
+            raise
+        except SessionCancelled:
+            raise FlashCancelled()
+    
+    async def backup_device(self):
+        # المحمل يقبل مصافحة واحدة في وضع Download، فالنسخ يفتح جلسة التفليش نفسها ويتركها مفتوحة لـ flash_native.
+        # odin يبدأ دائماً بمصافحته الخاصة، لذلك النسخ مع odin غير ممكن
+        if self.backend != "native":
+            raise BackupError("partitions can only be read by the native backend, odin starts its own session")
+        async with self.transfer_slot(self.total_bytes, 0):
+            self.start_span("backup")
+            self.report(0, f"Backing up {', '.join(self.backup_partitions)}", "In progress...")
+            try:
+                saved = await self.run_native(self.backup_session)
+                manifest = await asyncio.to_thread(
+                    (self.backup_store or get_backup_store()).save_manifest, self.device_id, self.job_metrics.job_id, saved)
+            except ProtocolError as e:
+                raise BackupError(str(e))
+            except OSError as e:
+                raise BackupError(f"cannot save the backup manifest: {e}")
+        self.log(f"Backup saved: {manifest}")
+        span = self.span
+        self.end_span(0)
+        span.bytes = sum(entry["size"] for entry in saved.values())
+    
+    def backup_session(self):
+        store = self.backup_store or get_backup_store()
+        transport = self.open_transport()
+        session = DownloadSession(transport, self.cancel_event)
+        transport.open()
+        try:
+            session.handshake()
+            session.begin()
+            pit = session.read_pit()
+            targets = backup_targets(parse_pit(pit), self.backup_partitions)
+            writer = store.writer("PIT")
+            writer.write(pit)
+            saved = {"PIT": self.save_backup("PIT", writer)}
+            for position, entry in enumerate(targets):
+                name = entry.partition_name
+                writer = store.writer(name)
+                last = 0
+                
+                def on_progress(done, size):
+                    nonlocal last
+                    if done - last >= BACKUP_REPORT_BYTES or done == size:
+                        last = done
+                        progress = int(self.backup_share * (position + done / size) / len(targets))
+                        self.in_loop(self.report, progress, f"Backing up {name}", f"{format_size(done)} of {format_size(size)}")
+                
+                try:
+                    session.dump(entry, writer.write, on_progress)
+                except BaseException:
+                    writer.abort()
+                    raise
+                saved[name] = self.save_backup(name, writer)
+        except BaseException:
+            transport.close()
+            raise
+        self.native_open = (transport, session)
+        return saved
+    
+    def save_backup(self, name, writer):
+        digest, stored = writer.finish()
+        self.log(f"Backed up {name}: {format_size(writer.size)}, sha256 {digest}{'' if stored else ' (identical image already stored)'}")
+        return {"sha256": digest, "size": writer.size}
+    
+    def native_session(self, plan):
+        total_bytes = sum(size for _, parts in plan for _, _, _, size, _ in parts)
+        opened, self.native_open = self.native_open, None
+        if opened is None:
+            transport = self.open_transport()
+            session = DownloadSession(transport, self.cancel_event)
+            transport.open()
+        else:
+            # نكمل جلسة النسخ الاحتياطي: المصافحة وبدء الجلسة تما، ومصافحة ثانية يرفضها المحمل
+            transport, session = opened
+        try:
+            if opened is None:
+                session.handshake()
+                session.begin(total_bytes)
+            else:
+                session.send_total_bytes(total_bytes)
+            pit = parse_pit(session.read_pit())
+            self.log(f"Device PIT: {len(pit)} partitions")
+            targets = {}
+            for index, parts in plan:
+                for name, _, _, _, _ in parts:
+                    entry = targets[name] = find_pit_entry(pit, name)
+                    if entry is None:
+                        raise ProtocolError(f"{self.files_to_flash[index][0]}: no partition for {name} in the device PIT")
+            
+            for index, parts in plan:
+                self.in_loop(self.native_file_started, index)
+                for name, path, offset, size, position in parts:
+                    self.log(f"Sending {name} to partition {targets[name].partition_name} ({format_size(size)})")
+                    self.in_loop(self.native_progress, index, name, position)
+                    with mapped_region(path, offset, size) as data:
+                        session.flash(data, targets[name], lambda sent, index=index, name=name, position=position:
+                                      self.in_loop(self.native_progress, index, name, position + sent))
+                self.in_loop(self.record_written, index)
+            if self.reboot:
+                self.in_loop(self.native_reboot)
+            session.end(self.reboot)
+        finally:
+            transport.close()
+    
+    def in_loop(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
+    
+    def native_file_started(self, index):
+        self.done_bytes = max(self.done_bytes, sum(self.sizes[:index]))
+        self.start_span("transfer", self.files_to_flash[index][0])
+        self.rates.start_partition(self.done_bytes)
+    
+    def native_progress(self, index, name, position):
+        self.report_transfer(sum(self.sizes[:index]) + position, f"Flashing: {self.files_to_flash[index][0]} ({os.path.basename(name)})")
+    
+    def native_reboot(self):
+        self.done_bytes = self.total_bytes
+        self.rates.finish_partition(self.total_bytes)
+        self.start_span("reboot")
+        self.report(95, "Rebooting device", "In progress...")
+
+
+class FlashJob:
+    def __init__(self, com_port, device_info, files_to_flash, reboot, nand_erase, single_session=True, verify=True, resume=False):
+        self.com_port = com_port
+        self.device_info = device_info
+        self.files_to_flash = list(files_to_flash)
+        self.reboot = reboot
+        self.nand_erase = nand_erase
+        self.single_session = single_session
+        self.verify = verify
+        self.resume = resume
+        self.state = "queued"
+        self.progress = 0
+        self.operation = "Waiting..."
+        self.message = ""
+        self.success = False
+        self.interrupted_phase = None
+        self.stalled_phase = None
+    
+    def title(self):
+        return self.com_port
+    
+    def total_size(self):
+        total = 0
+        for _, file_path in self.files_to_flash:
+            try:
+                total += firmware_size(file_path)
+            except OSError:
+                pass
+        return total
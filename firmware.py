@@ -0,0 +1,447 @@
+import io
+import os
+import re
+import sys
+import json
+import struct
+import hashlib
+import tarfile
+import zipfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+def cache_dir():
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    path = os.path.join(base, "odin4")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def data_dir():
+    # ما يجب أن يبقى (مثل النسخ الاحتياطية) لا يوضع في الكاش الذي يجوز حذفه
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    path = os.path.join(base, "odin4")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+writer_executor = None
+
+
+def get_writer_executor():
+    # خيط واحد لكل كتابات الحالة في الكاش (السجل، المقاييس، سرعات الفروع)، فتبقى بترتيبها ولا تنتظرها حلقة الأحداث
+    global writer_executor
+    if writer_executor is None:
+        writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="odin4-writer")
+    return writer_executor
+
+
+VERIFY_CHUNK_SIZE = 8 * 1024 * 1024
+MD5_TRAILER_RE = re.compile(rb"^([0-9a-fA-F]{32})\s+(\S[^\n]*)\n?$")
+MD5_TRAILER_WINDOW = 1024  # سطر md5 يقع دائماً في آخر هذه البايتات
+
+# ملف داخل حزمة zip يُشار إليه بالمسار "firmware.zip!/AP_xxx.tar.md5"
+BUNDLE_SEPARATOR = "!/"
+# بادئات ملفات حزمة Samsung وخاناتها، HOME_CSC يحفظ بيانات المستخدم وCSC يمسحها
+BUNDLE_SLOT_PREFIXES = (
+    ("BL_", "BL File"),
+    ("AP_", "AP File"),
+    ("CP_", "CP File"),
+    ("HOME_CSC_", "CSC File"),
+    ("CSC_", "CSC File"),
+    ("USERDATA_", "UMS File"),
+)
+ZIP_LOCAL_HEADER = struct.Struct("<4s22xHH")
+
+
+def split_bundle_path(file_path):
+    bundle_path, separator, member = file_path.partition(BUNDLE_SEPARATOR)
+    if not separator:
+        return file_path, None
+    return bundle_path, member
+
+
+def bundle_member_path(bundle_path, member):
+    return f"{bundle_path}{BUNDLE_SEPARATOR}{member}"
+
+
+def is_bundle(file_path):
+    return file_path.lower().endswith(".zip") and split_bundle_path(file_path)[1] is None
+
+
+def read_bundle(bundle_path):
+    # {الخانة: [مسارات الأعضاء المطابقة]}، والاختيار بين CSC وHOME_CSC للمستخدم
+    try:
+        with zipfile.ZipFile(bundle_path) as bundle:
+            names = sorted(info.filename for info in bundle.infolist() if not info.is_dir())
+    except (KeyError, zipfile.BadZipFile) as e:
+        raise OSError(f"{bundle_path}: {e}")
+    slots = {}
+    for name in names:
+        base = os.path.basename(name).upper()
+        for prefix, label in BUNDLE_SLOT_PREFIXES:
+            if base.startswith(prefix):
+                slots.setdefault(label, []).append(bundle_member_path(bundle_path, name))
+                break
+    return slots
+
+
+def is_home_csc(file_path):
+    return os.path.basename(split_bundle_path(file_path)[1] or file_path).upper().startswith("HOME_CSC_")
+
+
+def pick_bundle_files(slots, clean_csc=False):
+    # ملف واحد لكل خانة؛ عند وجود CSC وHOME_CSC معاً نختار HOME_CSC إلا إذا طُلب مسح البيانات
+    files = []
+    for label in dict.fromkeys(label for _, label in BUNDLE_SLOT_PREFIXES):
+        members = slots.get(label)
+        if not members:
+            continue
+        if label == "CSC File" and len(members) > 1:
+            members = sorted(members, key=lambda member: is_home_csc(member) == clean_csc)
+        files.append((label, members[0]))
+    return files
+
+
+def bundle_member_info(file_path):
+    bundle_path, member = split_bundle_path(file_path)
+    try:
+        with zipfile.ZipFile(bundle_path) as bundle:
+            return bundle.getinfo(member)
+    except (KeyError, zipfile.BadZipFile) as e:
+        raise OSError(f"{file_path}: {e}")
+
+
+class StoredMember(io.RawIOBase):
+    def __init__(self, f, start, size):
+        # عضو غير مضغوط: نافذة على ملف zip نفسه تدعم seek بدون فك ضغط
+        self.f = f
+        self.start = start
+        self.size = size
+        self.position = 0
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def tell(self):
+        return self.position
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = min(max(offset, 0), self.size)
+        return self.position
+    
+    def readinto(self, buffer):
+        count = min(len(buffer), self.size - self.position)
+        if count <= 0:
+            return 0
+        self.f.seek(self.start + self.position)
+        count = self.f.readinto(memoryview(buffer)[:count])
+        self.position += count
+        return count
+    
+    def close(self):
+        self.f.close()
+        super().close()
+
+
+def stored_member_start(f, info, file_path):
+    f.seek(info.header_offset)
+    signature, name_length, extra_length = ZIP_LOCAL_HEADER.unpack(f.read(ZIP_LOCAL_HEADER.size))
+    if signature != b"PK\x03\x04":
+        raise OSError(f"{file_path}: bad local file header")
+    return info.header_offset + ZIP_LOCAL_HEADER.size + name_length + extra_length
+
+
+def open_firmware(file_path):
+    # ملف عادي أو عضو داخل حزمة zip، للقراءة المتتابعة بدون استخراج على القرص
+    bundle_path, member = split_bundle_path(file_path)
+    if member is None:
+        return open(file_path, "rb", buffering=0)
+    info = bundle_member_info(file_path)
+    if info.compress_type == zipfile.ZIP_STORED:
+        f = open(bundle_path, "rb", buffering=0)
+        try:
+            start = stored_member_start(f, info, file_path)
+        except OSError:
+            f.close()
+            raise
+        return StoredMember(f, start, info.file_size)
+    try:
+        with zipfile.ZipFile(bundle_path) as bundle:
+            return bundle.open(member)
+    except (KeyError, zipfile.BadZipFile) as e:
+        raise OSError(f"{file_path}: {e}")
+
+
+def firmware_region(file_path):
+    # (الملف على القرص، موضع البداية) للبايتات الخام، حتى تُربط بـ mmap؛ None لعضو مضغوط
+    bundle_path, member = split_bundle_path(file_path)
+    if member is None:
+        return file_path, 0
+    info = bundle_member_info(file_path)
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    with open(bundle_path, "rb", buffering=0) as f:
+        return bundle_path, stored_member_start(f, info, file_path)
+
+
+def firmware_size(file_path):
+    if split_bundle_path(file_path)[1] is None:
+        return os.path.getsize(file_path)
+    return bundle_member_info(file_path).file_size
+
+
+def firmware_stat(file_path):
+    # بصمة التغيير لعضو الحزمة هي بصمة ملف zip نفسه
+    return os.stat(split_bundle_path(file_path)[0])
+
+
+def split_md5_trailer(tail):
+    # ملفات .tar.md5 تحمل سطر "md5  اسم_الملف" بعد نهاية أرشيف tar؛ النتيجة (المجموع، طول السطر)
+    trailer = tail[tail.rfind(b"\0") + 1:]
+    match = MD5_TRAILER_RE.match(trailer)
+    if not match:
+        return None, 0
+    return match.group(1).decode().lower(), len(trailer)
+
+
+def md5_result(expected, actual):
+    if expected is None:
+        return {"ok": False, "md5": None, "message": "No MD5 checksum found"}
+    if actual != expected:
+        return {"ok": False, "md5": actual, "message": f"MD5 mismatch (expected {expected}, got {actual})"}
+    return {"ok": True, "md5": actual, "message": "MD5 OK"}
+
+
+class StreamHasher:
+    def __init__(self):
+        # نتيجة content_hash وhash_file لملف يُستقبل قطعة بقطعة، بدون قراءته مرة ثانية؛
+        # آخر MD5_TRAILER_WINDOW بايت تنتظر حتى يُعرف هل فيها سطر md5
+        self.digest = hashlib.md5()
+        self.tail = bytearray()
+    
+    def update(self, data):
+        self.tail += data
+        if len(self.tail) > MD5_TRAILER_WINDOW:
+            cut = len(self.tail) - MD5_TRAILER_WINDOW
+            self.digest.update(self.tail[:cut])
+            del self.tail[:cut]
+    
+    def result(self):
+        # (بصمة المحتوى، نتيجة التحقق) بنفس قواعد FirmwareVerifier
+        expected, trailer_length = split_md5_trailer(bytes(self.tail))
+        digest = self.digest.copy()
+        digest.update(self.tail[:len(self.tail) - trailer_length])
+        actual = digest.hexdigest()
+        return expected or actual, md5_result(expected, actual)
+
+
+class FirmwareVerifier:
+    def __init__(self, cache_path=None, max_workers=None):
+        self.cache_path = cache_path or os.path.join(cache_dir(), "verify_cache.json")
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 4)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.cache = self.load_cache()
+    
+    def load_cache(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def save_cache(self):
+        temp_path = self.cache_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.cache, f)
+        os.replace(temp_path, self.cache_path)
+    
+    def cache_key(self, file_path):
+        stat = firmware_stat(file_path)
+        return f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}|{stat.st_ino}"
+    
+    def read_md5_trailer(self, f, size):
+        f.seek(max(size - MD5_TRAILER_WINDOW, 0))
+        expected, trailer_length = split_md5_trailer(f.read())
+        return expected, size - trailer_length
+    
+    def md5_digest(self, f, length):
+        f.seek(0)
+        digest = hashlib.md5()
+        buffer = bytearray(VERIFY_CHUNK_SIZE)
+        view = memoryview(buffer)
+        remaining = length
+        while remaining:
+            count = f.readinto(view[:min(remaining, VERIFY_CHUNK_SIZE)])
+            if not count:
+                break
+            digest.update(view[:count])
+            remaining -= count
+        return digest.hexdigest(), remaining
+    
+    def content_hash(self, file_path):
+        # لملفات .tar.md5 يكفي المجموع المكتوب في آخرها، والباقي يُحسب كاملاً
+        size = firmware_size(file_path)
+        with open_firmware(file_path) as f:
+            expected, _ = self.read_md5_trailer(f, size)
+            if expected is not None:
+                return expected
+            return self.md5_digest(f, size)[0]
+    
+    def hash_file(self, file_path):
+        size = firmware_size(file_path)
+        with open_firmware(file_path) as f:
+            expected, length = self.read_md5_trailer(f, size)
+            if expected is None:
+                return md5_result(None, None)
+            
+            actual, remaining = self.md5_digest(f, length)
+        
+        if remaining:
+            return {"ok": False, "md5": actual, "message": "File is truncated"}
+        return md5_result(expected, actual)
+    
+    def compute(self, key, file_path, function):
+        try:
+            result = function(file_path)
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+        with self.lock:
+            self.cache[key] = result
+            self.save_cache()
+        return result
+    
+    def submit(self, file_path, content=False, source_path=None):
+        # كل ملف يُحسب مرة واحدة فقط حتى لو طلبته عدة أجهزة في نفس الوقت؛
+        # source_path نسخة مستخرجة بنفس المحتوى تُقرأ بدل فك ضغط عضو الحزمة
+        key = ("content|" if content else "") + self.cache_key(file_path)
+        with self.lock:
+            future = self.pending.get(key)
+            if future is None:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return None, cached
+                future = self.executor.submit(self.compute, key, source_path or file_path, self.content_hash if content else self.hash_file)
+                self.pending[key] = future
+        return future, None
+    
+    def record(self, file_path, content_hash, result):
+        # نتائج حُسبت أثناء استقبال الملف، فلا يُقرأ مرة ثانية عند تفليشه
+        key = self.cache_key(file_path)
+        with self.lock:
+            self.cache["content|" + key] = content_hash
+            if file_path.lower().endswith(".md5"):
+                self.cache[key] = result
+            self.save_cache()
+    
+    def verify(self, file_path, source_path=None):
+        if not file_path.lower().endswith(".md5"):
+            return None
+        future, cached = self.submit(file_path, source_path=source_path)
+        return cached if future is None else future.result()
+    
+    def content_hash_future(self, file_path):
+        future, cached = self.submit(file_path, content=True)
+        if future is None:
+            future = Future()
+            future.set_result(cached)
+        return future
+
+
+firmware_verifier = None
+
+
+def get_firmware_verifier():
+    global firmware_verifier
+    if firmware_verifier is None:
+        firmware_verifier = FirmwareVerifier()
+    return firmware_verifier
+
+
+class VerificationError(Exception):
+    pass
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+# تعرّف نوع الضغط من أول بايتات كل ملف داخل الأرشيف
+COMPRESSION_MAGIC = (
+    (b"\x04\x22\x4d\x18", "lz4"),
+    (b"\x3a\xff\x26\xed", "sparse"),
+    (b"\x1f\x8b", "gzip"),
+)
+
+
+class ArchiveEntry:
+    def __init__(self, name, size, offset, compression):
+        self.name = name
+        self.size = size
+        self.offset = offset
+        self.compression = compression
+
+
+class ArchiveIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cache = {}
+    
+    def read_entries(self, file_path):
+        # قراءة رؤوس tar فقط: tarfile يقفز فوق محتوى كل ملف بـ seek بدون قراءته
+        entries = []
+        with open_firmware(file_path) as f, tarfile.open(fileobj=f, mode="r:") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                f.seek(member.offset_data)
+                magic = f.read(4)
+                compression = "raw"
+                for prefix, name in COMPRESSION_MAGIC:
+                    if magic.startswith(prefix):
+                        compression = name
+                        break
+                entries.append(ArchiveEntry(member.name, member.size, member.offset_data, compression))
+        return entries
+    
+    def entries(self, file_path):
+        try:
+            stat = firmware_stat(file_path)
+            # عضو مضغوط داخل الحزمة لا يمكن القفز فيه، وقراءته كاملة أبطأ من أن تستحق
+            if split_bundle_path(file_path)[1] is not None and bundle_member_info(file_path).compress_type != zipfile.ZIP_STORED:
+                return None
+        except OSError:
+            return None
+        key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            if key in self.cache:
+                return self.cache[key]
+        try:
+            entries = self.read_entries(file_path)
+        except (OSError, tarfile.TarError):
+            entries = None
+        with self.lock:
+            self.cache[key] = entries
+        return entries
+
+
+archive_index = ArchiveIndex()
@@ -0,0 +1,1216 @@
+import os
+import sys
+import asyncio
+import threading
+from collections import deque
+from PyQt5.QtWidgets import (
+    QApplication, QMainWindow, QLabel, QComboBox, QPushButton,
+    QFileDialog, QMessageBox, QProgressBar, QCheckBox, QVBoxLayout,
+    QHBoxLayout, QWidget, QLineEdit, QGridLayout, QGroupBox,
+    QTabWidget, QScrollArea, QStatusBar,
+    QSpinBox, QListWidget, QListWidgetItem, QListView
+)
+from PyQt5.QtCore import (
+    Qt, QThread, QObject, pyqtSignal, QTimer, QAbstractListModel, QModelIndex,
+    QSortFilterProxyModel, QUrl
+)
+from PyQt5.QtGui import QIcon, QCursor, QFontDatabase, QDesktopServices
+
+from devices import DeviceWatcher, port_classifier
+from engine import DEFAULT_ODIN_PATH, FlashEngine, FlashJob
+from firmware import archive_index, firmware_size, format_size, is_home_csc, pick_bundle_files, read_bundle, split_bundle_path
+from oplog import format_log_record, get_operation_log
+from scheduler import get_transfer_scheduler
+from theme import apply_theme, set_style_state
+
+class AnimatedProgressBar(QProgressBar):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMinimum(0)
+        self.setMaximum(100)
+        self.setValue(0)
+        self.setTextVisible(True)
+        self.setFixedHeight(20)
+
+class StyledButton(QPushButton):
+    def __init__(self, text, parent=None, primary=False):
+        super().__init__(text, parent)
+        self.primary = primary
+        self.setMinimumHeight(36)
+        self.setCursor(QCursor(Qt.PointingHandCursor))
+        self.setProperty("primary", primary)
+
+class FileSelectWidget(QWidget):
+    def __init__(self, label, parent=None):
+        super().__init__(parent)
+        self.layout = QHBoxLayout(self)
+        self.layout.setContentsMargins(0, 0, 0, 0)
+        
+        self.label = QLabel(label)
+        self.label.setMinimumWidth(80)
+        
+        self.entry = QLineEdit()
+        self.entry.setPlaceholderText(f"Select {label} file...")
+        self.browse_button = StyledButton("Browse")
+        self.browse_button.setIcon(QIcon.fromTheme("folder-open"))
+        
+        # ملخص محتويات الأرشيف (القائمة الكاملة في التلميح)
+        self.contents_label = QLabel("")
+        self.contents_label.setMinimumWidth(140)
+        self.contents_label.setObjectName("contents")
+        
+        self.layout.addWidget(self.label)
+        self.layout.addWidget(self.entry, 1)
+        self.layout.addWidget(self.contents_label)
+        self.layout.addWidget(self.browse_button)
+        
+        self.browse_button.clicked.connect(self.browse_file)
+        self.entry.editingFinished.connect(self.update_contents)
+    
+    def browse_file(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, f"Select {self.label} File", "", "All Files (*.*)")
+        if file_path:
+            self.entry.setText(file_path)
+            set_style_state(self.entry, "highlight", True)
+            QTimer.singleShot(300, lambda: set_style_state(self.entry, "highlight", False))
+            self.update_contents()
+    
+    def update_contents(self):
+        file_path = self.get_file_path()
+        entries = archive_index.entries(file_path) if file_path else None
+        if not entries:
+            bundle_path, member = split_bundle_path(file_path)
+            if member is None:
+                self.contents_label.setText("")
+                self.contents_label.setToolTip("")
+                return
+            # عضو مضغوط داخل الحزمة: لا نفك ضغطه لمجرد عرض المحتويات
+            try:
+                self.contents_label.setText(f"in {os.path.basename(bundle_path)}, {format_size(firmware_size(file_path))}")
+            except OSError as e:
+                self.contents_label.setText("missing")
+                self.contents_label.setToolTip(str(e))
+                return
+            self.contents_label.setToolTip(file_path)
+            return
+        
+        total = sum(entry.size for entry in entries)
+        self.contents_label.setText(f"{len(entries)} partition(s), {format_size(total)}")
+        rows = "".join(
+            f"<tr><td>{entry.name}</td><td align='right'>{format_size(entry.size)}</td><td>{entry.compression}</td></tr>"
+            for entry in entries
+        )
+        self.contents_label.setToolTip(f"<table>{rows}</table>")
+    
+    def get_file_path(self):
+        return self.entry.text()
+    
+    def set_file_path(self, path):
+        self.entry.setText(path)
+        self.update_contents()
+
+class DeviceMonitor(QThread):
+    device_added = pyqtSignal(str, str)
+    device_removed = pyqtSignal(str)
+    
+    def __init__(self, poll_interval=2, download_only=False):
+        super().__init__()
+        self.watcher = DeviceWatcher(self.device_added.emit, self.device_removed.emit, poll_interval, download_only)
+    
+    def rescan(self):
+        self.watcher.rescan()
+    
+    def set_download_only(self, download_only):
+        self.watcher.download_only = download_only
+        self.rescan()
+    
+    def stop(self):
+        self.watcher.stop()
+        self.wait()
+    
+    def run(self):
+        self.watcher.run()
+
+class AsyncLoop:
+    def __init__(self, loop=None):
+        # مع qasync تعمل الحلقة داخل حلقة Qt نفسها، وإلا في خيط واحد لكل العمليات
+        # وتصل النتائج إلى واجهة Qt عبر الإشارات
+        self.thread = None
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=loop.run_forever, name="odin4-asyncio", daemon=True)
+            self.thread.start()
+        self.loop = loop
+    
+    def submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+    
+    def in_loop_thread(self):
+        return self.thread is None or threading.current_thread() is self.thread
+
+
+async_loop = None
+
+
+def get_async_loop():
+    global async_loop
+    if async_loop is None:
+        async_loop = AsyncLoop()
+    return async_loop
+
+
+class FlashTask(QObject):
+    progress_updated = pyqtSignal(int, str, str)
+    finished = pyqtSignal(bool, str, str, str)
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.engine = FlashEngine(self.progress_updated.emit)
+        self.future = None
+    
+    @property
+    def odin_path(self):
+        return self.engine.odin_path
+    
+    @odin_path.setter
+    def odin_path(self, odin_path):
+        self.engine.odin_path = odin_path
+    
+    def configure(self, *args, **kwargs):
+        self.engine.configure(*args, **kwargs)
+    
+    def cancel(self):
+        self.engine.cancel()
+    
+    def kill(self):
+        self.engine.kill()
+    
+    def start(self):
+        self.future = get_async_loop().submit(self.engine.run_async())
+        self.future.add_done_callback(self.on_done)
+    
+    def on_done(self, future):
+        # finished يُرسل بعد انتهاء المهمة حتى لا تعمل نوافذ الحوار المتداخلة داخل خطوة مهمة asyncio
+        try:
+            success, message = future.result()
+        except BaseException as e:
+            success, message = False, f"Flashing failed: {e!r}"
+        self.finished.emit(success, message, self.engine.interrupted_phase or "", self.engine.stalled_phase or "")
+    
+    def isRunning(self):
+        return self.future is not None and not self.future.done()
+    
+    def wait(self, timeout=None):
+        # لا يمكن الانتظار من داخل حلقة الأحداث نفسها (وضع qasync)
+        if self.isRunning() and not get_async_loop().in_loop_thread():
+            try:
+                self.future.result(timeout)
+            except Exception:
+                pass
+
+class FlashFarm(QObject):
+    job_updated = pyqtSignal(object)
+    all_finished = pyqtSignal(list)
+    
+    def __init__(self, parent=None, max_concurrent=4):
+        super().__init__(parent)
+        self.max_concurrent = max_concurrent
+        self.odin_path = DEFAULT_ODIN_PATH
+        self.bundle_stream = False
+        self.backend = "odin"
+        self.backup_partitions = ()
+        self.jobs = []
+        self.queue = deque()
+        self.running = {}
+    
+    def is_running(self):
+        return bool(self.running or self.queue)
+    
+    def submit(self, jobs):
+        self.jobs = list(jobs)
+        self.queue = deque(self.jobs)
+        self.start_next()
+    
+    def enqueue(self, job):
+        # إضافة جهاز جديد أثناء عمل المزرعة (التفليش التلقائي)
+        self.jobs.append(job)
+        self.queue.append(job)
+        self.start_next()
+    
+    def has_port(self, com_port):
+        return any(job.com_port == com_port for job in list(self.running.values()) + list(self.queue))
+    
+    def start_next(self):
+        # تشغيل الأجهزة التالية ضمن حد التوازي المحدد
+        while self.queue and len(self.running) < self.max_concurrent:
+            job = self.next_job()
+            task = FlashTask(self)
+            task.odin_path = self.odin_path
+            task.engine.bundle_stream = self.bundle_stream
+            task.engine.backend = self.backend
+            task.engine.backup_partitions = self.backup_partitions
+            task.configure(job.com_port, job.files_to_flash, job.reboot, job.nand_erase, job.single_session, job.verify, job.resume)
+            task.progress_updated.connect(
+                lambda progress, operation, _, job=job: self.on_job_progress(job, progress, operation))
+            task.finished.connect(
+                lambda success, message, phase, stalled, job=job, task=task: self.on_job_finished(job, task, success, message, phase, stalled))
+            self.running[task] = job
+            job.state = "running"
+            self.job_updated.emit(job)
+            task.start()
+        
+        if not self.running and not self.queue and self.jobs:
+            jobs, self.jobs = self.jobs, []
+            self.all_finished.emit(jobs)
+    
+    def next_job(self):
+        # الأجهزة على فروع USB الأقل انشغالاً أولاً، ثم الأطول زمناً
+        order = get_transfer_scheduler().order([(job.com_port, job.total_size()) for job in self.queue])
+        job = self.queue[order[0]]
+        del self.queue[order[0]]
+        return job
+    
+    def on_job_progress(self, job, progress, operation):
+        job.progress = progress
+        job.operation = operation
+        self.job_updated.emit(job)
+    
+    def on_job_finished(self, job, task, success, message, interrupted_phase="", stalled_phase=""):
+        if self.running.pop(task, None) is None:
+            return
+        task.deleteLater()
+        job.success = success
+        job.message = message
+        job.interrupted_phase = interrupted_phase or None
+        job.stalled_phase = stalled_phase or None
+        job.state = "done" if success else "failed"
+        job.operation = message
+        self.job_updated.emit(job)
+        self.start_next()
+    
+    def cancel(self):
+        for job in self.queue:
+            job.state = "failed"
+            job.interrupted_phase = "queued"
+            job.message = job.operation = "Operation cancelled by user while queued."
+            self.job_updated.emit(job)
+        self.queue.clear()
+        # كل مهمة تنهي Odin الخاص بها وترسل finished بالمرحلة التي توقفت عندها
+        for task in self.running:
+            task.cancel()
+    
+    def kill(self):
+        self.queue.clear()
+        for task in list(self.running):
+            task.kill()
+        for task in list(self.running):
+            task.wait(1)
+
+class RemoteFarm(QObject):
+    job_updated = pyqtSignal(object)
+    all_finished = pyqtSignal(list)
+    devices_changed = pyqtSignal(list)
+    
+    def __init__(self, addresses, parent=None):
+        super().__init__(parent)
+        # المنسق يعمل في خيطه الخاص، والإشارات تنقل التحديثات إلى خيط الواجهة
+        from cluster import Coordinator
+        self.coordinator = Coordinator(addresses, self.job_updated.emit, self.all_finished.emit, self.devices_changed.emit)
+        self.coordinator.start()
+    
+    def is_running(self):
+        return self.coordinator.is_running()
+    
+    def submit(self, jobs):
+        self.coordinator.submit(jobs)
+    
+    def cancel(self):
+        self.coordinator.cancel()
+    
+    def stop(self):
+        self.coordinator.stop()
+
+class DeviceProgressRow(QWidget):
+    def __init__(self, job, parent=None):
+        super().__init__(parent)
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        
+        self.port_label = QLabel(job.title())
+        self.port_label.setMinimumWidth(120)
+        self.progress_bar = AnimatedProgressBar()
+        self.status_label = QLabel(job.operation)
+        self.status_label.setMinimumWidth(220)
+        
+        layout.addWidget(self.port_label)
+        layout.addWidget(self.progress_bar, 1)
+        layout.addWidget(self.status_label)
+    
+    def update_job(self, job):
+        self.progress_bar.setValue(job.progress)
+        self.status_label.setText(job.operation)
+        if job.state == "done":
+            set_style_state(self.status_label, "state", "ok")
+        elif job.state == "failed":
+            set_style_state(self.status_label, "state", "error")
+
+class LogModel(QAbstractListModel):
+    def __init__(self, log, parent=None):
+        super().__init__(parent)
+        self.log = log
+        self.records = []
+        self.limit = log.ring.maxlen
+        self.seq = 0
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        # النص يُنسق فقط للصفوف التي تعرضها القائمة فعلاً
+        if role == Qt.DisplayRole and index.isValid():
+            return format_log_record(self.records[index.row()])
+        return None
+    
+    def fetch(self):
+        # تُستدعى مرة كل إطار: كل ما وصل منذ الإطار السابق يُضاف دفعة واحدة
+        if self.log.seq == self.seq:
+            return False
+        records = self.log.since(self.seq)
+        if not records:
+            return False
+        self.seq = records[-1][0]
+        if len(records) >= self.limit:
+            self.beginResetModel()
+            self.records = records[-self.limit:]
+            self.endResetModel()
+            return True
+        excess = len(self.records) + len(records) - self.limit
+        if excess > 0:
+            self.beginRemoveRows(QModelIndex(), 0, excess - 1)
+            del self.records[:excess]
+            self.endRemoveRows()
+        start = len(self.records)
+        self.beginInsertRows(QModelIndex(), start, start + len(records) - 1)
+        self.records.extend(records)
+        self.endInsertRows()
+        return True
+
+AUTO_FLASH_ROWS = 32
+LOG_FRAME_INTERVAL = 16  # ms، تحديث سجل العمليات مرة كل إطار
+
+class FlashToolApp(QMainWindow):
+    first_painted = pyqtSignal()
+    
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Samsung Odin4 Professional Flash Tool")
+        self.setGeometry(100, 100, 900, 600)
+        self.setMinimumSize(800, 500)
+        
+        app = QApplication.instance()
+        if not app.styleSheet():
+            apply_theme(app)
+        self.painted = False
+        self.init_ui()
+        
+        self.devices = {}
+        self.auto_profile = None
+        self.device_monitor = DeviceMonitor(download_only=self.download_only_checkbox.isChecked())
+        self.device_monitor.device_added.connect(self.on_device_added)
+        self.device_monitor.device_removed.connect(self.on_device_removed)
+        
+        self.flash_task = FlashTask(self)
+        self.flash_task.progress_updated.connect(self.update_progress)
+        self.flash_task.finished.connect(self.on_flash_finished)
+        
+        self.flash_farm = FlashFarm(self, self.farm_concurrency.value())
+        self.flash_farm.job_updated.connect(self.update_farm_job)
+        self.flash_farm.all_finished.connect(self.on_farm_finished)
+        self.farm_rows = {}
+        self.remote_farm = None
+        self.remote_devices = {}
+        self.farm_result_pending = False
+        
+        self.status_timer = QTimer(self)
+        self.status_timer.timeout.connect(self.update_status)
+    
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.painted:
+            # الأعمال غير الضرورية للعرض الأول تبدأ بعد أول رسم للنافذة
+            self.painted = True
+            self.first_painted.emit()
+            QTimer.singleShot(0, self.start_background_work)
+    
+    def start_background_work(self):
+        self.device_monitor.start()
+        self.status_timer.start(5000)
+    
+    def init_ui(self):
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        main_layout = QVBoxLayout(central_widget)
+        main_layout.setSpacing(10)
+        main_layout.setContentsMargins(15, 15, 15, 15)
+        
+        header_layout = QHBoxLayout()
+        logo_label = QLabel("ODIN4")
+        logo_label.setObjectName("logo")
+        header_layout.addWidget(logo_label)
+        
+        title_label = QLabel("Professional Firmware Flash Tool")
+        title_label.setObjectName("title")
+        header_layout.addWidget(title_label)
+        header_layout.addStretch(1)
+        
+        device_group = QGroupBox("Device Connection")
+        device_layout = QGridLayout(device_group)
+        
+        self.com_label = QLabel("Target Device:")
+        self.com_dropdown = QComboBox()
+        self.com_dropdown.setMinimumWidth(350)
+        self.com_dropdown.addItem("No device detected")
+        self.com_dropdown.setCurrentIndex(0)
+        
+        self.refresh_button = StyledButton("Refresh")
+        self.refresh_button.setIcon(QIcon.fromTheme("view-refresh"))
+        self.refresh_button.clicked.connect(self.refresh_devices)
+        
+        device_layout.addWidget(self.com_label, 0, 0)
+        device_layout.addWidget(self.com_dropdown, 0, 1)
+        device_layout.addWidget(self.refresh_button, 0, 2)
+        
+        self.device_status = QLabel("Device Status: Not Connected")
+        self.device_status.setProperty("state", "error")
+        device_layout.addWidget(self.device_status, 1, 0, 1, 3)
+        
+        # وضع المزرعة: تفليش نفس الملفات على عدة أجهزة في نفس الوقت
+        self.farm_checkbox = QCheckBox("Farm Mode (flash all checked devices)")
+        self.farm_checkbox.setToolTip("Flash the same firmware onto every checked device in download mode at once")
+        self.farm_checkbox.toggled.connect(self.toggle_farm_mode)
+        
+        self.farm_concurrency_label = QLabel("Max Parallel:")
+        self.farm_concurrency = QSpinBox()
+        self.farm_concurrency.setRange(1, 64)
+        self.farm_concurrency.setValue(min(os.cpu_count() or 4, 8))
+        self.farm_concurrency.valueChanged.connect(self.set_farm_concurrency)
+        
+        self.farm_device_list = QListWidget()
+        self.farm_device_list.setMaximumHeight(120)
+        
+        device_layout.addWidget(self.farm_checkbox, 2, 0)
+        device_layout.addWidget(self.farm_concurrency_label, 2, 1, Qt.AlignRight)
+        device_layout.addWidget(self.farm_concurrency, 2, 2)
+        device_layout.addWidget(self.farm_device_list, 3, 0, 1, 3)
+        
+        # تصنيف المنافذ حسب VID/PID: إظهار أجهزة وضع Download فقط، والتفليش التلقائي لكل جهاز جديد
+        self.download_only_checkbox = QCheckBox("Download Mode Devices Only")
+        self.download_only_checkbox.setChecked(True)
+        self.download_only_checkbox.setToolTip("Hide modems, Bluetooth and other serial ports (Samsung download mode is USB 04E8:685D)")
+        self.download_only_checkbox.toggled.connect(self.toggle_download_only)
+        
+        self.auto_flash_checkbox = QCheckBox("Auto-Flash New Devices")
+        self.auto_flash_checkbox.setToolTip("Flash the current files and options onto every device that is attached in download mode")
+        self.auto_flash_checkbox.toggled.connect(self.toggle_auto_flash)
+        
+        device_layout.addWidget(self.download_only_checkbox, 4, 0)
+        device_layout.addWidget(self.auto_flash_checkbox, 4, 1, 1, 2)
+        
+        # عقد تفليش على أجهزة كمبيوتر أخرى (python odin4.py --serve-agent)، أجهزتها تظهر في قائمة المزرعة
+        self.agents_label = QLabel("Remote Agents:")
+        self.agents_edit = QLineEdit()
+        self.agents_edit.setPlaceholderText("host:port, host:port")
+        self.agents_button = StyledButton("Connect")
+        self.agents_button.clicked.connect(self.connect_agents)
+        
+        device_layout.addWidget(self.agents_label, 5, 0)
+        device_layout.addWidget(self.agents_edit, 5, 1)
+        device_layout.addWidget(self.agents_button, 5, 2)
+        for widget in (self.agents_label, self.agents_edit, self.agents_button):
+            widget.setVisible(False)
+        self.farm_concurrency_label.setVisible(False)
+        self.farm_concurrency.setVisible(False)
+        self.farm_device_list.setVisible(False)
+        
+        self.files_tabs = files_tabs = QTabWidget()
+        standard_tab = QWidget()
+        standard_layout = QVBoxLayout(standard_tab)
+        
+        self.file_widgets = {}
+        file_types = ["BL File", "AP File", "CP File", "CSC File", "UMS File"]
+        
+        for file_type in file_types:
+            file_widget = FileSelectWidget(file_type)
+            self.file_widgets[file_type] = file_widget
+            standard_layout.addWidget(file_widget)
+        
+        bundle_layout = QHBoxLayout()
+        bundle_layout.addStretch(1)
+        self.bundle_button = StyledButton("Load Firmware Bundle")
+        self.bundle_button.setIcon(QIcon.fromTheme("package-x-generic"))
+        self.bundle_button.setToolTip("Fill the slots from the BL_/AP_/CP_/CSC_ files of a firmware zip without extracting it")
+        self.bundle_button.clicked.connect(self.load_bundle)
+        bundle_layout.addWidget(self.bundle_button)
+        standard_layout.addLayout(bundle_layout)
+        
+        standard_layout.addStretch(1)
+        files_tabs.addTab(standard_tab, "Standard Flash")
+        
+        # محتوى التبويبات الأخرى يُبنى عند فتحها أول مرة
+        self.lazy_tabs = {}
+        self.add_lazy_tab("Advanced Mode", self.build_advanced_tab)
+        files_tabs.currentChanged.connect(self.build_lazy_tab)
+        
+        options_group = QGroupBox("Flash Options")
+        options_layout = QGridLayout(options_group)
+        
+        self.nand_erase_checkbox = QCheckBox("NAND Erase All")
+        self.nand_erase_checkbox.setToolTip("Erase NAND memory before flashing. Warning: Will erase all data!")
+        
+        self.reboot_checkbox = QCheckBox("Auto Reboot")
+        self.reboot_checkbox.setChecked(True)
+        self.reboot_checkbox.setToolTip("Automatically reboot device after flashing is complete")
+        
+        self.backup_checkbox = QCheckBox("Backup EFS")
+        self.backup_checkbox.setEnabled(False)
+        self.backup_checkbox.setToolTip("Read the EFS partition into a compressed, checksummed backup before flashing (recommended).\n"
+                                        "Needs Native Protocol and a bootloader that allows partition dumps; nothing is flashed if the backup fails.")
+        
+        self.single_session_checkbox = QCheckBox("Single Session")
+        self.single_session_checkbox.setChecked(True)
+        self.single_session_checkbox.setToolTip("Flash all files, erase and reboot in one Odin session instead of one session per file")
+        
+        options_layout.addWidget(self.nand_erase_checkbox, 0, 0)
+        options_layout.addWidget(self.reboot_checkbox, 0, 1)
+        options_layout.addWidget(self.backup_checkbox, 1, 0)
+        self.verify_checkbox = QCheckBox("Verify MD5")
+        self.verify_checkbox.setChecked(True)
+        self.verify_checkbox.setToolTip("Check the MD5 checksum of .tar.md5 files before flashing (results are cached)")
+        
+        options_layout.addWidget(self.single_session_checkbox, 1, 1)
+        options_layout.addWidget(self.verify_checkbox, 2, 0)
+        self.resume_checkbox = QCheckBox("Resume")
+        self.resume_checkbox.setToolTip("Skip files already written with identical content to this device (e.g. after a failed flash)")
+        options_layout.addWidget(self.resume_checkbox, 2, 1)
+        self.bundle_stream_checkbox = QCheckBox("Stream Bundles")
+        self.bundle_stream_checkbox.setToolTip("Feed files from a firmware zip to Odin through a pipe instead of extracting them first\n"
+                                               "(only for Odin builds that read each file once)")
+        options_layout.addWidget(self.bundle_stream_checkbox, 3, 0)
+        self.native_checkbox = QCheckBox("Native Protocol")
+        self.native_checkbox.setToolTip("Talk to the device over libusb directly instead of running odin (needs pyusb).\n"
+                                        "NAND erase and LZ4-compressed images still need odin.")
+        # النسخ يتم داخل جلسة البروتوكول المباشر، وodin يبدأ جلسته بمصافحة لا يقبلها المحمل مرتين
+        self.native_checkbox.toggled.connect(self.backup_checkbox.setEnabled)
+        options_layout.addWidget(self.native_checkbox, 3, 1)
+        
+        buttons_layout = QHBoxLayout()
+        
+        self.flash_button = StyledButton("Start Flashing", primary=True)
+        self.flash_button.setIcon(QIcon.fromTheme("system-run"))
+        self.flash_button.clicked.connect(self.start_flashing)
+        
+        self.cancel_button = StyledButton("Cancel")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_flashing)
+        
+        buttons_layout.addStretch(1)
+        buttons_layout.addWidget(self.cancel_button)
+        buttons_layout.addWidget(self.flash_button)
+        
+        progress_group = QGroupBox("Operation Progress")
+        progress_layout = QVBoxLayout(progress_group)
+        
+        progress_info_layout = QHBoxLayout()
+        
+        self.current_operation_label = QLabel("Ready")
+        self.remaining_time_label = QLabel("Time Remaining: --:--")
+        self.remaining_time_label.setAlignment(Qt.AlignRight)
+        
+        progress_info_layout.addWidget(self.current_operation_label)
+        progress_info_layout.addStretch(1)
+        progress_info_layout.addWidget(self.remaining_time_label)
+        
+        self.progress_bar = AnimatedProgressBar()
+        
+        self.farm_progress_area = QScrollArea()
+        self.farm_progress_area.setWidgetResizable(True)
+        self.farm_progress_area.setMinimumHeight(120)
+        farm_progress_widget = QWidget()
+        self.farm_progress_layout = QVBoxLayout(farm_progress_widget)
+        self.farm_progress_layout.addStretch(1)
+        self.farm_progress_area.setWidget(farm_progress_widget)
+        self.farm_progress_area.setVisible(False)
+        
+        progress_layout.addLayout(progress_info_layout)
+        progress_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.farm_progress_area)
+        
+        main_layout.addLayout(header_layout)
+        main_layout.addWidget(device_group)
+        main_layout.addWidget(files_tabs, 1)
+        main_layout.addWidget(options_group)
+        main_layout.addLayout(buttons_layout)
+        main_layout.addWidget(progress_group)
+        
+        self.status_bar = QStatusBar()
+        self.status_bar.showMessage("Ready")
+        self.setStatusBar(self.status_bar)
+    
+    def add_lazy_tab(self, title, builder):
+        tab = QWidget()
+        QVBoxLayout(tab)
+        index = self.files_tabs.addTab(tab, title)
+        self.lazy_tabs[index] = builder
+    
+    def build_lazy_tab(self, index):
+        builder = self.lazy_tabs.pop(index, None)
+        if builder:
+            builder(self.files_tabs.widget(index).layout())
+    
+    def build_advanced_tab(self, layout):
+        operation_log = get_operation_log()
+        self.log_model = LogModel(operation_log, self)
+        self.log_filter = QSortFilterProxyModel(self)
+        self.log_filter.setSourceModel(self.log_model)
+        self.log_filter.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        
+        controls = QHBoxLayout()
+        self.log_filter_edit = QLineEdit()
+        self.log_filter_edit.setPlaceholderText("Filter by port or text")
+        self.log_filter_edit.textChanged.connect(self.log_filter.setFilterFixedString)
+        open_button = StyledButton("Open Log Folder")
+        open_button.clicked.connect(lambda: QDesktopServices.openUrl(QUrl.fromLocalFile(operation_log.directory)))
+        controls.addWidget(QLabel("Operation Log:"))
+        controls.addWidget(self.log_filter_edit, 1)
+        controls.addWidget(open_button)
+        layout.addLayout(controls)
+        
+        # القائمة ترسم الصفوف الظاهرة فقط؛ السجل الكامل في ملفات مضغوطة داخل مجلد السجلات
+        self.log_view = QListView()
+        self.log_view.setModel(self.log_filter)
+        self.log_view.setUniformItemSizes(True)
+        self.log_view.setSelectionMode(QListView.ExtendedSelection)
+        self.log_view.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        layout.addWidget(self.log_view, 1)
+        
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.update_log_view)
+        self.log_timer.start(LOG_FRAME_INTERVAL)
+        self.update_log_view()
+    
+    def update_log_view(self):
+        # نتابع آخر السطور فقط إن كان المستخدم في أسفل القائمة، ولا نقفز إن كان يقرأ ما سبق
+        scroll_bar = self.log_view.verticalScrollBar()
+        following = scroll_bar.value() >= scroll_bar.maximum()
+        if self.log_model.fetch() and following:
+            self.log_view.scrollToBottom()
+    
+    def toggle_farm_mode(self, enabled):
+        self.farm_concurrency_label.setVisible(enabled)
+        self.farm_concurrency.setVisible(enabled)
+        self.farm_device_list.setVisible(enabled)
+        for widget in (self.agents_label, self.agents_edit, self.agents_button):
+            widget.setVisible(enabled)
+        self.com_dropdown.setEnabled(not enabled)
+        self.progress_bar.setVisible(not enabled)
+        self.farm_progress_area.setVisible(enabled)
+    
+    def toggle_download_only(self, enabled):
+        self.device_monitor.set_download_only(enabled)
+        if self.remote_farm is not None:
+            self.on_remote_devices_changed(self.remote_farm.coordinator.devices())
+    
+    def farm_running(self):
+        return self.flash_farm.is_running() or (self.remote_farm is not None and self.remote_farm.is_running())
+    
+    def connect_agents(self):
+        addresses = self.agents_edit.text().replace(",", " ").split()
+        if self.remote_farm is not None:
+            if self.remote_farm.is_running():
+                QMessageBox.warning(self, "Remote Agents", "Wait for the remote devices to finish first.")
+                return
+            self.remote_farm.stop()
+            self.remote_farm.deleteLater()
+            self.remote_farm = None
+            self.on_remote_devices_changed([])
+        
+        if not addresses:
+            self.agents_button.setText("Connect")
+            self.status_bar.showMessage("Disconnected from remote agents")
+            return
+        
+        self.remote_farm = RemoteFarm(addresses, self)
+        self.remote_farm.job_updated.connect(self.update_farm_job)
+        self.remote_farm.all_finished.connect(self.on_farm_finished)
+        self.remote_farm.devices_changed.connect(self.on_remote_devices_changed)
+        self.agents_button.setText("Reconnect")
+        self.status_bar.showMessage(f"Connecting to {len(addresses)} remote agent(s)...")
+    
+    def on_remote_devices_changed(self, devices):
+        download_only = self.download_only_checkbox.isChecked()
+        remote_devices = {}
+        for url, device in devices:
+            if download_only and device["kind"] != "download":
+                continue
+            agent_name = url.split("://", 1)[-1]
+            remote_devices[f"{url}|{device['port']}"] = (url, device["port"], f"{agent_name} > {device['description']}")
+        
+        # تحديث القائمة بالفروقات فقط حتى لا يضيع اختيار المستخدم
+        for row in reversed(range(self.farm_device_list.count())):
+            key = self.farm_device_list.item(row).data(Qt.UserRole)
+            if key in self.remote_devices and key not in remote_devices:
+                self.farm_device_list.takeItem(row)
+        for key, (_, _, device_info) in remote_devices.items():
+            if key not in self.remote_devices:
+                item = QListWidgetItem(device_info)
+                item.setData(Qt.UserRole, key)
+                item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+                item.setCheckState(Qt.Unchecked)
+                self.farm_device_list.addItem(item)
+        self.remote_devices = remote_devices
+        
+        if self.remote_farm is not None:
+            offline = [agent.name for agent in self.remote_farm.coordinator.agents.values() if not agent.online]
+            message = f"Remote agents: {len(remote_devices)} device(s)"
+            if offline:
+                message += f", unreachable: {', '.join(offline)}"
+            self.status_bar.showMessage(message)
+    
+    def toggle_auto_flash(self, enabled):
+        if not enabled:
+            self.auto_profile = None
+            self.status_bar.showMessage("Auto-flash stopped")
+            if not self.flash_farm.is_running():
+                self.set_controls_enabled(True)
+                self.current_operation_label.setText("Ready")
+            return
+        
+        files_to_flash = self.selected_files()
+        message = ""
+        if not files_to_flash:
+            message = "No files selected for flashing!"
+        elif self.flash_task.isRunning() or self.farm_running():
+            message = "Wait for the current operation to finish first."
+        if message:
+            QMessageBox.warning(self, "Auto-Flash", message)
+            self.auto_flash_checkbox.setChecked(False)
+            return
+        
+        message = f"Every device attached in download mode from now on will be flashed with {len(files_to_flash)} file(s).\n\n"
+        if self.nand_erase_checkbox.isChecked():
+            message += "WARNING: NAND Erase is enabled. This will erase all data on every device!\n\n"
+        message += "Do you want to continue?"
+        reply = QMessageBox.question(self, "Confirm Auto-Flash", message, QMessageBox.Yes | QMessageBox.No)
+        if reply == QMessageBox.No:
+            self.auto_flash_checkbox.setChecked(False)
+            return
+        
+        # نأخذ نسخة من الملفات والخيارات حتى لا يغيرها تعديل الواجهة أثناء العمل
+        self.auto_profile = (
+            files_to_flash,
+            self.reboot_checkbox.isChecked(),
+            self.nand_erase_checkbox.isChecked(),
+            self.single_session_checkbox.isChecked(),
+            self.verify_checkbox.isChecked(),
+            self.resume_checkbox.isChecked()
+        )
+        self.clear_farm_rows()
+        self.farm_checkbox.setChecked(True)
+        self.set_controls_enabled(False)
+        self.flash_farm.max_concurrent = self.farm_concurrency.value()
+        self.flash_farm.bundle_stream = self.bundle_stream_checkbox.isChecked()
+        self.flash_farm.backend = self.backend()
+        self.flash_farm.backup_partitions = self.backup_partitions()
+        self.current_operation_label.setText("Auto-flash: waiting for devices in download mode...")
+        self.remaining_time_label.setText("Time Remaining: --:--")
+    
+    def auto_flash_device(self, device_id, device_info):
+        if self.auto_profile is None or port_classifier.kind(device_id) != "download":
+            return
+        if self.flash_farm.has_port(device_id):
+            return
+        
+        job = FlashJob(device_id, device_info, *self.auto_profile)
+        # في الخط الإنتاجي نبقي آخر الصفوف فقط
+        finished = [farm_job for farm_job in self.farm_rows if farm_job.state in ("done", "failed")]
+        for farm_job in finished[:max(len(self.farm_rows) - AUTO_FLASH_ROWS + 1, 0)]:
+            row = self.farm_rows.pop(farm_job)
+            self.farm_progress_layout.removeWidget(row)
+            row.deleteLater()
+        self.add_farm_row(job)
+        self.status_bar.showMessage(f"Auto-flash: {device_id} attached, flashing started")
+        self.flash_farm.enqueue(job)
+    
+    def set_farm_concurrency(self, value):
+        self.flash_farm.max_concurrent = value
+        self.flash_farm.start_next()
+    
+    def checked_farm_devices(self):
+        devices = []
+        for row in range(self.farm_device_list.count()):
+            item = self.farm_device_list.item(row)
+            if item.checkState() == Qt.Checked:
+                devices.append((item.data(Qt.UserRole), item.text()))
+        return devices
+    
+    def on_device_added(self, device_id, device_info):
+        # تحديث القائمة بالفروقات فقط حتى لا يضيع اختيار المستخدم
+        if not self.devices:
+            self.com_dropdown.clear()
+        
+        index = self.com_dropdown.findData(device_id)
+        if index >= 0:
+            self.com_dropdown.setItemText(index, device_info)
+        else:
+            self.com_dropdown.addItem(device_info, device_id)
+        
+        for row in range(self.farm_device_list.count()):
+            item = self.farm_device_list.item(row)
+            if item.data(Qt.UserRole) == device_id:
+                item.setText(device_info)
+                break
+        else:
+            item = QListWidgetItem(device_info)
+            item.setData(Qt.UserRole, device_id)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Unchecked)
+            self.farm_device_list.addItem(item)
+        
+        self.devices[device_id] = device_info
+        self.device_status.setText("Device Status: Connected")
+        set_style_state(self.device_status, "state", "ok")
+        self.auto_flash_device(device_id, device_info)
+    
+    def on_device_removed(self, device_id):
+        self.devices.pop(device_id, None)
+        
+        index = self.com_dropdown.findData(device_id)
+        if index >= 0:
+            self.com_dropdown.removeItem(index)
+        
+        for row in range(self.farm_device_list.count()):
+            if self.farm_device_list.item(row).data(Qt.UserRole) == device_id:
+                self.farm_device_list.takeItem(row)
+                break
+        
+        if not self.devices:
+            self.com_dropdown.clear()
+            self.com_dropdown.addItem("No device detected")
+            self.device_status.setText("Device Status: Not Connected")
+            set_style_state(self.device_status, "state", "error")
+    
+    def refresh_devices(self):
+        self.refresh_button.setEnabled(False)
+        self.refresh_button.setText("Scanning...")
+        
+        self.device_monitor.rescan()
+        
+        QTimer.singleShot(1000, lambda: self.reset_refresh_button())
+    
+    def reset_refresh_button(self):
+        self.refresh_button.setText("Refresh")
+        self.refresh_button.setEnabled(True)
+    
+    def load_bundle(self):
+        bundle_path, _ = QFileDialog.getOpenFileName(self, "Select Firmware Bundle", "", "Firmware Bundles (*.zip);;All Files (*.*)")
+        if not bundle_path:
+            return
+        try:
+            slots = read_bundle(bundle_path)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Cannot read firmware bundle:\n{e}")
+            return
+        if not slots:
+            QMessageBox.warning(self, "Empty Bundle", "No BL_/AP_/CP_/CSC_ files found in this zip.")
+            return
+        
+        clean_csc = False
+        csc_files = slots.get("CSC File", [])
+        if any(is_home_csc(member) for member in csc_files) and not all(is_home_csc(member) for member in csc_files):
+            reply = QMessageBox.question(self, "Choose CSC",
+                                         "This bundle contains both HOME_CSC (keeps user data) and CSC (wipes user data).\n\n"
+                                         "Use HOME_CSC and keep user data?",
+                                         QMessageBox.Yes | QMessageBox.No)
+            clean_csc = reply == QMessageBox.No
+        
+        files = dict(pick_bundle_files(slots, clean_csc))
+        for label, widget in self.file_widgets.items():
+            widget.set_file_path(files.get(label, ""))
+        self.status_bar.showMessage(f"Loaded {len(files)} file(s) from {os.path.basename(bundle_path)}")
+    
+    def backend(self):
+        return "native" if self.native_checkbox.isChecked() else "odin"
+    
+    def backup_partitions(self):
+        return ("EFS",) if self.backup_checkbox.isChecked() and self.native_checkbox.isChecked() else ()
+    
+    def selected_files(self):
+        files_to_flash = []
+        for label, widget in self.file_widgets.items():
+            file_path = widget.get_file_path()
+            if file_path:
+                files_to_flash.append((label, file_path))
+        return files_to_flash
+    
+    def set_controls_enabled(self, enabled):
+        self.flash_button.setEnabled(enabled)
+        self.cancel_button.setEnabled(not enabled)
+        self.com_dropdown.setEnabled(enabled and not self.farm_checkbox.isChecked())
+        self.farm_checkbox.setEnabled(enabled)
+        self.farm_device_list.setEnabled(enabled)
+        self.auto_flash_checkbox.setEnabled(enabled or self.auto_profile is not None)
+        self.bundle_button.setEnabled(enabled)
+        for widget in self.file_widgets.values():
+            widget.browse_button.setEnabled(enabled)
+            widget.entry.setEnabled(enabled)
+    
+    def start_farm_flashing(self):
+        devices = self.checked_farm_devices()
+        if not devices:
+            QMessageBox.warning(self, "No Device", "No devices checked! Please check at least one device.")
+            return
+        
+        files_to_flash = self.selected_files()
+        if not files_to_flash:
+            QMessageBox.warning(self, "No Files", "No files selected for flashing!")
+            return
+        
+        message = f"Ready to flash {len(files_to_flash)} file(s) to {len(devices)} device(s).\n\n"
+        if self.nand_erase_checkbox.isChecked():
+            message += "WARNING: NAND Erase is enabled. This will erase all data on every device!\n\n"
+        
+        message += "Do you want to continue?"
+        
+        reply = QMessageBox.question(self, "Confirm Farm Flash Operation",
+                                     message, QMessageBox.Yes | QMessageBox.No)
+        
+        if reply == QMessageBox.No:
+            return
+        
+        self.clear_farm_rows()
+        
+        options = (
+            self.reboot_checkbox.isChecked(),
+            self.nand_erase_checkbox.isChecked(),
+            self.single_session_checkbox.isChecked(),
+            self.verify_checkbox.isChecked(),
+            self.resume_checkbox.isChecked()
+        )
+        jobs = []
+        remote_jobs = []
+        for device_id, device_info in devices:
+            if device_id in self.remote_devices:
+                from cluster import RemoteJob
+                url, com_port, _ = self.remote_devices[device_id]
+                job = RemoteJob(url, com_port, device_info, files_to_flash, *options)
+                remote_jobs.append(job)
+            else:
+                job = FlashJob(device_id, device_info, files_to_flash, *options)
+                jobs.append(job)
+            self.add_farm_row(job)
+        
+        self.set_controls_enabled(False)
+        self.current_operation_label.setText(f"Flashing {len(jobs) + len(remote_jobs)} device(s)...")
+        self.remaining_time_label.setText("Preparing...")
+        
+        self.farm_result_pending = True
+        if remote_jobs:
+            self.remote_farm.submit(remote_jobs)
+        if jobs:
+            self.flash_farm.max_concurrent = self.farm_concurrency.value()
+            self.flash_farm.bundle_stream = self.bundle_stream_checkbox.isChecked()
+            self.flash_farm.backend = self.backend()
+            self.flash_farm.backup_partitions = self.backup_partitions()
+            self.flash_farm.submit(jobs)
+    
+    def clear_farm_rows(self):
+        for row in self.farm_rows.values():
+            self.farm_progress_layout.removeWidget(row)
+            row.deleteLater()
+        self.farm_rows = {}
+    
+    def add_farm_row(self, job):
+        row = DeviceProgressRow(job)
+        self.farm_progress_layout.insertWidget(self.farm_progress_layout.count() - 1, row)
+        self.farm_rows[job] = row
+    
+    def update_farm_job(self, job):
+        row = self.farm_rows.get(job)
+        if row:
+            row.update_job(job)
+        
+        finished = sum(1 for farm_job in self.farm_rows if farm_job.state in ("done", "failed"))
+        self.status_bar.showMessage(f"Farm: {finished}/{len(self.farm_rows)} device(s) finished")
+    
+    def on_farm_finished(self, jobs):
+        if self.auto_profile is not None:
+            # لا نوافذ حوار في التفليش التلقائي حتى لا يتوقف الخط بانتظار المشغل
+            failed = sum(1 for job in jobs if not job.success)
+            self.status_bar.showMessage(f"Auto-flash: {len(jobs) - failed} succeeded, {failed} failed - waiting for devices")
+            self.current_operation_label.setText("Auto-flash: waiting for devices in download mode...")
+            return
+        
+        # المزرعة المحلية والعقد البعيدة تنتهي كل منها على حدة، النتيجة تُعرض بعد انتهاء الاثنتين
+        if self.farm_running() or not self.farm_result_pending:
+            return
+        self.farm_result_pending = False
+        jobs = list(self.farm_rows)
+        
+        self.set_controls_enabled(True)
+        
+        failed = [job for job in jobs if not job.success]
+        message = f"{len(jobs) - len(failed)} of {len(jobs)} device(s) flashed successfully."
+        if failed:
+            message += "\n\nFailed devices:\n" + "\n".join(
+                f"{job.title()}: {job.message}" for job in failed)
+            self.status_bar.showMessage("Farm operation finished with errors")
+            QMessageBox.critical(self, "Farm Result", message)
+        else:
+            self.status_bar.showMessage("Farm operation completed successfully")
+            QMessageBox.information(self, "Farm Result", message)
+        
+        self.current_operation_label.setText("Ready")
+        self.remaining_time_label.setText("Time Remaining: --:--")
+    
+    def start_flashing(self):
+        if self.farm_checkbox.isChecked():
+            self.start_farm_flashing()
+            return
+        
+        selected_device = self.com_dropdown.currentText()
+        if selected_device == "No device detected":
+            QMessageBox.warning(self, "No Device", "No device selected! Please connect a device.")
+            return
+        
+        com_port = selected_device.split(" - ")[0]
+        
+        files_to_flash = self.selected_files()
+        
+        if not files_to_flash:
+            QMessageBox.warning(self, "No Files", "No files selected for flashing!")
+            return
+        
+        message = f"Ready to flash {len(files_to_flash)} file(s) to device {com_port}.\n\n"
+        if self.nand_erase_checkbox.isChecked():
+            message += "WARNING: NAND Erase is enabled. This will erase all data on the device!\n\n"
+        
+        message += "Do you want to continue?"
+        
+        reply = QMessageBox.question(self, "Confirm Flash Operation", 
+                                     message, QMessageBox.Yes | QMessageBox.No)
+        
+        if reply == QMessageBox.No:
+            return
+        
+        self.set_controls_enabled(False)
+        
+        self.progress_bar.setValue(0)
+        self.current_operation_label.setText("Initializing...")
+        self.remaining_time_label.setText("Preparing...")
+        
+        self.flash_task.engine.bundle_stream = self.bundle_stream_checkbox.isChecked()
+        self.flash_task.engine.backend = self.backend()
+        self.flash_task.engine.backup_partitions = self.backup_partitions()
+        self.flash_task.configure(
+            com_port,
+            files_to_flash,
+            self.reboot_checkbox.isChecked(),
+            self.nand_erase_checkbox.isChecked(),
+            self.single_session_checkbox.isChecked(),
+            self.verify_checkbox.isChecked(),
+            self.resume_checkbox.isChecked()
+        )
+        self.flash_task.start()
+    
+    def update_progress(self, progress, operation, time_remaining):
+        self.progress_bar.setValue(progress)
+        self.current_operation_label.setText(operation)
+        self.remaining_time_label.setText(f"Time Remaining: {time_remaining}")
+        self.status_bar.showMessage(f"{operation} - {progress}% complete")
+    
+    def cancel_flashing(self):
+        if self.auto_profile is not None and not self.farm_running():
+            self.auto_flash_checkbox.setChecked(False)
+        elif self.farm_running():
+            reply = QMessageBox.question(self, "Cancel Operation",
+                                        "Are you sure you want to cancel all running devices?\nThis may leave your devices in an unstable state.",
+                                        QMessageBox.Yes | QMessageBox.No)
+            
+            if reply == QMessageBox.Yes:
+                self.auto_flash_checkbox.setChecked(False)
+                self.flash_farm.cancel()
+                if self.remote_farm is not None:
+                    self.remote_farm.cancel()
+        elif self.flash_task.isRunning():
+            reply = QMessageBox.question(self, "Cancel Operation", 
+                                        "Are you sure you want to cancel the current operation?\nThis may leave your device in an unstable state.",
+                                        QMessageBox.Yes | QMessageBox.No)
+            
+            if reply == QMessageBox.Yes and self.flash_task.isRunning():
+                self.status_bar.showMessage("Cancelling...")
+                self.flash_task.cancel()
+    
+    def on_flash_finished(self, success, message, interrupted_phase="", stalled_phase=""):
+        self.set_controls_enabled(True)
+        
+        if success:
+            self.status_bar.showMessage("Operation completed successfully")
+            QMessageBox.information(self, "Success", message)
+        elif interrupted_phase:
+            self.status_bar.showMessage(f"Operation cancelled during {interrupted_phase}")
+            QMessageBox.warning(self, "Cancelled", message)
+        elif stalled_phase:
+            self.status_bar.showMessage(f"Device stopped responding during {stalled_phase}")
+            QMessageBox.critical(self, "Error", f"{message}\n\nThe full output is in the Advanced Mode tab.")
+        else:
+            self.status_bar.showMessage("Operation failed")
+            QMessageBox.critical(self, "Error", f"{message}\n\nThe full output is in the Advanced Mode tab.")
+        
+        self.current_operation_label.setText("Ready")
+        self.remaining_time_label.setText("Time Remaining: --:--")
+    
+    def closeEvent(self, event):
+        # تحرير المنافذ قبل الخروج حتى لا تبقى عمليات Odin معلقة
+        if self.flash_task.isRunning():
+            self.flash_task.kill()
+            self.flash_task.wait(1)
+        if self.flash_farm.is_running():
+            self.flash_farm.kill()
+        if self.remote_farm is not None:
+            # لا نترك أجهزة تُفلش على العقد البعيدة بدون متابعة بعد الخروج
+            if self.remote_farm.is_running():
+                self.remote_farm.cancel()
+            self.remote_farm.stop()
+        if self.device_monitor.isRunning():
+            self.device_monitor.stop()
+        super().closeEvent(event)
+    
+    def update_status(self):
+        if not self.flash_task.isRunning() and not self.farm_running():
+            device = self.com_dropdown.currentText()
+            if device != "No device detected":
+                self.status_bar.showMessage(f"Connected to {device} - Ready")
+            else:
+                self.status_bar.showMessage("No device connected - Please connect a device")
+
+
+def main(argv=None):
+    global async_loop
+    app = QApplication(sys.argv if argv is None else argv)
+    try:
+        import qasync
+    except ImportError:
+        qasync = None
+    
+    if qasync is None:
+        window = FlashToolApp()
+        window.show()
+        return app.exec_()
+    
+    loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    async_loop = AsyncLoop(loop)
+    window = FlashToolApp()
+    window.show()
+    with loop:
+        return loop.run_forever()
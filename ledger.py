@@ -0,0 +1,69 @@
+import os
+import json
+import time
+import threading
+
+from firmware import cache_dir
+
+
+class FlashLedger:
+    def __init__(self, path=None):
+        # سجل لكل جهاز بالأقسام التي كُتبت بنجاح وبصمة محتواها
+        self.path = path or os.path.join(cache_dir(), "flash_ledger.json")
+        self.lock = threading.Lock()
+    
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def save(self, devices):
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(devices, f, indent=1)
+        os.replace(temp_path, self.path)
+    
+    def update(self, device_id, change):
+        # نقرأ الملف من جديد قبل كل تعديل لأن عدة عمليات قد تكتب فيه
+        with self.lock:
+            devices = self.load()
+            slots = devices.setdefault(device_id, {})
+            change(slots)
+            if not slots:
+                devices.pop(device_id, None)
+            self.save(devices)
+    
+    def slots(self, device_id):
+        with self.lock:
+            return self.load().get(device_id, {})
+    
+    def written(self, device_id, label, content_hash):
+        entry = self.slots(device_id).get(label)
+        return entry is not None and entry["hash"] == content_hash
+    
+    def record(self, device_id, label, content_hash, file_path):
+        entry = {"hash": content_hash, "file": os.path.basename(file_path), "time": round(time.time(), 3)}
+        def change(slots):
+            slots[label] = entry
+        self.update(device_id, change)
+    
+    def forget(self, device_id, labels):
+        def change(slots):
+            for label in labels:
+                slots.pop(label, None)
+        self.update(device_id, change)
+    
+    def clear(self, device_id):
+        self.update(device_id, lambda slots: slots.clear())
+
+
+flash_ledger = None
+
+
+def get_flash_ledger():
+    global flash_ledger
+    if flash_ledger is None:
+        flash_ledger = FlashLedger()
+    return flash_ledger
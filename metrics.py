@@ -0,0 +1,226 @@
+import os
+import re
+import json
+import time
+import uuid
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from firmware import cache_dir
+
+
+class Span:
+    def __init__(self, phase, port, partition=None, start_bytes=0):
+        self.phase = phase
+        self.port = port
+        self.partition = partition
+        self.start_bytes = start_bytes
+        self.bytes = 0
+        self.started_at = time.time()
+        self.start_time = time.monotonic()
+        self.duration = None
+        self.exit_code = None
+        self.stderr_tail = None
+        self.stalled = False
+    
+    def finish(self, done_bytes=None, exit_code=None, stderr_tail=None):
+        if self.duration is not None:
+            return
+        self.duration = time.monotonic() - self.start_time
+        if done_bytes is not None:
+            self.bytes = max(int(done_bytes - self.start_bytes), 0)
+        self.exit_code = exit_code
+        self.stderr_tail = stderr_tail
+    
+    @property
+    def rate(self):
+        return self.bytes / self.duration if self.duration else 0.0
+    
+    def to_dict(self):
+        return {
+            "phase": self.phase,
+            "partition": self.partition,
+            "port": self.port,
+            "started_at": round(self.started_at, 3),
+            "duration_s": round(self.duration or 0.0, 3),
+            "bytes": self.bytes,
+            "rate_bps": round(self.rate, 1),
+            "exit_code": self.exit_code,
+            "stderr_tail": self.stderr_tail,
+            "stalled": self.stalled,
+        }
+
+
+class JobMetrics:
+    def __init__(self, port):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.port = port
+        self.spans = []
+        self.total = Span("total", port)
+        self.success = None
+        self.message = ""
+    
+    def start(self, phase, partition=None, start_bytes=0):
+        span = Span(phase, self.port, partition, start_bytes)
+        self.spans.append(span)
+        return span
+    
+    def finish(self, success, message, done_bytes, exit_code=None, stderr_tail=None):
+        # المراحل المفتوحة عند انتهاء العملية تأخذ رمز الخروج وآخر المخرجات
+        for span in self.spans:
+            if span.duration is None:
+                span.finish(done_bytes if span.phase == "transfer" else None, exit_code, stderr_tail)
+        self.total.finish(done_bytes, exit_code, stderr_tail)
+        self.success = success
+        self.message = message
+    
+    @property
+    def stalls(self):
+        return sum(1 for span in self.spans if span.stalled)
+    
+    def records(self):
+        for span in self.spans + [self.total]:
+            record = {"job_id": self.job_id, "success": self.success}
+            record.update(span.to_dict())
+            if span is self.total:
+                record["message"] = self.message
+                record["stalls"] = self.stalls
+            yield record
+
+
+PROMETHEUS_SAMPLE_RE = re.compile(r'^(\w+)\{(.*)\} (\S+)$')
+PROMETHEUS_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+PROMETHEUS_UNESCAPES = {"\\": "\\", '"': '"', "n": "\n"}
+
+
+def prometheus_labels(labels):
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class MetricsSink:
+    def __init__(self, directory=None):
+        directory = directory or os.path.join(cache_dir(), "metrics")
+        os.makedirs(directory, exist_ok=True)
+        self.jsonl_path = os.path.join(directory, "flash_metrics.jsonl")
+        self.prometheus_path = os.path.join(directory, "flash_metrics.prom")
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.load()
+    
+    def load(self):
+        # العدادات تستمر بين تشغيلات الأداة بقراءة آخر ملف Prometheus مكتوب
+        try:
+            with open(self.prometheus_path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return
+        for line in lines:
+            match = PROMETHEUS_SAMPLE_RE.match(line)
+            if not match:
+                continue
+            name, labels, value = match.groups()
+            labels = tuple(
+                (key, re.sub(r"\\(.)", lambda m: PROMETHEUS_UNESCAPES.get(m.group(1), m.group(1)), raw))
+                for key, raw in PROMETHEUS_LABEL_RE.findall(labels)
+            )
+            try:
+                value = int(value) if value.lstrip("-").isdigit() else float(value)
+            except ValueError:
+                continue
+            target = self.gauges if name == "odin4_flash_transfer_rate_bytes" else self.counters
+            target[(name, labels)] = value
+    
+    def add(self, name, labels, value):
+        key = (name, tuple(labels))
+        self.counters[key] = self.counters.get(key, 0) + value
+    
+    def record(self, job):
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in job.records())
+        with self.lock:
+            # سجل JSONL للإضافة فقط، وملف Prometheus يُعاد كتابته بالكامل
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+            
+            port = (("port", job.port),)
+            self.add("odin4_flash_jobs_total", port + (("result", "success" if job.success else "failure"),), 1)
+            self.add("odin4_flash_bytes_total", port, job.total.bytes)
+            for span in job.spans + [job.total]:
+                phase = port + (("phase", span.phase),)
+                if span.partition:
+                    phase += (("partition", span.partition),)
+                self.add("odin4_flash_phase_seconds_sum", phase, span.duration or 0.0)
+                self.add("odin4_flash_phase_seconds_count", phase, 1)
+                if span.phase == "transfer" and span.bytes:
+                    self.gauges[("odin4_flash_transfer_rate_bytes", phase)] = span.rate
+                if span.stalled:
+                    self.add("odin4_flash_stalls_total", phase, 1)
+            
+            temp_path = self.prometheus_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(self.render_locked())
+            os.replace(temp_path, self.prometheus_path)
+    
+    def render_locked(self):
+        metrics = (
+            ("odin4_flash_jobs_total", "counter", "Flash jobs by port and result", self.counters),
+            ("odin4_flash_bytes_total", "counter", "Bytes written by port", self.counters),
+            ("odin4_flash_phase_seconds", "summary", "Time spent in each flash phase", self.counters),
+            ("odin4_flash_stalls_total", "counter", "Odin processes killed after producing no output within the stall window", self.counters),
+            ("odin4_flash_transfer_rate_bytes", "gauge", "Rate of the last transfer of each partition in bytes/second", self.gauges),
+        )
+        lines = []
+        for name, kind, help_text, values in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name or metric.startswith(name + "_"):
+                    value = value if isinstance(value, int) else round(value, 6)
+                    lines.append(f"{metric}{prometheus_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+    
+    def render(self):
+        with self.lock:
+            return self.render_locked()
+
+
+class MetricsServer:
+    def __init__(self, sink, port, host="127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = sink.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+    
+    def start(self):
+        self.thread.start()
+    
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+metrics_sink = None
+
+
+def get_metrics_sink():
+    global metrics_sink
+    if metrics_sink is None:
+        metrics_sink = MetricsSink()
+    return metrics_sink
@@ -0,0 +1,137 @@
+import os
+import sys
+import glob
+import gzip
+import time
+import atexit
+import shutil
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from firmware import cache_dir
+
+LOG_RING_LINES = 20000  # ما يبقى في الذاكرة، والباقي في الملفات فقط
+LOG_MAX_BYTES = 8 * 1024 * 1024
+LOG_BACKUPS = 10
+LOG_FLUSH_INTERVAL = 1.0
+LOG_NAME = "odin4"
+
+
+def format_log_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)) + f".{int(timestamp * 1000) % 1000:03d}"
+
+
+def format_log_record(record):
+    _, timestamp, source, text = record
+    return f"{format_log_time(timestamp)} [{source}] {text}"
+
+
+class OperationLog:
+    def __init__(self, directory=None, ring_lines=LOG_RING_LINES, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+        self.directory = directory or os.path.join(cache_dir(), "logs")
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"{LOG_NAME}.log")
+        self.max_bytes = max_bytes
+        self.backups = backups
+        # كل سجل: (رقم تسلسلي، الوقت، المصدر، النص)؛ الرقم يسمح للواجهة بطلب الجديد فقط
+        self.ring = deque(maxlen=ring_lines)
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.file = None
+        self.size = 0
+        self.last_flush = 0.0
+        self.failed = False
+        # ضغط الملفات المدورة في خيط منفصل حتى لا تتوقف حلقة الأحداث أثناء الكتابة
+        self.compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="odin4-log")
+        for leftover in glob.glob(os.path.join(self.directory, f"{LOG_NAME}-*.log")):
+            self.compressor.submit(self.compress, leftover)
+    
+    def write(self, source, text):
+        now = time.time()
+        with self.lock:
+            self.seq += 1
+            record = (self.seq, now, source, text)
+            self.ring.append(record)
+            try:
+                self.write_locked(format_log_record(record) + "\n", now)
+            except OSError as e:
+                # السجل لا يوقف التفليش؛ نبلغ مرة واحدة فقط
+                if not self.failed:
+                    print(f"Error writing operation log: {e}", file=sys.stderr)
+                self.failed = True
+    
+    def write_locked(self, line, now):
+        if self.file is None:
+            self.file = open(self.path, "a", encoding="utf-8", errors="replace")
+            self.size = self.file.tell()
+        self.file.write(line)
+        self.size += len(line)
+        if self.size >= self.max_bytes:
+            self.rotate_locked()
+        elif now - self.last_flush >= LOG_FLUSH_INTERVAL:
+            self.file.flush()
+            self.last_flush = now
+    
+    def rotate_locked(self):
+        self.file.close()
+        self.file = None
+        rotated = os.path.join(self.directory, f"{LOG_NAME}-{time.strftime('%Y%m%d-%H%M%S')}-{self.seq:012d}.log")
+        os.replace(self.path, rotated)
+        try:
+            self.compressor.submit(self.compress, rotated)
+        except RuntimeError:
+            # أثناء إغلاق البرنامج: يُضغط الملف عند التشغيل التالي
+            pass
+    
+    def compress(self, rotated):
+        try:
+            temp_path = f"{rotated}.gz.tmp"
+            with open(rotated, "rb") as source, gzip.open(temp_path, "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.replace(temp_path, f"{rotated}.gz")
+            os.remove(rotated)
+            # أسماء الملفات تبدأ بالتاريخ فترتيبها الأبجدي هو ترتيبها الزمني
+            archives = sorted(glob.glob(os.path.join(self.directory, f"{LOG_NAME}-*.log.gz")))
+            for old in archives[:max(len(archives) - self.backups, 0)]:
+                os.remove(old)
+        except OSError as e:
+            print(f"Error compressing {rotated}: {e}", file=sys.stderr)
+    
+    def since(self, seq):
+        # السجلات الأحدث من seq فقط، دون المرور على كامل الحلقة
+        with self.lock:
+            count = min(self.seq - seq, len(self.ring))
+            if count <= 0:
+                return []
+            records = list(islice(reversed(self.ring), count))
+        records.reverse()
+        return records
+    
+    def flush(self):
+        with self.lock:
+            if self.file is not None:
+                try:
+                    self.file.flush()
+                except OSError:
+                    pass
+                self.last_flush = time.time()
+    
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+        self.compressor.shutdown(wait=True)
+
+
+operation_log = None
+
+
+def get_operation_log():
+    global operation_log
+    if operation_log is None:
+        operation_log = OperationLog()
+        atexit.register(operation_log.close)
+    return operation_log
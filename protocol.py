@@ -0,0 +1,550 @@
+import mmap
+import time
+import errno
+import ctypes
+import struct
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from devices import DOWNLOAD_MODE_USB_IDS
+
+# بروتوكول Samsung Download (Odin/Loke): أوامر بحجم 1024 بايت وردود بحجم 8 بايت، كلها little-endian
+HANDSHAKE_REQUEST = b"ODIN"
+HANDSHAKE_RESPONSE = b"LOKE"
+COMMAND_PACKET_SIZE = 1024
+RESPONSE = struct.Struct("<ii")
+
+SESSION_PACKET = 0x64
+SESSION_BEGIN = 0
+SESSION_TOTAL_BYTES = 2
+SESSION_FILE_PART_SIZE = 5
+
+PIT_PACKET = 0x65
+PIT_DUMP = 1
+PIT_PART = 2
+PIT_END = 3
+
+FILE_PACKET = 0x66
+FILE_FLASH = 0
+FILE_DUMP = 1
+FILE_PART = 2
+FILE_END = 3
+FILE_PART_RESPONSE = 0x00  # كل جزء يؤكَّد برد نوعه 0 ورقم الجزء، وليس 0x66 (SendFilePartResponse في Heimdall)
+
+END_SESSION_PACKET = 0x67
+END_SESSION = 0
+END_SESSION_REBOOT = 1
+
+PIT_MAGIC = 0x12349876
+PIT_HEADER = struct.Struct("<II20x")
+PIT_ENTRY = struct.Struct("<9I32s32s32s")
+PIT_PART_SIZE = 500
+DUMP_PART_SIZE = 500  # قراءة الأقسام تأتي بأجزاء صغيرة مثل PIT
+PIT_BINARY_MODEM = 1  # أقسام CP تُرسل إلى المودم وليس إلى الهاتف
+
+DESTINATION_PHONE = 0
+DESTINATION_MODEM = 1
+
+# حجم الجزء الافتراضي، والأجهزة الأحدث تقبل 1 MiB لكل نقل bulk؛ والتسلسل عدد الأجزاء قبل كل تأكيد كتابة
+DEFAULT_FILE_PART_SIZE = 128 * 1024
+LARGE_FILE_PART_SIZE = 1024 * 1024
+SEQUENCE_PARTS = {DEFAULT_FILE_PART_SIZE: 800, LARGE_FILE_PART_SIZE: 30}
+
+USB_TIMEOUT = 60.0
+USB_CLASS_CDC_DATA = 0x0A
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class TransferTimeout(ProtocolError):
+    def __init__(self, timeout):
+        super().__init__(f"no response from the device for {timeout:g}s")
+        self.timeout = timeout
+
+
+class SessionCancelled(ProtocolError):
+    def __init__(self):
+        super().__init__("Operation cancelled by user")
+
+
+class PitEntry:
+    def __init__(self, binary_type, device_type, identifier, attributes, update_attributes, block_size, block_count,
+                 file_offset, file_size, partition_name, flash_filename, fota_filename):
+        self.binary_type = binary_type
+        self.device_type = device_type
+        self.identifier = identifier
+        self.attributes = attributes
+        self.update_attributes = update_attributes
+        self.block_size = block_size
+        self.block_count = block_count
+        self.file_offset = file_offset
+        self.file_size = file_size
+        self.partition_name = partition_name
+        self.flash_filename = flash_filename
+        self.fota_filename = fota_filename
+
+
+def pit_string(value):
+    return value.split(b"\0", 1)[0].decode("ascii", errors="replace")
+
+
+def parse_pit(data):
+    if len(data) < PIT_HEADER.size:
+        raise ProtocolError("PIT is too short")
+    magic, count = PIT_HEADER.unpack_from(data)
+    if magic != PIT_MAGIC:
+        raise ProtocolError(f"bad PIT magic {magic:#010x}")
+    if len(data) < PIT_HEADER.size + count * PIT_ENTRY.size:
+        raise ProtocolError(f"PIT is truncated ({count} entries, {len(data)} bytes)")
+    entries = []
+    for index in range(count):
+        values = PIT_ENTRY.unpack_from(data, PIT_HEADER.size + index * PIT_ENTRY.size)
+        entries.append(PitEntry(*values[:9], *(pit_string(value) for value in values[9:])))
+    return entries
+
+
+def build_pit(partitions, device_type=2):
+    # partitions: قائمة (اسم القسم، اسم الملف، نوع الثنائي)، للجهاز المحاكي
+    data = bytearray(PIT_HEADER.pack(PIT_MAGIC, len(partitions)))
+    for identifier, (partition_name, flash_filename, binary_type) in enumerate(partitions, 1):
+        data += PIT_ENTRY.pack(binary_type, device_type, identifier, 0, 0, 512, 0, 0, 0,
+                               partition_name.encode(), flash_filename.encode(), b"")
+    return bytes(data)
+
+
+def find_pit_entry(entries, file_name):
+    name = file_name.rsplit("/", 1)[-1].lower()
+    return next((entry for entry in entries if entry.flash_filename and entry.flash_filename.lower() == name), None)
+
+
+@contextmanager
+def mapped_region(path, offset, size):
+    # ACCESS_COPY يعطي ذاكرة قابلة للكتابة (خاصة بالعملية) يمكن تمرير عنوانها إلى libusb بدون نسخ
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    try:
+        with memoryview(mapped) as view:
+            yield view[offset:offset + size]
+    finally:
+        try:
+            mapped.close()
+        except BufferError:
+            # جزء من الذاكرة ما زال مرجعاً في traceback، ويُحرر معه
+            pass
+
+
+class DownloadSession:
+    def __init__(self, transport, cancel_event=None):
+        self.transport = transport
+        self.cancel_event = cancel_event or threading.Event()
+        self.part_size = DEFAULT_FILE_PART_SIZE
+        self.command = bytearray(COMMAND_PACKET_SIZE)
+    
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise SessionCancelled()
+    
+    def send_command(self, packet_type, request, *values, layout=None):
+        self.command[:] = bytes(COMMAND_PACKET_SIZE)
+        struct.pack_into(layout or f"<ii{len(values)}i", self.command, 0, packet_type, request, *values)
+        self.transport.send(self.command)
+    
+    def expect(self, packet_type, data=None):
+        response = self.transport.receive(RESPONSE.size)
+        if len(response) < RESPONSE.size:
+            raise ProtocolError(f"short response ({len(response)} bytes) to packet {packet_type:#x}")
+        response_type, response_data = RESPONSE.unpack_from(response)
+        if response_type != packet_type:
+            raise ProtocolError(f"unexpected response {response_type:#x} to packet {packet_type:#x}")
+        if data is not None and response_data != data:
+            raise ProtocolError(f"device answered {response_data} to packet {packet_type:#x}, expected {data}")
+        return response_data
+    
+    def request(self, packet_type, request, *values, layout=None):
+        self.send_command(packet_type, request, *values, layout=layout)
+        return self.expect(packet_type)
+    
+    def handshake(self):
+        self.transport.send(HANDSHAKE_REQUEST)
+        response = self.transport.receive(len(HANDSHAKE_RESPONSE))
+        if bytes(response[:len(HANDSHAKE_RESPONSE)]) != HANDSHAKE_RESPONSE:
+            raise ProtocolError(f"device did not answer the handshake (got {bytes(response)!r})")
+    
+    def begin(self, total_bytes=None):
+        # رد غير صفري يعني أن الجهاز يقبل أجزاء أكبر من الافتراضي
+        if self.request(SESSION_PACKET, SESSION_BEGIN):
+            self.request(SESSION_PACKET, SESSION_FILE_PART_SIZE, LARGE_FILE_PART_SIZE)
+            self.part_size = LARGE_FILE_PART_SIZE
+        if total_bytes is not None:
+            self.send_total_bytes(total_bytes)
+    
+    def send_total_bytes(self, total_bytes):
+        # قراءة PIT أو الأقسام لا تحتاجه، فقط التفليش
+        self.request(SESSION_PACKET, SESSION_TOTAL_BYTES, total_bytes, layout="<iiQ")
+    
+    def read_pit(self):
+        size = self.request(PIT_PACKET, PIT_DUMP)
+        if size <= 0:
+            raise ProtocolError("device returned an empty PIT")
+        data = bytearray()
+        for index in range((size + PIT_PART_SIZE - 1) // PIT_PART_SIZE):
+            self.send_command(PIT_PACKET, PIT_PART, index)
+            data += self.transport.receive(min(PIT_PART_SIZE, size - len(data)))
+        self.request(PIT_PACKET, PIT_END)
+        return bytes(data[:size])
+    
+    def flash(self, data, entry, on_progress=None):
+        # data: memoryview على ملف مربوط بـ mmap؛ كل جزء يُرسل من مكانه، والجزء الأخير الناقص فقط يُنسخ ليُكمل بالأصفار
+        self.request(FILE_PACKET, FILE_FLASH)
+        part_size = self.part_size
+        sequence_size = part_size * SEQUENCE_PARTS.get(part_size, 30)
+        total = len(data)
+        sent = 0
+        while sent < total:
+            sequence_bytes = min(sequence_size, total - sent)
+            self.request(FILE_PACKET, FILE_PART, sequence_bytes)
+            for index, start in enumerate(range(sent, sent + sequence_bytes, part_size)):
+                self.check_cancelled()
+                end = min(start + part_size, sent + sequence_bytes)
+                if end - start == part_size:
+                    self.transport.send(data[start:end])
+                else:
+                    padded = bytearray(part_size)
+                    padded[:end - start] = data[start:end]
+                    self.transport.send(padded)
+                self.expect(FILE_PART_RESPONSE, index)
+                if on_progress:
+                    on_progress(end)
+            sent += sequence_bytes
+            self.end_file_transfer(entry, sequence_bytes, sent >= total)
+    
+    def dump(self, entry, write, on_progress=None):
+        # قراءة قسم من الجهاز (نفس طلب Heimdall)؛ محملات إقلاع كثيرة ترفضه فيرد الجهاز بحجم صفر
+        self.request(FILE_PACKET, FILE_DUMP)
+        size = self.request(FILE_PACKET, FILE_DUMP, entry.binary_type, entry.identifier)
+        if size <= 0:
+            raise ProtocolError(f"device refused to dump {entry.partition_name}")
+        done = 0
+        index = 0
+        while done < size:
+            self.check_cancelled()
+            self.send_command(FILE_PACKET, FILE_PART, index)
+            data = self.transport.receive(min(DUMP_PART_SIZE, size - done))
+            if not data:
+                raise ProtocolError(f"empty part {index} while dumping {entry.partition_name}")
+            data = data[:size - done]
+            write(data)
+            done += len(data)
+            index += 1
+            if on_progress:
+                on_progress(done, size)
+        self.request(FILE_PACKET, FILE_END)
+        return size
+    
+    def end_file_transfer(self, entry, sequence_bytes, end_of_file):
+        if entry.binary_type == PIT_BINARY_MODEM:
+            self.send_command(FILE_PACKET, FILE_END, DESTINATION_MODEM, sequence_bytes, 0, entry.device_type, int(end_of_file))
+        else:
+            self.send_command(FILE_PACKET, FILE_END, DESTINATION_PHONE, sequence_bytes, 0, entry.device_type,
+                              entry.identifier, int(end_of_file))
+        self.expect(FILE_PACKET)
+    
+    def end(self, reboot=False):
+        self.request(END_SESSION_PACKET, END_SESSION)
+        if reboot:
+            self.request(END_SESSION_PACKET, END_SESSION_REBOOT)
+
+
+class BulkBuffer:
+    # واجهة array.array التي تحتاجها واجهة libusb1 في pyusb (buffer_info وitemsize) فوق ذاكرة موجودة، بدون نسخ
+    itemsize = 1
+    
+    def __init__(self, view):
+        self.pointer = ctypes.c_char.from_buffer(view)
+        self.length = len(view)
+    
+    def buffer_info(self):
+        return ctypes.addressof(self.pointer), self.length
+
+
+class UsbTransport:
+    def __init__(self, port_path=None, timeout=USB_TIMEOUT):
+        # port_path: (bus، أرقام المنافذ) لاختيار الجهاز الصحيح عند توصيل عدة أجهزة
+        self.port_path = port_path
+        self.timeout = timeout
+        self.device = None
+        self.interface = None
+        self.detached = False
+        self.direct_write = None
+    
+    def open(self):
+        try:
+            import usb.core
+            import usb.util
+        except ImportError:
+            raise ProtocolError("the native backend needs pyusb (pip install pyusb) and libusb")
+        self.usb = usb
+        try:
+            found = list(usb.core.find(find_all=True))
+        except usb.core.NoBackendError:
+            raise ProtocolError("the native backend needs libusb, which was not found")
+        devices = [
+            device for device in found
+            if (device.idVendor, device.idProduct) in DOWNLOAD_MODE_USB_IDS
+            and (self.port_path is None or (device.bus, tuple(device.port_numbers or ())) == self.port_path)
+        ]
+        if not devices:
+            raise ProtocolError("no device in download mode found on this USB port")
+        if len(devices) > 1:
+            raise ProtocolError("several devices in download mode, select the device by its port")
+        device = self.device = devices[0]
+        
+        try:
+            config = device.get_active_configuration()
+        except usb.core.USBError:
+            device.set_configuration()
+            config = device.get_active_configuration()
+        # واجهة CDC Data ذات نقطتي bulk هي قناة البروتوكول
+        interface = next((
+            candidate for candidate in config
+            if candidate.bInterfaceClass == USB_CLASS_CDC_DATA and candidate.bNumEndpoints >= 2
+        ), None)
+        if interface is None:
+            raise ProtocolError("device has no CDC data interface")
+        number = interface.bInterfaceNumber
+        try:
+            if device.is_kernel_driver_active(number):
+                device.detach_kernel_driver(number)
+                self.detached = True
+        except (NotImplementedError, usb.core.USBError):
+            pass
+        usb.util.claim_interface(device, number)
+        self.interface = number
+        self.out_endpoint = usb.util.find_descriptor(
+            interface, custom_match=lambda e: usb.util.endpoint_direction(e.bEndpointAddress) == usb.util.ENDPOINT_OUT)
+        self.in_endpoint = usb.util.find_descriptor(
+            interface, custom_match=lambda e: usb.util.endpoint_direction(e.bEndpointAddress) == usb.util.ENDPOINT_IN)
+        
+        # Device.write ينسخ كل جزء إلى array؛ واجهة libusb1 تقبل أي كائن يعطي عنوان الذاكرة مباشرة
+        context = getattr(device, "_ctx", None)
+        backend = getattr(context, "backend", None)
+        if backend is not None and type(backend).__module__.endswith("libusb1") and getattr(context, "handle", None) is not None:
+            self.direct_write = lambda view: backend.bulk_write(
+                context.handle, self.out_endpoint.bEndpointAddress, number, BulkBuffer(view), self.timeout_ms())
+    
+    def timeout_ms(self):
+        return int(self.timeout * 1000) if self.timeout else 0
+    
+    def usb_call(self, call):
+        try:
+            return call()
+        except self.usb.core.USBError as e:
+            if isinstance(e, getattr(self.usb.core, "USBTimeoutError", ())) or e.errno == errno.ETIMEDOUT:
+                raise TransferTimeout(self.timeout)
+            raise ProtocolError(f"USB error: {e}")
+    
+    def send(self, data):
+        view = memoryview(data)
+        if self.direct_write is not None and not view.readonly:
+            written = self.usb_call(lambda: self.direct_write(view))
+        else:
+            written = self.usb_call(lambda: self.out_endpoint.write(view, self.timeout_ms()))
+        if written != len(view):
+            raise ProtocolError(f"short USB write ({written} of {len(view)} bytes)")
+    
+    def receive(self, size):
+        # القراءة بمضاعفات حجم حزمة USB حتى لا يحدث overflow إن أرسل الجهاز أكثر
+        packet_size = self.in_endpoint.wMaxPacketSize or 512
+        length = -(-size // packet_size) * packet_size
+        return bytes(self.usb_call(lambda: self.in_endpoint.read(length, self.timeout_ms())))
+    
+    def close(self):
+        if self.device is None:
+            return
+        try:
+            if self.interface is not None:
+                self.usb.util.release_interface(self.device, self.interface)
+                if self.detached:
+                    self.device.attach_kernel_driver(self.interface)
+        except (NotImplementedError, self.usb.core.USBError):
+            pass
+        self.usb.util.dispose_resources(self.device)
+        self.device = None
+        self.direct_write = None
+
+
+# أقسام شائعة في PIT أجهزة Samsung، للجهاز المحاكي
+SIMULATED_PARTITIONS = (
+    ("BOOTLOADER", "sboot.bin", 0),
+    ("PARAM", "param.bin", 0),
+    ("UP_PARAM", "up_param.bin", 0),
+    ("CM", "cm.bin", 0),
+    ("KEYSTORAGE", "keystorage.bin", 0),
+    ("EFS", "efs.img", 0),
+    ("DTBO", "dtbo.img", 0),
+    ("VBMETA", "vbmeta.img", 0),
+    ("BOOT", "boot.img", 0),
+    ("RECOVERY", "recovery.img", 0),
+    ("SYSTEM", "system.img", 0),
+    ("VENDOR", "vendor.img", 0),
+    ("PRODUCT", "product.img", 0),
+    ("SUPER", "super.img", 0),
+    ("CACHE", "cache.img", 0),
+    ("OMR", "omr.img", 0),
+    ("USERDATA", "userdata.img", 0),
+    ("RADIO", "modem.bin", PIT_BINARY_MODEM),
+)
+
+
+class SimulatedDevice:
+    def __init__(self, partitions=SIMULATED_PARTITIONS, rate=None, stall_after=None, timeout=USB_TIMEOUT, keep_data=True, handshake=0.0):
+        # جهاز Download في الذاكرة يطبق جهة الجهاز من البروتوكول، للاختبارات وقياس الأداء بدون USB
+        self.pit = build_pit(partitions)
+        self.entries = parse_pit(self.pit)
+        self.rate = rate
+        self.handshake = handshake
+        self.stall_after = stall_after
+        self.timeout = timeout
+        self.keep_data = keep_data
+        self.responses = deque()
+        self.partitions = {}
+        self.written = {}
+        self.part_size = DEFAULT_FILE_PART_SIZE
+        self.total_bytes = None
+        self.handshaken = False
+        self.parts_left = 0
+        self.part_index = 0
+        self.sequence = bytearray()
+        self.received = 0
+        self.stalled = False
+        self.dump_data = None
+        self.dumps = 0
+        self.session_ended = False
+        self.rebooted = False
+        self.opened = False
+    
+    def open(self):
+        # المحمل يقبل مصافحة واحدة: بعد END_SESSION بدون إعادة تشغيل يُستأنف بلا مصافحة (--resume في Heimdall)،
+        # أما بعد جلسة مقطوعة أو إعادة تشغيل فيبدأ الاتصال التالي بالمصافحة
+        self.opened = True
+        if not self.session_ended or self.rebooted:
+            self.handshaken = False
+    
+    def close(self):
+        self.opened = False
+    
+    def respond(self, packet_type, data=0):
+        self.responses.append(RESPONSE.pack(packet_type, data))
+    
+    def send(self, data):
+        if self.stalled:
+            raise TransferTimeout(self.timeout)
+        data = memoryview(data)
+        if self.parts_left:
+            self.receive_part(data)
+        elif not self.handshaken:
+            if bytes(data) != HANDSHAKE_REQUEST:
+                raise ProtocolError(f"simulated device: bad handshake {bytes(data[:8])!r}")
+            if self.handshake:
+                time.sleep(self.handshake)
+            self.handshaken = True
+            self.responses.append(HANDSHAKE_RESPONSE)
+        else:
+            if bytes(data) == HANDSHAKE_REQUEST:
+                raise ProtocolError("simulated device: second handshake in the same download mode session")
+            if len(data) != COMMAND_PACKET_SIZE:
+                raise ProtocolError(f"simulated device: command packet of {len(data)} bytes")
+            packet_type, request = struct.unpack_from("<ii", data)
+            self.command(packet_type, request, data)
+    
+    def receive_part(self, data):
+        if len(data) != self.part_size:
+            raise ProtocolError(f"simulated device: file part of {len(data)} bytes, expected {self.part_size}")
+        if self.stall_after is not None and self.received + len(data) > self.stall_after:
+            self.stalled = True
+            return
+        if self.rate:
+            time.sleep(len(data) / self.rate)
+        if self.keep_data:
+            self.sequence += data
+        self.received += len(data)
+        self.respond(FILE_PART_RESPONSE, self.part_index)
+        self.part_index += 1
+        self.parts_left -= 1
+    
+    def command(self, packet_type, request, data):
+        values = struct.unpack_from("<6i", data, 8)
+        if packet_type == SESSION_PACKET:
+            if request == SESSION_BEGIN:
+                self.session_ended = False
+                self.respond(SESSION_PACKET, DEFAULT_FILE_PART_SIZE)
+                return
+            if request == SESSION_FILE_PART_SIZE:
+                self.part_size = values[0]
+            elif request == SESSION_TOTAL_BYTES:
+                self.total_bytes = struct.unpack_from("<Q", data, 8)[0]
+            self.respond(SESSION_PACKET)
+        elif packet_type == PIT_PACKET:
+            if request == PIT_DUMP:
+                self.respond(PIT_PACKET, len(self.pit))
+            elif request == PIT_PART:
+                self.responses.append(self.pit[values[0] * PIT_PART_SIZE:(values[0] + 1) * PIT_PART_SIZE])
+            else:
+                self.respond(PIT_PACKET)
+        elif packet_type == FILE_PACKET:
+            if self.dump_data is not None:
+                self.dump_command(request, values)
+                return
+            if request == FILE_DUMP:
+                self.dump_data = b""
+                self.respond(FILE_PACKET)
+                return
+            if request == FILE_PART:
+                self.parts_left = -(-values[0] // self.part_size)
+                self.part_index = 0
+                self.sequence = bytearray()
+            elif request == FILE_END:
+                self.end_file_transfer(values)
+            self.respond(FILE_PACKET)
+        elif packet_type == END_SESSION_PACKET:
+            if request == END_SESSION_REBOOT:
+                self.rebooted = True
+            self.session_ended = True
+            self.respond(END_SESSION_PACKET)
+        else:
+            raise ProtocolError(f"simulated device: unknown packet {packet_type:#x}")
+    
+    def dump_command(self, request, values):
+        # بعد FILE_DUMP: اختيار القسم، ثم أجزاء بالترتيب، ثم FILE_END
+        if request == FILE_DUMP:
+            entry = next((entry for entry in self.entries if entry.identifier == values[1]), None)
+            self.dump_data = bytes(self.partitions.get(entry.partition_name, b"")) if entry is not None else b""
+            self.dumps += 1
+            self.respond(FILE_PACKET, len(self.dump_data))
+        elif request == FILE_PART:
+            if self.rate:
+                time.sleep(DUMP_PART_SIZE / self.rate)
+            self.responses.append(self.dump_data[values[0] * DUMP_PART_SIZE:(values[0] + 1) * DUMP_PART_SIZE])
+        else:
+            self.dump_data = None
+            self.respond(FILE_PACKET)
+    
+    def end_file_transfer(self, values):
+        destination, sequence_bytes = values[0], values[1]
+        if destination == DESTINATION_MODEM:
+            entry = next(entry for entry in self.entries if entry.binary_type == PIT_BINARY_MODEM)
+        else:
+            entry = next(entry for entry in self.entries if entry.identifier == values[4])
+        self.written[entry.partition_name] = self.written.get(entry.partition_name, 0) + sequence_bytes
+        if self.keep_data:
+            self.partitions.setdefault(entry.partition_name, bytearray()).extend(self.sequence[:sequence_bytes])
+    
+    def receive(self, size):
+        if self.stalled or not self.responses:
+            # جهاز لا يرد: نفس ما يحدث مع كابل متقطع بعد انتهاء مهلة USB
+            time.sleep(self.timeout)
+            raise TransferTimeout(self.timeout)
+        return self.responses.popleft()[:size]
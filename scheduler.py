@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+
+from devices import USB_CONTROLLER_PREFIX, list_devices, usb_topology
+from firmware import cache_dir, get_writer_executor
+
+HUB_TRANSFER_LIMIT = 2  # قبل أي قياس: جهازان على نفس الـ hub وأربعة على نفس المتحكم
+CONTROLLER_TRANSFER_LIMIT = 4
+MAX_TRANSFER_LIMIT = 16
+SATURATION_GAIN = 1.15  # جهاز إضافي على الفرع يجب أن يرفع مجموع السرعة 15% على الأقل
+BRANCH_RATE_WEIGHT = 0.3
+MIN_SAMPLE_BYTES = 1024 * 1024
+DEFAULT_TRANSFER_RATE = 20 * 1024 * 1024
+
+
+class TransferSlot:
+    def __init__(self, com_port, branch, size):
+        self.com_port = com_port
+        self.branch = branch
+        self.size = size
+        self.start_time = None
+        self.load_start = {}
+
+
+class BranchLoad:
+    def __init__(self):
+        # عدد النقلات الجارية وتكامله عبر الزمن، لحساب متوسط التزامن الذي عاشه كل نقل
+        self.count = 0
+        self.integral = 0.0
+        self.last = time.monotonic()
+    
+    def advance(self, now):
+        self.integral += self.count * (now - self.last)
+        self.last = now
+
+
+class TransferScheduler:
+    def __init__(self, topology=None, history_path=None):
+        self.topology = topology or usb_topology
+        self.history_path = history_path or os.path.join(cache_dir(), "branch_rates.json")
+        self.lock = threading.Lock()
+        self.rates = self.load_history()
+        self.loads = {}
+        self.waiters = []
+    
+    def load_history(self):
+        # لكل فرع: سرعة النقل الواحد المقاسة عند كل مستوى تزامن
+        try:
+            with open(self.history_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def save_history(self, rates):
+        temp_path = f"{self.history_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(rates, f)
+            os.replace(temp_path, self.history_path)
+        except OSError as e:
+            print(f"Error saving USB branch rates: {e}", file=sys.stderr)
+    
+    def refresh(self):
+        # في الوضع النصي لا يوجد مراقب أجهزة، فنقرأ مواقع المنافذ مرة واحدة
+        try:
+            list_devices()
+        except Exception as e:
+            print(f"USB topology unavailable: {e}", file=sys.stderr)
+    
+    def branch(self, com_port):
+        return self.topology.branch(com_port)
+    
+    def load(self, node):
+        load = self.loads.get(node)
+        if load is None:
+            load = self.loads[node] = BranchLoad()
+        return load
+    
+    def limit(self, node):
+        levels = {int(level): rate * int(level) for level, rate in self.rates.get(node, {}).items()}
+        if not levels:
+            return CONTROLLER_TRANSFER_LIMIT if node.startswith(USB_CONTROLLER_PREFIX) else HUB_TRANSFER_LIMIT
+        # أقل تزامن يعطي تقريباً أفضل مجموع سرعة؛ وإن كان الأعلى المقاس ما زال يتحسن نجرب جهازاً آخر
+        best = max(levels.values())
+        cap = min(level for level, total in levels.items() if total * SATURATION_GAIN >= best)
+        if cap == max(levels):
+            cap += 1
+        return min(cap, MAX_TRANSFER_LIMIT)
+    
+    def has_room_locked(self, branch):
+        return all(self.load(node).count < self.limit(node) for node in branch)
+    
+    def has_room(self, com_port):
+        branch = self.branch(com_port)
+        with self.lock:
+            return self.has_room_locked(branch)
+    
+    def estimate_locked(self, branch, size):
+        if not branch:
+            return size / DEFAULT_TRANSFER_RATE
+        rates = self.rates.get(branch[-1], {})
+        level = self.load(branch[-1]).count + 1
+        measured = [int(known) for known in rates]
+        rate = rates[str(min(measured, key=lambda known: abs(known - level)))] if measured else DEFAULT_TRANSFER_RATE
+        return size / rate
+    
+    def order(self, requests):
+        # requests: قائمة (المنفذ، الحجم). النتيجة ترتيب البدء: الأجهزة موزعة على الفروع،
+        # وداخل كل موجة الأطول زمناً أولاً حتى لا يبقى نقل طويل وحده في النهاية
+        with self.lock:
+            branches = [self.branch(com_port) for com_port, _ in requests]
+            estimates = [self.estimate_locked(branch, size) for branch, (_, size) in zip(branches, requests)]
+            positions = {}
+            ranks = {}
+            for index in sorted(range(len(requests)), key=lambda index: -estimates[index]):
+                branch = branches[index]
+                if not branch:
+                    ranks[index] = 0
+                    continue
+                leaf = branch[-1]
+                position = positions.get(leaf, self.load(leaf).count)
+                positions[leaf] = position + 1
+                ranks[index] = position // self.limit(leaf)
+        return sorted(range(len(requests)), key=lambda index: (ranks[index], -estimates[index]))
+    
+    def start_locked(self, slot):
+        now = time.monotonic()
+        for node in slot.branch:
+            load = self.load(node)
+            load.advance(now)
+            slot.load_start[node] = load.integral
+            load.count += 1
+        slot.start_time = now
+    
+    async def acquire(self, com_port, size):
+        slot = TransferSlot(com_port, self.branch(com_port), size)
+        with self.lock:
+            if self.has_room_locked(slot.branch):
+                self.start_locked(slot)
+                return slot
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self.waiters.append((slot, loop, future))
+        
+        try:
+            await future
+        except BaseException:
+            with self.lock:
+                granted = slot.start_time is not None
+                self.waiters = [waiter for waiter in self.waiters if waiter[0] is not slot]
+            if granted:
+                self.release(slot, 0)
+            raise
+        return slot
+    
+    def release(self, slot, done_bytes):
+        with self.lock:
+            now = time.monotonic()
+            duration = now - slot.start_time
+            measured = done_bytes >= MIN_SAMPLE_BYTES and duration > 0
+            for node in slot.branch:
+                load = self.load(node)
+                load.advance(now)
+                if measured:
+                    concurrency = max(1, round((load.integral - slot.load_start[node]) / duration))
+                    rates = self.rates.setdefault(node, {})
+                    rate = done_bytes / duration
+                    previous = rates.get(str(concurrency))
+                    rates[str(concurrency)] = rate if previous is None else BRANCH_RATE_WEIGHT * rate + (1 - BRANCH_RATE_WEIGHT) * previous
+                load.count -= 1
+            
+            granted = []
+            for waiter in sorted(self.waiters, key=lambda waiter: -self.estimate_locked(waiter[0].branch, waiter[0].size)):
+                if self.has_room_locked(waiter[0].branch):
+                    self.start_locked(waiter[0])
+                    self.waiters.remove(waiter)
+                    granted.append(waiter)
+            # نسخة من السرعات تُكتب خارج القفل وخارج حلقة الأحداث
+            snapshot = {node: dict(rates) for node, rates in self.rates.items()} if measured else None
+        
+        if snapshot is not None:
+            get_writer_executor().submit(self.save_history, snapshot)
+        for _, loop, future in granted:
+            loop.call_soon_threadsafe(lambda future=future: future.done() or future.set_result(None))
+
+
+transfer_scheduler = None
+
+
+def get_transfer_scheduler():
+    global transfer_scheduler
+    if transfer_scheduler is None:
+        transfer_scheduler = TransferScheduler()
+    return transfer_scheduler
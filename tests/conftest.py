@@ -0,0 +1,46 @@
+import io
+import os
+import sys
+import hashlib
+import tarfile
+
+import pytest
+
+# الوحدات في جذر المستودع وليست حزمة مثبتة
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+FAKE_ODIN = os.path.join(ROOT, "benchmarks", "fake_odin.py")
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    # الاختبارات لا تكتب في كاش المستخدم ولا في مجلد بياناته
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "data"))
+
+
+@pytest.fixture
+def make_firmware(tmp_path):
+    # أرشيف tar بالأعضاء المعطاة، ومع سطر md5 في آخره إن انتهى الاسم بـ .md5
+    def make(name, members):
+        path = str(tmp_path / name)
+        with tarfile.open(path, "w") as archive:
+            for member, data in members.items():
+                info = tarfile.TarInfo(member)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        if name.endswith(".md5"):
+            with open(path, "rb") as f:
+                digest = hashlib.md5(f.read()).hexdigest()
+            with open(path, "ab") as f:
+                f.write(f"{digest}  {name[:-4]}\n".encode())
+        return path
+    return make
+
+
+@pytest.fixture
+def fake_odin():
+    # أمر محاكي Odin من benchmarks بدل odin4 الحقيقي
+    def command(*options):
+        return [sys.executable, FAKE_ODIN, "--fake-handshake", "0", "--fake-reboot", "0", "--fake-rate", "40M", *options]
+    return command
@@ -0,0 +1,129 @@
+import io
+import os
+import threading
+
+import pytest
+
+import cluster
+import devices
+from cluster import AgentError, Coordinator, FlashAgent, RemoteJob
+from firmware import FirmwareVerifier
+
+
+def remote_agent(coordinator, address, host, capacity, ports, busy=()):
+    agent = coordinator.agents[cluster.agent_url(address)]
+    agent.online = True
+    agent.host = host
+    agent.capacity = capacity
+    agent.devices = [
+        {"port": com_port, "description": "", "kind": kind, "busy": com_port in busy}
+        for com_port, kind in ports
+    ]
+    return agent
+
+
+def test_place_prefers_least_loaded_agent():
+    coordinator = Coordinator(["10.0.0.1:8765", "10.0.0.2:8765"])
+    first = remote_agent(coordinator, "10.0.0.1:8765", "10.0.0.1", 2, [("/dev/ttyACM0", "download"), ("/dev/ttyACM1", "download")])
+    second = remote_agent(coordinator, "10.0.0.2:8765", "10.0.0.2", 2, [("/dev/ttyACM0", "normal"), ("/dev/ttyACM1", "download")])
+    job = RemoteJob(None, None, "", [], False, False)
+    
+    assert coordinator.place(job, {first.url: 1, second.url: 0}, set()) == (second, "/dev/ttyACM1")
+    assert coordinator.place(job, {first.url: 0, second.url: 1}, set()) == (first, "/dev/ttyACM0")
+    # عقدة بلغت سعتها لا تأخذ مهاماً أخرى
+    assert coordinator.place(job, {first.url: 2, second.url: 2}, set()) == (None, None)
+
+
+def test_place_skips_busy_ports():
+    coordinator = Coordinator(["10.0.0.1:8765"])
+    agent = remote_agent(coordinator, "10.0.0.1:8765", "10.0.0.1", 4, [("/dev/ttyACM0", "download"), ("/dev/ttyACM1", "download")], busy={"/dev/ttyACM0"})
+    job = RemoteJob(None, None, "", [], False, False)
+    assert coordinator.place(job, {agent.url: 0}, set()) == (agent, "/dev/ttyACM1")
+    assert coordinator.place(job, {agent.url: 0}, {("10.0.0.1", "/dev/ttyACM1")}) == (None, None)
+
+
+def test_place_shares_busy_ports_between_agents_on_one_host():
+    # عقدتان على نفس الجهاز تريان نفس المنافذ
+    coordinator = Coordinator(["127.0.0.1:8765", "127.0.0.1:8766"])
+    ports = [("/dev/ttyACM0", "download")]
+    first = remote_agent(coordinator, "127.0.0.1:8765", "localhost", 4, ports)
+    second = remote_agent(coordinator, "127.0.0.1:8766", "localhost", 4, ports)
+    job = RemoteJob(None, None, "", [], False, False)
+    load = {first.url: 0, second.url: 0}
+    assert coordinator.place(job, load, {("localhost", "/dev/ttyACM0")}) == (None, None)
+    assert coordinator.place(job, load, {("10.0.0.9", "/dev/ttyACM0")})[1] == "/dev/ttyACM0"
+
+
+def test_place_pinned_job():
+    coordinator = Coordinator(["10.0.0.1:8765", "10.0.0.2:8765"])
+    ports = [("/dev/ttyACM0", "download"), ("/dev/ttyACM1", "normal")]
+    remote_agent(coordinator, "10.0.0.1:8765", "10.0.0.1", 4, ports)
+    second = remote_agent(coordinator, "10.0.0.2:8765", "10.0.0.2", 4, ports)
+    job = RemoteJob("10.0.0.2:8765", "/dev/ttyACM1", "", [], False, False)
+    assert coordinator.place(job, {url: 0 for url in coordinator.agents}, set()) == (second, "/dev/ttyACM1")
+
+
+@pytest.fixture
+def agent(tmp_path, fake_odin):
+    agent = FlashAgent(port=0, odin_path=fake_odin(), max_concurrent=2, firmware_dir=str(tmp_path / "agent"))
+    yield agent
+    agent.server.server_close()
+
+
+def upload(agent, file_path, data=None):
+    content_hash = FirmwareVerifier(cache_path=file_path + ".json").content_hash(file_path)
+    if data is None:
+        with open(file_path, "rb") as f:
+            data = f.read()
+    return agent.receive_firmware(content_hash, os.path.basename(file_path), io.BytesIO(data), len(data))
+
+
+def test_agent_receives_firmware(agent, make_firmware):
+    path = make_firmware("AP_test.tar.md5", {"boot.img": os.urandom(300000)})
+    result = upload(agent, path)
+    with open(agent.firmware_path(result["hash"], "AP_test.tar.md5"), "rb") as f, open(path, "rb") as source:
+        assert f.read() == source.read()
+
+
+def test_agent_rejects_corrupt_payload(agent, make_firmware):
+    # سطر md5 سليم في آخر الملف لا يكفي إن تغير المحتوى قبله
+    path = make_firmware("AP_test.tar.md5", {"boot.img": os.urandom(300000)})
+    with open(path, "rb") as f:
+        data = bytearray(f.read())
+    data[100000] ^= 0xFF
+    with pytest.raises(AgentError) as error:
+        upload(agent, path, bytes(data))
+    assert error.value.status == 400
+    assert not os.listdir(os.path.join(agent.firmware_dir, os.listdir(agent.firmware_dir)[0]))
+
+
+def test_agent_rejects_truncated_upload(agent, make_firmware):
+    path = make_firmware("BL_test.tar", {"sboot.bin": os.urandom(30000)})
+    with open(path, "rb") as f:
+        data = f.read()
+    content_hash = FirmwareVerifier(cache_path=path + ".json").content_hash(path)
+    with pytest.raises(AgentError) as error:
+        agent.receive_firmware(content_hash, "BL_test.tar", io.BytesIO(data[:-100]), len(data))
+    assert error.value.status == 400
+
+
+def test_coordinator_runs_jobs_on_agents(tmp_path, make_firmware, fake_odin, monkeypatch):
+    monkeypatch.setattr(devices, "list_devices", lambda download_only=False: [("/dev/fake0", "SM-X [Download Mode]"), ("/dev/fake1", "SM-X [Download Mode]")])
+    monkeypatch.setattr(cluster.port_classifier, "kind", lambda com_port: "download")
+    agents = [FlashAgent(port=0, odin_path=fake_odin(), max_concurrent=2, firmware_dir=str(tmp_path / f"agent{index}")) for index in range(2)]
+    for agent in agents:
+        agent.start()
+    finished = threading.Event()
+    coordinator = Coordinator([f"127.0.0.1:{agent.port}" for agent in agents], on_all_finished=lambda jobs: finished.set(), poll_interval=0.1)
+    files = [("AP File", make_firmware("AP_test.tar.md5", {"boot.img": os.urandom(500000)}))]
+    jobs = [RemoteJob(None, None, "", files, False, False) for _ in range(4)]
+    try:
+        coordinator.submit(jobs)
+        coordinator.start()
+        assert finished.wait(60)
+    finally:
+        coordinator.stop()
+        for agent in agents:
+            agent.stop()
+    assert [(job.state, job.message) for job in jobs] == [("done", "Flashing completed successfully!")] * 4
+    assert all(job.com_port in ("/dev/fake0", "/dev/fake1") for job in jobs)
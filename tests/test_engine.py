@@ -0,0 +1,285 @@
+import os
+import gzip
+import json
+import hashlib
+import zipfile
+
+import pytest
+
+from backup import BackupStore
+from engine import (
+    RATE_HISTORY_WEIGHT, RATE_SMOOTHING, BundleStage, FlashEngine, RateEstimator, member_pattern, parse_odin_progress,
+)
+from protocol import SimulatedDevice
+
+
+class RecordingEngine(FlashEngine):
+    def __init__(self):
+        self.updates = []
+        self.commands = []
+        super().__init__(lambda progress, operation, remaining: self.updates.append((progress, operation)))
+    
+    def odin_command(self, *args):
+        command = super().odin_command(*args)
+        self.commands.append(command)
+        return command
+
+
+@pytest.mark.parametrize("name, line, matched", [
+    ("boot.img", "Upload Binaries: boot.img", True),
+    ("boot.img", "boot.img 1048576/3145728", True),
+    ("boot.img", "Upload Binaries: BOOT.IMG", True),
+    ("boot.img", "Upload Binaries: vendor_boot.img", False),
+    ("boot.img", "Upload Binaries: boot.img.lz4", False),
+    ("boot.img.lz4", "Upload Binaries: boot.img.lz4", True),
+    ("param.bin", "Upload Binaries: up_param.bin", False),
+    ("system.img", "Upload Binaries: system.img.ext4", False),
+])
+def test_member_pattern(name, line, matched):
+    assert (member_pattern(name).search(line) is not None) == matched
+
+
+@pytest.mark.parametrize("line, fraction", [
+    ("\rboot.img 1048576/4194304", 0.25),
+    ("system.img 50%", 0.5),
+    ("Setup Connection: /dev/ttyACM0", None),
+    ("boot.img 5/0", None),
+])
+def test_parse_odin_progress(line, fraction):
+    assert parse_odin_progress(line) == fraction
+
+
+def test_single_session_flashes_all_files_in_one_run(make_firmware, fake_odin):
+    files = [
+        ("BL File", make_firmware("BL_test.tar", {"sboot.bin": os.urandom(300000)})),
+        ("AP File", make_firmware("AP_test.tar.md5", {"boot.img": os.urandom(1500000), "vendor_boot.img": os.urandom(1500000)})),
+    ]
+    engine = RecordingEngine()
+    engine.odin_path = fake_odin()
+    engine.configure("/dev/fake0", files, False, False, True, True, False)
+    success, message = engine.run()
+    assert success, message
+    assert len(engine.commands) == 1
+    operations = [operation for _, operation in engine.updates]
+    assert "Flashing: AP File (boot.img)" in operations
+    assert "Flashing: AP File (vendor_boot.img)" in operations
+    progress = [progress for progress, operation in engine.updates if operation.startswith("Flashing")]
+    assert progress == sorted(progress)
+
+
+def rate_estimator(tmp_path, history):
+    # ملف بقسمين (a.img، b.img) وترويسات tar حولهما، ثم ملف بلا أقسام معروفة
+    path = tmp_path / "rates.json"
+    path.write_text(json.dumps(history))
+    return RateEstimator([(100, [("a.img", 10, 40), ("b.img", 60, 30)]), (50, [])], history_path=str(path))
+
+
+def test_rate_estimator_seeds_from_history(tmp_path):
+    rates = rate_estimator(tmp_path, {"a.img": 4.0})
+    rates.start_partition(0)
+    assert rates.part == 0
+    assert rates.rate == 4.0
+
+
+def test_rate_estimator_blends_history_into_live_rate(tmp_path):
+    rates = rate_estimator(tmp_path, {"b.img": 1.0})
+    rates.start_partition(0)
+    assert rates.rate is None
+    rates.rate = 10.0
+    rates.update(60)
+    assert rates.part == 1
+    assert rates.rate == pytest.approx(RATE_SMOOTHING * 1.0 + (1 - RATE_SMOOTHING) * 10.0)
+
+
+def test_rate_estimator_time_remaining(tmp_path):
+    rates = rate_estimator(tmp_path, {"b.img": 1.0})
+    rates.start_partition(20)
+    rates.rate = 10.0
+    # a.img: 30 بايت بالسرعة الحالية، b.img: 30 بسرعتها المحفوظة، والباقي (70) بالسرعة الحالية
+    assert rates.time_remaining(20) == pytest.approx(3 + 30 + 7)
+
+
+def test_rate_estimator_saves_measured_rates(tmp_path):
+    rates = rate_estimator(tmp_path, {"a.img": 10.0})
+    rates.measured = {"a.img": 30.0, "b.img": 5.0}
+    rates.save(0)
+    with open(tmp_path / "rates.json") as f:
+        history = json.load(f)
+    assert history == {"a.img": RATE_HISTORY_WEIGHT * 30.0 + (1 - RATE_HISTORY_WEIGHT) * 10.0, "b.img": 5.0}
+
+
+@pytest.fixture
+def bundle(tmp_path, make_firmware):
+    ap = make_firmware("AP_test.tar.md5", {"boot.img": os.urandom(400000), "system.img": os.urandom(600000)})
+    path = str(tmp_path / "firmware.zip")
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.write(ap, "AP_test.tar.md5")
+    with open(ap, "rb") as f:
+        return path, f.read()
+
+
+def test_bundle_stage_shares_one_extraction(tmp_path, bundle):
+    path, data = bundle
+    shm = tmp_path / "shm"
+    shm.mkdir()
+    stage = BundleStage(roots=(str(shm),), share=1.0)
+    first, first_path = stage.acquire(f"{path}!/AP_test.tar.md5")
+    second, second_path = stage.acquire(f"{path}!/AP_test.tar.md5")
+    assert first_path == second_path
+    assert first_path.startswith(str(shm))
+    with open(first_path, "rb") as f:
+        assert f.read() == data
+    
+    # يُحذف عندما تحرره آخر مهمة
+    stage.release(first)
+    assert os.path.exists(first_path)
+    stage.release(second)
+    assert not os.path.exists(first_path)
+    assert stage.used[str(shm)] == 0
+    stage.close()
+    assert os.listdir(shm) == []
+
+
+def test_bundle_stage_respects_tmpfs_share(tmp_path, bundle):
+    path, _ = bundle
+    shm = tmp_path / "shm"
+    shm.mkdir()
+    # حصة صفر: الاستخراج إلى مجلد tmp على القرص وليس tmpfs
+    stage = BundleStage(roots=(str(shm),), share=0)
+    token, staged_path = stage.acquire(f"{path}!/AP_test.tar.md5")
+    assert not staged_path.startswith(str(shm))
+    stage.release(token)
+    stage.close()
+    assert not os.path.exists(os.path.dirname(staged_path))
+
+
+@pytest.mark.parametrize("single_session", [True, False])
+def test_flash_from_bundle(bundle, fake_odin, single_session):
+    path, _ = bundle
+    engine = RecordingEngine()
+    engine.odin_path = fake_odin()
+    engine.configure("/dev/fake0", [("AP File", f"{path}!/AP_test.tar.md5")], False, False, single_session, True, False)
+    success, message = engine.run()
+    assert success, message
+    # odin يقرأ نسخة مستخرجة، وتُحذف بعد التفليش
+    command = engine.commands[0]
+    staged = command[command.index("-a") + 1]
+    assert "!/" not in staged
+    assert not os.path.exists(staged)
+
+
+class StallingEngine(RecordingEngine):
+    def __init__(self, stalls):
+        # أول stalls تشغيلات لـ Odin تكتب AP تتوقف عن الطباعة في منتصف النقل مثل كابل USB متقطع
+        super().__init__()
+        self.stalls = stalls
+        self.stall_timeout = 0.5
+        self.stall_backoff = 0.05
+    
+    def session_command(self):
+        command = super().session_command()
+        return self.stall(command)
+    
+    def odin_command(self, *args):
+        command = super().odin_command(*args)
+        return self.stall(command) if "-a" in args else command
+    
+    def stall(self, command):
+        if "-a" in command and self.stalls:
+            self.stalls -= 1
+            command += ["--fake-fail-probability", "1", "--fake-fail-mode", "stall", "--fake-fail-at", "0.8"]
+        return command
+
+
+def stall_files(make_firmware):
+    return [
+        ("BL File", make_firmware("BL_test.tar", {"sboot.bin": os.urandom(300000)})),
+        ("AP File", make_firmware("AP_test.tar.md5", {"boot.img": os.urandom(1000000), "system.img": os.urandom(3000000)})),
+    ]
+
+
+@pytest.mark.parametrize("single_session", [True, False])
+def test_stall_is_retried(make_firmware, fake_odin, single_session):
+    engine = StallingEngine(1)
+    engine.odin_path = fake_odin()
+    files = stall_files(make_firmware)
+    engine.configure("/dev/fake0", files, False, False, single_session, True, False)
+    success, message = engine.run()
+    assert success, message
+    assert engine.stalled_phase is None
+    assert any(operation.startswith("Odin stalled during transfer (AP File)") for _, operation in engine.updates)
+    # إعادة المحاولة تبدأ من أول ملف لم يكتمل، والتقدم لا يرجع للخلف
+    (_, bl), (_, ap) = files
+    assert ap in engine.commands[-1] and bl not in engine.commands[-1]
+    progress = [progress for progress, _ in engine.updates]
+    assert progress == sorted(progress)
+    assert progress[-1] == 100
+
+
+def test_stall_fails_after_retries(make_firmware, fake_odin):
+    engine = StallingEngine(2)
+    engine.stall_retries = 1
+    engine.odin_path = fake_odin()
+    engine.configure("/dev/fake0", stall_files(make_firmware), False, False, True, True, False)
+    success, message = engine.run()
+    assert not success
+    assert message.startswith("Flashing stalled: no output from Odin for 0.5s during transfer")
+    assert engine.stalled_phase.startswith("transfer")
+    assert engine.interrupted_phase is None
+    assert engine.stalls == 0
+
+
+def native_engine(device):
+    engine = RecordingEngine()
+    engine.backend = "native"
+    engine.transport_factory = lambda com_port: device
+    return engine
+
+
+def test_native_backend_writes_partitions(make_firmware):
+    boot, system, sboot = os.urandom(300000), os.urandom(2500000), os.urandom(20000)
+    files = [
+        ("BL File", make_firmware("BL_test.tar", {"sboot.bin": sboot})),
+        ("AP File", make_firmware("AP_test.tar.md5", {"boot.img": boot, "system.img": system})),
+    ]
+    device = SimulatedDevice()
+    engine = native_engine(device)
+    engine.configure("/dev/sim0", files, True, False, True, True, False)
+    success, message = engine.run()
+    assert success, message
+    assert engine.commands == []
+    assert bytes(device.partitions["BOOTLOADER"]) == sboot
+    assert bytes(device.partitions["BOOT"]) == boot
+    assert bytes(device.partitions["SYSTEM"]) == system
+    assert device.session_ended and device.rebooted
+    progress = [progress for progress, _ in engine.updates]
+    assert progress == sorted(progress)
+
+
+def test_backup_before_native_flash(tmp_path, make_firmware):
+    efs = os.urandom(100000)
+    boot = os.urandom(200000)
+    device = SimulatedDevice()
+    device.partitions["EFS"] = bytearray(efs)
+    engine = native_engine(device)
+    engine.backup_partitions = ("EFS",)
+    engine.backup_store = BackupStore(str(tmp_path / "backups"))
+    engine.configure("/dev/sim0", [("AP File", make_firmware("AP_test.tar.md5", {"boot.img": boot}))], False, False, True, True, False)
+    success, message = engine.run()
+    assert success, message
+    # النسخ والتفليش في جلسة واحدة، فالجهاز لم يرفض مصافحة ثانية
+    assert device.dumps == 1
+    assert bytes(device.partitions["BOOT"]) == boot
+    with gzip.open(engine.backup_store.object_path(hashlib.sha256(efs).hexdigest())) as f:
+        assert f.read() == efs
+
+
+def test_backup_needs_native_backend(make_firmware, fake_odin):
+    engine = RecordingEngine()
+    engine.odin_path = fake_odin()
+    engine.backup_partitions = ("EFS",)
+    engine.configure("/dev/fake0", [("AP File", make_firmware("AP_test.tar", {"boot.img": b"b" * 1000}))], False, False, True, True, False)
+    success, message = engine.run()
+    assert not success
+    assert "native backend" in message
+    assert engine.commands == []
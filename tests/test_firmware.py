@@ -0,0 +1,181 @@
+import os
+import zipfile
+
+import pytest
+
+from firmware import (
+    ArchiveIndex, FirmwareVerifier, firmware_region, firmware_size, open_firmware, pick_bundle_files, read_bundle,
+    split_bundle_path,
+)
+
+
+def corrupt(path, offset):
+    # نفس الحجم، بايت واحد مختلف، ووقت تعديل جديد
+    stat = os.stat(path)
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        value = f.read(1)
+        f.seek(offset)
+        f.write(bytes([value[0] ^ 0xFF]))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+
+
+def test_verify_md5_trailer(make_firmware, tmp_path):
+    path = make_firmware("AP_test.tar.md5", {"boot.img": os.urandom(100000)})
+    verifier = FirmwareVerifier(cache_path=str(tmp_path / "verify.json"))
+    result = verifier.verify(path)
+    assert result["ok"], result["message"]
+    assert verifier.verify(make_firmware("BL_test.tar", {"sboot.bin": b"x"})) is None
+
+
+def test_verify_detects_corrupt_payload(make_firmware, tmp_path):
+    path = make_firmware("AP_test.tar.md5", {"boot.img": os.urandom(100000)})
+    corrupt(path, 50000)
+    result = FirmwareVerifier(cache_path=str(tmp_path / "verify.json")).verify(path)
+    assert not result["ok"]
+    assert result["message"].startswith("MD5 mismatch")
+
+
+def test_verify_without_trailer(make_firmware, tmp_path):
+    path = make_firmware("AP_test.tar", {"boot.img": os.urandom(1000)})
+    os.rename(path, path + ".md5")
+    result = FirmwareVerifier(cache_path=str(tmp_path / "verify.json")).verify(path + ".md5")
+    assert not result["ok"]
+    assert result["message"] == "No MD5 checksum found"
+
+
+def test_verify_cache_is_reused_and_invalidated(make_firmware, tmp_path, monkeypatch):
+    path = make_firmware("AP_test.tar.md5", {"boot.img": os.urandom(100000)})
+    cache_path = str(tmp_path / "verify.json")
+    assert FirmwareVerifier(cache_path=cache_path).verify(path)["ok"]
+    
+    # نسخة جديدة تقرأ النتيجة من ملف الكاش بدون قراءة الملف
+    verifier = FirmwareVerifier(cache_path=cache_path)
+    calls = []
+    hash_file = verifier.hash_file
+    monkeypatch.setattr(verifier, "hash_file", lambda file_path: calls.append(file_path) or hash_file(file_path))
+    assert verifier.verify(path)["ok"]
+    assert calls == []
+    
+    # تغيير الملف يبطل النتيجة المحفوظة
+    corrupt(path, 50000)
+    assert not verifier.verify(path)["ok"]
+    assert calls == [path]
+
+
+def test_content_hash_uses_md5_trailer(make_firmware, tmp_path):
+    verifier = FirmwareVerifier(cache_path=str(tmp_path / "verify.json"))
+    path = make_firmware("AP_test.tar.md5", {"boot.img": os.urandom(1000)})
+    with open(path, "rb") as f:
+        trailer = f.read().rsplit(b"\0", 1)[1]
+    assert verifier.content_hash_future(path).result() == trailer[:32].decode()
+
+
+def test_archive_index_lists_members(make_firmware):
+    boot = b"\x04\x22\x4d\x18" + os.urandom(5000)
+    system = b"\x3a\xff\x26\xed" + os.urandom(7000)
+    path = make_firmware("AP_test.tar.md5", {"boot.img.lz4": boot, "system.img": system, "meta-data/fota.zip": b"PK"})
+    entries = ArchiveIndex().entries(path)
+    assert [(entry.name, entry.size, entry.compression) for entry in entries] == [
+        ("boot.img.lz4", len(boot), "lz4"),
+        ("system.img", len(system), "sparse"),
+        ("meta-data/fota.zip", 2, "raw"),
+    ]
+    with open(path, "rb") as f:
+        f.seek(entries[1].offset)
+        assert f.read(len(system)) == system
+
+
+def test_archive_index_cache(make_firmware, monkeypatch):
+    path = make_firmware("AP_test.tar", {"boot.img": b"a" * 1000})
+    index = ArchiveIndex()
+    assert [entry.name for entry in index.entries(path)] == ["boot.img"]
+    
+    calls = []
+    read_entries = index.read_entries
+    monkeypatch.setattr(index, "read_entries", lambda file_path: calls.append(file_path) or read_entries(file_path))
+    index.entries(path)
+    assert calls == []
+    
+    # ملف جديد بنفس المسار يُقرأ من جديد
+    os.remove(path)
+    make_firmware("AP_test.tar", {"boot.img": b"a" * 1000, "recovery.img": b"b" * 10})
+    assert [entry.name for entry in index.entries(path)] == ["boot.img", "recovery.img"]
+    assert calls == [path]
+
+
+def test_archive_index_rejects_non_tar(tmp_path):
+    path = tmp_path / "boot.img"
+    path.write_bytes(os.urandom(4096))
+    assert ArchiveIndex().entries(str(path)) is None
+    assert ArchiveIndex().entries(str(tmp_path / "missing.tar")) is None
+
+
+@pytest.fixture
+def bundle(tmp_path, make_firmware):
+    # حزمة Samsung: BL مخزن بلا ضغط، وAP وCSC مضغوطان
+    members = {
+        "BL_test.tar": make_firmware("BL_test.tar", {"sboot.bin": os.urandom(20000)}),
+        "AP_test.tar.md5": make_firmware("AP_test.tar.md5", {"boot.img": os.urandom(50000)}),
+        "CSC_test.tar.md5": make_firmware("CSC_test.tar.md5", {"cache.img": b"c" * 30000}),
+        "HOME_CSC_test.tar.md5": make_firmware("HOME_CSC_test.tar.md5", {"cache.img": b"h" * 30000}),
+    }
+    path = str(tmp_path / "firmware.zip")
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, member_path in members.items():
+            archive.write(member_path, f"SM-X/{name}", zipfile.ZIP_STORED if name.startswith("BL_") else zipfile.ZIP_DEFLATED)
+    return path, members
+
+
+@pytest.mark.parametrize("file_path, parts", [
+    ("/fw/firmware.zip!/SM-X/AP_test.tar.md5", ("/fw/firmware.zip", "SM-X/AP_test.tar.md5")),
+    ("/fw/AP_test.tar.md5", ("/fw/AP_test.tar.md5", None)),
+    ("C:\\fw\\firmware.zip!/AP_test.tar", ("C:\\fw\\firmware.zip", "AP_test.tar")),
+])
+def test_split_bundle_path(file_path, parts):
+    assert split_bundle_path(file_path) == parts
+
+
+def test_read_bundle(bundle):
+    path, _ = bundle
+    slots = read_bundle(path)
+    assert slots["BL File"] == [f"{path}!/SM-X/BL_test.tar"]
+    assert sorted(slots["CSC File"]) == [f"{path}!/SM-X/CSC_test.tar.md5", f"{path}!/SM-X/HOME_CSC_test.tar.md5"]
+    files = dict(pick_bundle_files(slots))
+    assert list(files) == ["BL File", "AP File", "CSC File"]
+    assert files["CSC File"].endswith("HOME_CSC_test.tar.md5")
+    assert dict(pick_bundle_files(slots, clean_csc=True))["CSC File"].endswith("!/SM-X/CSC_test.tar.md5")
+
+
+def test_read_bundle_rejects_bad_zip(tmp_path):
+    path = tmp_path / "firmware.zip"
+    path.write_bytes(b"not a zip")
+    with pytest.raises(OSError):
+        read_bundle(str(path))
+
+
+@pytest.mark.parametrize("name", ["BL_test.tar", "AP_test.tar.md5"])
+def test_open_bundle_member(bundle, name):
+    path, members = bundle
+    member_path = f"{path}!/SM-X/{name}"
+    with open(members[name], "rb") as f:
+        data = f.read()
+    assert firmware_size(member_path) == len(data)
+    with open_firmware(member_path) as f:
+        assert f.read() == data
+    # عضو مخزن بلا ضغط يُقرأ من مكانه في ملف zip
+    region = firmware_region(member_path)
+    if name.startswith("BL_"):
+        with open(region[0], "rb") as f:
+            f.seek(region[1])
+            assert f.read(len(data)) == data
+    else:
+        assert region is None
+
+
+def test_bundle_members_verify_and_index(bundle, tmp_path):
+    path, _ = bundle
+    verifier = FirmwareVerifier(cache_path=str(tmp_path / "verify.json"))
+    assert verifier.verify(f"{path}!/SM-X/AP_test.tar.md5")["ok"]
+    assert [entry.name for entry in ArchiveIndex().entries(f"{path}!/SM-X/BL_test.tar")] == ["sboot.bin"]
+    assert ArchiveIndex().entries(f"{path}!/SM-X/AP_test.tar.md5") is None
@@ -0,0 +1,62 @@
+import os
+
+import engine
+from engine import FlashEngine
+from ledger import FlashLedger
+
+SERIAL_ID = "usb:04E8:685D:R58M1234ABC"
+
+
+def test_ledger_record_and_forget(tmp_path):
+    ledger = FlashLedger(str(tmp_path / "ledger.json"))
+    ledger.record(SERIAL_ID, "AP File", "a" * 32, "/firmware/AP_test.tar.md5")
+    ledger.record(SERIAL_ID, "BL File", "b" * 32, "/firmware/BL_test.tar")
+    assert ledger.written(SERIAL_ID, "AP File", "a" * 32)
+    assert not ledger.written(SERIAL_ID, "AP File", "c" * 32)
+    assert not ledger.written("usb:04E8:685D:OTHER", "AP File", "a" * 32)
+    assert ledger.slots(SERIAL_ID)["AP File"]["file"] == "AP_test.tar.md5"
+    
+    ledger.forget(SERIAL_ID, ["AP File"])
+    assert list(ledger.slots(SERIAL_ID)) == ["BL File"]
+    ledger.clear(SERIAL_ID)
+    assert ledger.load() == {}
+
+
+def flash(tmp_path, fake_odin, files, resume):
+    flash_engine = FlashEngine()
+    flash_engine.odin_path = fake_odin()
+    flash_engine.flash_ledger = FlashLedger(str(tmp_path / "ledger.json"))
+    flash_engine.configure("/dev/fake0", files, False, False, True, True, resume)
+    success, message = flash_engine.run()
+    assert success, message
+    return flash_engine, message
+
+
+def firmware_files(make_firmware, ap_data):
+    return [
+        ("BL File", make_firmware("BL_test.tar", {"sboot.bin": b"s" * 20000})),
+        ("AP File", make_firmware("AP_test.tar.md5", {"boot.img": ap_data})),
+    ]
+
+
+def test_resume_skips_written_files(tmp_path, make_firmware, fake_odin, monkeypatch):
+    monkeypatch.setattr(engine, "device_identity", lambda com_port: SERIAL_ID)
+    flash(tmp_path, fake_odin, firmware_files(make_firmware, os.urandom(50000)), False)
+    
+    # نفس BL وAP مختلف: الاستكمال يرسل AP فقط
+    flash_engine, _ = flash(tmp_path, fake_odin, firmware_files(make_firmware, os.urandom(50000)), True)
+    assert [label for label, _ in flash_engine.files_to_flash] == ["AP File"]
+    
+    flash_engine, message = flash(tmp_path, fake_odin, firmware_files(make_firmware, os.urandom(50000))[:1], True)
+    assert flash_engine.files_to_flash == []
+    assert message == "All partitions are already written on this device, nothing to flash."
+
+
+def test_resume_needs_a_serial_number(tmp_path, make_firmware, fake_odin, monkeypatch):
+    # بدون رقم تسلسلي قد يكون هاتفاً آخر على نفس المنفذ
+    monkeypatch.setattr(engine, "device_identity", lambda com_port: "port:/dev/fake0")
+    files = firmware_files(make_firmware, os.urandom(50000))
+    flash(tmp_path, fake_odin, files, False)
+    flash_engine, _ = flash(tmp_path, fake_odin, files, True)
+    assert [label for label, _ in flash_engine.files_to_flash] == ["BL File", "AP File"]
+    assert FlashLedger(str(tmp_path / "ledger.json")).load() == {}
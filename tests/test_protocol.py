@@ -0,0 +1,120 @@
+import os
+import struct
+
+import pytest
+
+from protocol import (
+    FILE_PACKET, FILE_PART_RESPONSE, LARGE_FILE_PART_SIZE, RESPONSE, SIMULATED_PARTITIONS, DownloadSession, ProtocolError,
+    SimulatedDevice, find_pit_entry, parse_pit,
+)
+
+
+def open_session(device, total_bytes=0):
+    device.open()
+    session = DownloadSession(device)
+    session.handshake()
+    session.begin(total_bytes)
+    return session
+
+
+def test_handshake_and_begin():
+    device = SimulatedDevice()
+    session = open_session(device, 12345)
+    assert device.handshaken
+    assert session.part_size == LARGE_FILE_PART_SIZE
+    assert device.part_size == LARGE_FILE_PART_SIZE
+    assert device.total_bytes == 12345
+
+
+def test_bad_handshake_is_rejected():
+    class Silent(SimulatedDevice):
+        def send(self, data):
+            self.responses.append(b"NOPE")
+    
+    with pytest.raises(ProtocolError):
+        DownloadSession(Silent()).handshake()
+
+
+def test_read_pit():
+    device = SimulatedDevice()
+    session = open_session(device)
+    entries = parse_pit(session.read_pit())
+    assert [(entry.partition_name, entry.flash_filename, entry.binary_type) for entry in entries] == list(SIMULATED_PARTITIONS)
+    assert find_pit_entry(entries, "AP/boot.img").partition_name == "BOOT"
+    assert find_pit_entry(entries, "param.bin").partition_name == "PARAM"
+
+
+@pytest.mark.parametrize("file_name, partition", [("boot.img", "BOOT"), ("modem.bin", "RADIO")])
+def test_flash_round_trip(file_name, partition):
+    # أكثر من جزء، والجزء الأخير ناقص فيُكمل بالأصفار ويُقص عند الكتابة
+    data = os.urandom(2 * LARGE_FILE_PART_SIZE + 12345)
+    device = SimulatedDevice()
+    session = open_session(device, len(data))
+    entry = find_pit_entry(parse_pit(session.read_pit()), file_name)
+    progress = []
+    session.flash(memoryview(data), entry, progress.append)
+    session.end(reboot=True)
+    assert bytes(device.partitions[partition]) == data
+    assert device.written[partition] == len(data)
+    assert progress[-1] == len(data)
+    assert device.session_ended and device.rebooted
+
+
+def test_dump_round_trip():
+    efs = os.urandom(3 * 1000 + 17)
+    device = SimulatedDevice()
+    device.partitions["EFS"] = bytearray(efs)
+    session = open_session(device)
+    entry = find_pit_entry(parse_pit(session.read_pit()), "efs.img")
+    dumped = bytearray()
+    assert session.dump(entry, dumped.extend) == len(efs)
+    assert bytes(dumped) == efs
+
+
+def test_dump_refused():
+    device = SimulatedDevice()
+    session = open_session(device)
+    entry = find_pit_entry(parse_pit(session.read_pit()), "efs.img")
+    with pytest.raises(ProtocolError):
+        session.dump(entry, bytearray().extend)
+
+
+def test_flash_continues_session_without_second_handshake():
+    # مثل النسخ الاحتياطي: قراءة PIT أولاً، ثم التفليش في نفس الجلسة
+    data = os.urandom(LARGE_FILE_PART_SIZE + 1)
+    device = SimulatedDevice()
+    session = open_session(device)
+    entry = find_pit_entry(parse_pit(session.read_pit()), "boot.img")
+    session.send_total_bytes(len(data))
+    session.flash(memoryview(data), entry)
+    session.end()
+    assert bytes(device.partitions["BOOT"]) == data
+    assert device.total_bytes == len(data)
+
+
+def test_second_handshake_is_rejected_after_session_end():
+    device = SimulatedDevice()
+    session = open_session(device)
+    session.end()
+    device.close()
+    device.open()
+    with pytest.raises(ProtocolError):
+        session.handshake()
+
+
+def test_file_parts_are_acknowledged_with_part_response():
+    device = SimulatedDevice()
+    session = open_session(device)
+    entry = find_pit_entry(parse_pit(session.read_pit()), "boot.img")
+    responses = []
+    receive = device.receive
+    
+    def record(size):
+        response = receive(size)
+        if size == RESPONSE.size:
+            responses.append(struct.unpack("<ii", response))
+        return response
+    
+    device.receive = record
+    session.flash(memoryview(bytes(LARGE_FILE_PART_SIZE * 2)), entry)
+    assert [(FILE_PART_RESPONSE, 0), (FILE_PART_RESPONSE, 1)] == [r for r in responses if r[0] != FILE_PACKET]
@@ -0,0 +1,105 @@
+import json
+import asyncio
+
+import pytest
+
+from firmware import get_writer_executor
+from scheduler import CONTROLLER_TRANSFER_LIMIT, HUB_TRANSFER_LIMIT, MIN_SAMPLE_BYTES, TransferScheduler
+
+
+class Topology:
+    def __init__(self, branches):
+        self.branches = branches
+    
+    def branch(self, com_port):
+        return self.branches.get(com_port, ())
+
+
+HUB = ("usb1", "1-1")
+OTHER_HUB = ("usb1", "1-2")
+
+
+def scheduler(tmp_path, branches, rates=None):
+    path = tmp_path / "branch_rates.json"
+    if rates is not None:
+        path.write_text(json.dumps(rates))
+    return TransferScheduler(Topology(branches), str(path))
+
+
+def test_default_limits(tmp_path):
+    transfers = scheduler(tmp_path, {})
+    assert transfers.limit("usb1") == CONTROLLER_TRANSFER_LIMIT
+    assert transfers.limit("1-1") == HUB_TRANSFER_LIMIT
+
+
+@pytest.mark.parametrize("rates, limit", [
+    # مجموع السرعة 10، 20، 21: الجهاز الثالث لا يضيف 15%
+    ({"1": 10.0, "2": 10.0, "3": 7.0}, 2),
+    # ما زال يتحسن عند أعلى تزامن مقاس، فنجرب جهازاً آخر
+    ({"1": 10.0, "2": 9.5, "3": 9.0}, 4),
+])
+def test_limit_from_measured_rates(tmp_path, rates, limit):
+    assert scheduler(tmp_path, {}, {"1-1": rates}).limit("1-1") == limit
+
+
+def test_acquire_waits_for_room_on_the_hub(tmp_path):
+    transfers = scheduler(tmp_path, {"a": HUB, "b": HUB, "c": HUB, "d": OTHER_HUB})
+    
+    async def run():
+        first = await transfers.acquire("a", 100)
+        await transfers.acquire("b", 100)
+        waiting = asyncio.ensure_future(transfers.acquire("c", 100))
+        # فرع آخر على نفس المتحكم لا ينتظر
+        await asyncio.wait_for(transfers.acquire("d", 100), 1)
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        assert transfers.load("1-1").count == 2
+        transfers.release(first, 0)
+        third = await asyncio.wait_for(waiting, 1)
+        assert third.com_port == "c"
+        assert transfers.load("1-1").count == 2
+        assert transfers.load("usb1").count == 3
+    
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_leaves_the_queue(tmp_path):
+    transfers = scheduler(tmp_path, {"a": HUB, "b": HUB, "c": HUB})
+    
+    async def run():
+        first = await transfers.acquire("a", 100)
+        await transfers.acquire("b", 100)
+        waiting = asyncio.ensure_future(transfers.acquire("c", 100))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert transfers.waiters == []
+        transfers.release(first, 0)
+        assert transfers.load("1-1").count == 1
+    
+    asyncio.run(run())
+
+
+def test_release_records_branch_rates(tmp_path):
+    transfers = scheduler(tmp_path, {"a": HUB})
+    
+    async def run():
+        slot = await transfers.acquire("a", MIN_SAMPLE_BYTES)
+        await asyncio.sleep(0.05)
+        transfers.release(slot, MIN_SAMPLE_BYTES)
+    
+    asyncio.run(run())
+    get_writer_executor().submit(lambda: None).result()
+    with open(tmp_path / "branch_rates.json") as f:
+        history = json.load(f)
+    assert set(history) == {"usb1", "1-1"}
+    assert list(history["1-1"]) == ["1"]
+    assert 0 < history["1-1"]["1"] < MIN_SAMPLE_BYTES / 0.05
+
+
+def test_order_spreads_devices_over_hubs(tmp_path):
+    transfers = scheduler(tmp_path, {"a1": HUB, "a2": HUB, "a3": HUB, "b1": OTHER_HUB})
+    requests = [("a1", 300), ("a2", 200), ("a3", 100), ("b1", 50)]
+    # أول موجة: جهازان من الـ hub الأول وجهاز الـ hub الثاني، الأطول أولاً
+    assert transfers.order(requests) == [0, 1, 3, 2]
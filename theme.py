@@ -0,0 +1,176 @@
+# ورقة أنماط واحدة تُطبق على مستوى التطبيق مرة واحدة بدلاً من ورقة لكل عنصر.
+# الحالات المتغيرة (زر أساسي، تمييز الحقل، لون الحالة) تعتمد على خصائص ديناميكية.
+APP_STYLESHEET = """
+    QMainWindow, QWidget {
+        background-color: #1E1E1E;
+        color: #FFFFFF;
+        font-family: 'Segoe UI', 'Arial', sans-serif;
+    }
+    QLabel {
+        color: #CCCCCC;
+    }
+    QLabel#logo {
+        font-size: 28px;
+        font-weight: bold;
+        color: #0078D7;
+    }
+    QLabel#title {
+        font-size: 22px;
+        font-weight: bold;
+        color: #CCCCCC;
+    }
+    QLabel#contents {
+        color: #888888;
+    }
+    QLabel[state="ok"] {
+        color: #55FF55;
+    }
+    QLabel[state="error"] {
+        color: #FF5555;
+    }
+    QGroupBox {
+        border: 1px solid #555555;
+        border-radius: 5px;
+        margin-top: 1ex;
+        padding-top: 10px;
+    }
+    QGroupBox::title {
+        subcontrol-origin: margin;
+        subcontrol-position: top center;
+        padding: 0 5px;
+        color: #0078D7;
+    }
+    QTabWidget::pane {
+        border: 1px solid #555555;
+        border-radius: 5px;
+    }
+    QTabBar::tab {
+        background-color: #2D2D2D;
+        color: #CCCCCC;
+        padding: 8px 16px;
+        border: 1px solid #555555;
+        border-bottom: none;
+        border-top-left-radius: 4px;
+        border-top-right-radius: 4px;
+    }
+    QTabBar::tab:selected {
+        background-color: #3D3D3D;
+        color: #FFFFFF;
+        border-bottom: none;
+    }
+    QTabBar::tab:hover:!selected {
+        background-color: #353535;
+    }
+    QComboBox {
+        border: 1px solid #555555;
+        border-radius: 5px;
+        padding: 5px 10px;
+        background-color: #2A2A2A;
+        color: white;
+        min-height: 25px;
+    }
+    QComboBox::drop-down {
+        subcontrol-origin: padding;
+        subcontrol-position: top right;
+        width: 15px;
+        border-left: 1px solid #555555;
+    }
+    QCheckBox {
+        spacing: 5px;
+    }
+    QCheckBox::indicator {
+        width: 18px;
+        height: 18px;
+    }
+    QCheckBox::indicator:unchecked {
+        border: 1px solid #555555;
+        background-color: #2A2A2A;
+        border-radius: 3px;
+    }
+    QCheckBox::indicator:checked {
+        border: 1px solid #0078D7;
+        background-color: #0078D7;
+        border-radius: 3px;
+    }
+    QStatusBar {
+        background-color: #2A2A2A;
+        color: #AAAAAA;
+    }
+    QMenuBar {
+        background-color: #2A2A2A;
+        color: white;
+    }
+    QMenuBar::item:selected {
+        background-color: #0078D7;
+    }
+    QProgressBar {
+        border: 1px solid #555;
+        border-radius: 10px;
+        background-color: #2E2E2E;
+        color: white;
+        text-align: center;
+    }
+    QProgressBar::chunk {
+        background-color: qlineargradient(x1:0, y1:0, x2:1, y2:0, stop:0 #0078D7, stop:1 #00AEFF);
+        border-radius: 10px;
+    }
+    QPushButton {
+        background-color: #3A3A3A;
+        color: white;
+        border: 1px solid #555555;
+        border-radius: 5px;
+        padding: 8px 16px;
+    }
+    QPushButton:hover {
+        background-color: #454545;
+        border: 1px solid #666666;
+    }
+    QPushButton:pressed {
+        background-color: #2A2A2A;
+    }
+    QPushButton:disabled {
+        background-color: #2A2A2A;
+        color: #555555;
+        border: 1px solid #444444;
+    }
+    QPushButton[primary="true"] {
+        background-color: #0078D7;
+        color: white;
+        border: none;
+        font-weight: bold;
+    }
+    QPushButton[primary="true"]:hover {
+        background-color: #0086F0;
+    }
+    QPushButton[primary="true"]:pressed {
+        background-color: #005FA3;
+    }
+    QPushButton[primary="true"]:disabled {
+        background-color: #555555;
+        color: #999999;
+    }
+    QLineEdit {
+        border: 1px solid #555;
+        border-radius: 5px;
+        padding: 8px;
+        background-color: #2A2A2A;
+        color: white;
+    }
+    QLineEdit:focus {
+        border: 1px solid #0078D7;
+    }
+    QLineEdit[highlight="true"] {
+        border: 1px solid #00AA00;
+    }
+"""
+
+
+def apply_theme(app):
+    app.setStyleSheet(APP_STYLESHEET)
+
+
+def set_style_state(widget, name, value):
+    # إعادة تلميع العنصر فقط بعد تغيير الخاصية بدلاً من تحليل ورقة أنماط جديدة
+    widget.setProperty(name, value)
+    widget.style().unpolish(widget)
+    widget.style().polish(widget)